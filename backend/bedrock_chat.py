@@ -1,19 +1,83 @@
 """
 Bedrock チャット機能
 Amazon Bedrock Claude 3を使用したチャット機能
+
+boto3 の呼び出しはブロッキングのため、上限付きのスレッドプールで実行してイベントループを止めない
+ストリーミング応答（invoke_model_with_response_stream）はチャンクの受信ごとにスレッドプールで読み進め、
+ユーザーごとの同時実行数は BEDROCK_MAX_CONCURRENT_PER_USER で制限する（超過時は429）
+同時実行枠は BEDROCK_SLOT_TIMEOUT_SECONDS を過ぎると解放漏れとみなして回収し、ストリームもそこで打ち切る
 """
 
+import asyncio
 import boto3
+import functools
 import json
 import logging
-from typing import Dict, List, Optional
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
 from fastapi import HTTPException
 from datetime import datetime
+from .utils.metrics import registry
+from .services.chat_context_service import compact_history
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# boto3呼び出し用スレッド数（プロセス全体の同時呼び出し上限）
+BEDROCK_MAX_WORKERS = int(os.getenv("BEDROCK_MAX_WORKERS", 8))
+# 1ユーザーあたりの同時チャット数
+BEDROCK_MAX_CONCURRENT_PER_USER = int(os.getenv("BEDROCK_MAX_CONCURRENT_PER_USER", 2))
+# 1チャットが同時実行枠を保持できる最大秒数
+BEDROCK_SLOT_TIMEOUT_SECONDS = float(os.getenv("BEDROCK_SLOT_TIMEOUT_SECONDS", 300))
+# ローカルスタブを使う（AWSに接続しない）
+BEDROCK_STUB = os.getenv("BEDROCK_STUB", "false").lower() in ("1", "true", "yes")
+
+CHAT_REQUESTS = registry.counter("bedrock_chat_requests_total", "Chat requests by mode and outcome")
+CHAT_INFLIGHT = {"count": 0}
+registry.gauge("bedrock_chat_inflight", "Chats currently running", lambda: [({}, CHAT_INFLIGHT["count"])])
+
+BASE_SYSTEM_PROMPT = """あなたは金融アドバイザーのアシスタントです。
+顧客の資産管理や投資に関する質問に、専門的で親切に回答してください。
+
+以下の点を心がけてください：
+- 正確で実用的な情報を提供する
+- リスクについて適切に説明する
+- 個別の投資アドバイスではなく、一般的な情報として回答する
+- 日本語で回答する
+- 専門用語は分かりやすく説明する"""
+
+class UserSlot:
+    """ユーザーごとの同時実行枠（release は複数回呼んでも1回だけ解放）"""
+
+    def __init__(self, service: "BedrockChatService", user_id: str):
+        self.service = service
+        self.user_id = user_id
+        self.started = time.monotonic()
+        self.released = False
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.started > BEDROCK_SLOT_TIMEOUT_SECONDS
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        CHAT_INFLIGHT["count"] -= 1
+        slots = self.service.active_users[self.user_id]
+        slots.remove(self)
+        if not slots:
+            del self.service.active_users[self.user_id]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
 class BedrockChatService:
     def __init__(self, region_name: str = "us-east-1"):
         """
@@ -22,11 +86,19 @@ class BedrockChatService:
         self.region_name = region_name
         self.bedrock_client = None
         self.model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
+        self.executor = ThreadPoolExecutor(max_workers=BEDROCK_MAX_WORKERS, thread_name_prefix="bedrock")
+        self.active_users: Dict[str, List[UserSlot]] = {}
         
     def _get_bedrock_client(self):
         """Bedrockクライアントを取得"""
         if not self.bedrock_client:
             try:
+                if BEDROCK_STUB:
+                    from .bedrock_stub import StubBedrockClient
+
+                    self.bedrock_client = StubBedrockClient()
+                    logger.info("Bedrock stub client initialized")
+                    return self.bedrock_client
                 self.bedrock_client = boto3.client(
                     service_name='bedrock-runtime',
                     region_name=self.region_name
@@ -36,20 +108,35 @@ class BedrockChatService:
                 logger.error(f"Failed to initialize Bedrock client: {e}")
                 raise HTTPException(status_code=500, detail="Bedrock client initialization failed")
         return self.bedrock_client
-    
-    def _prepare_system_prompt(self, customer_context: Optional[Dict] = None) -> str:
-        """システムプロンプトを準備"""
-        base_prompt = """あなたは金融アドバイザーのアシスタントです。
-顧客の資産管理や投資に関する質問に、専門的で親切に回答してください。
 
-以下の点を心がけてください：
-- 正確で実用的な情報を提供する
-- リスクについて適切に説明する
-- 個別の投資アドバイスではなく、一般的な情報として回答する
-- 日本語で回答する
-- 専門用語は分かりやすく説明する"""
+    async def _run(self, func, *args, **kwargs):
+        """ブロッキング呼び出しをスレッドプールで実行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def reserve(self, user_id: str) -> UserSlot:
+        """ユーザーの同時実行枠を確保（上限超過時は429）"""
+        for slot in [slot for slot in self.active_users.get(user_id, []) if slot.expired]:
+            logger.warning(f"Reclaiming chat slot held for over {BEDROCK_SLOT_TIMEOUT_SECONDS}s (user: {user_id})")
+            slot.release()
+        if len(self.active_users.get(user_id, [])) >= BEDROCK_MAX_CONCURRENT_PER_USER:
+            CHAT_REQUESTS.inc(mode="any", outcome="rejected")
+            raise HTTPException(
+                status_code=429,
+                detail=f"同時に実行できるチャットは{BEDROCK_MAX_CONCURRENT_PER_USER}件までです"
+            )
+        slot = UserSlot(self, user_id)
+        self.active_users.setdefault(user_id, []).append(slot)
+        CHAT_INFLIGHT["count"] += 1
+        return slot
+    
+    def _prepare_system_prompt(self, customer_context: Optional[Dict] = None, history_summary: Optional[str] = None) -> str:
+        """システムプロンプトを準備（顧客コンテキストは chat_context_service で整形済みのものを使う）"""
+        base_prompt = BASE_SYSTEM_PROMPT
 
-        if customer_context:
+        if customer_context and customer_context.get("context_block"):
+            base_prompt += "\n\n" + customer_context["context_block"]
+        elif customer_context:
             context_info = f"""
 
 現在の顧客情報：
@@ -61,64 +148,83 @@ class BedrockChatService:
 
 この顧客情報を参考にして、より個別化された回答を提供してください。"""
             base_prompt += context_info
+
+        if history_summary:
+            base_prompt += "\n\nこれまでの会話の要約：\n" + history_summary
             
         return base_prompt
     
+    def _build_request_body(
+        self,
+        message: str,
+        conversation_history: List[Dict] = None,
+        customer_context: Optional[Dict] = None
+    ) -> str:
+        """Bedrock APIリクエストボディを構築"""
+        # 直近の履歴はトークン予算内でそのまま送り、それより古いやり取りは要約してシステムプロンプトへ
+        recent_history, history_summary = compact_history(conversation_history)
+        
+        # システムプロンプトを準備
+        system_prompt = self._prepare_system_prompt(customer_context, history_summary)
+        
+        # 会話履歴を構築
+        messages = []
+        
+        if recent_history:
+            for item in recent_history:
+                messages.append({
+                    "role": "user",
+                    "content": item.get("user_message", "")
+                })
+                messages.append({
+                    "role": "assistant", 
+                    "content": item.get("assistant_message", "")
+                })
+        
+        # 現在のメッセージを追加
+        messages.append({
+            "role": "user",
+            "content": message
+        })
+        
+        return json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1000,
+            "system": system_prompt,
+            "messages": messages,
+            "temperature": 0.7,
+            "top_p": 0.9
+        })
+    
     async def chat(
         self, 
         message: str, 
         conversation_history: List[Dict] = None,
-        customer_context: Optional[Dict] = None
+        customer_context: Optional[Dict] = None,
+        user_id: str = "anonymous"
     ) -> Dict:
         """
         Bedrockを使用してチャット応答を生成
         """
+        with self.reserve(user_id):
+            return await self._chat(message, conversation_history, customer_context)
+
+    async def _chat(self, message: str, conversation_history: List[Dict], customer_context: Optional[Dict]) -> Dict:
         try:
             client = self._get_bedrock_client()
+            request_body = self._build_request_body(message, conversation_history, customer_context)
             
-            # システムプロンプトを準備
-            system_prompt = self._prepare_system_prompt(customer_context)
-            
-            # 会話履歴を構築
-            messages = []
-            
-            if conversation_history:
-                for item in conversation_history[-10:]:  # 最新10件のみ
-                    messages.append({
-                        "role": "user",
-                        "content": item.get("user_message", "")
-                    })
-                    messages.append({
-                        "role": "assistant", 
-                        "content": item.get("assistant_message", "")
-                    })
-            
-            # 現在のメッセージを追加
-            messages.append({
-                "role": "user",
-                "content": message
-            })
-            
-            # Bedrock APIリクエストボディを構築
-            request_body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "system": system_prompt,
-                "messages": messages,
-                "temperature": 0.7,
-                "top_p": 0.9
-            }
-            
-            # Bedrock APIを呼び出し
-            response = client.invoke_model(
+            # Bedrock APIを呼び出し（応答本文の読み込みもブロッキングのためスレッドプールで実行）
+            response = await self._run(
+                client.invoke_model,
                 modelId=self.model_id,
-                body=json.dumps(request_body),
+                body=request_body,
                 contentType='application/json',
                 accept='application/json'
             )
             
             # レスポンスを解析
-            response_body = json.loads(response['body'].read())
+            response_body = json.loads(await self._run(response['body'].read))
             assistant_message = response_body['content'][0]['text']
             
             # 使用量情報を取得
@@ -135,14 +241,78 @@ class BedrockChatService:
             }
             
             logger.info(f"Chat response generated successfully. Tokens used: {usage}")
+            CHAT_REQUESTS.inc(mode="sync", outcome="success")
             return result
             
         except Exception as e:
             logger.error(f"Error in chat generation: {e}")
+            CHAT_REQUESTS.inc(mode="sync", outcome="error")
             raise HTTPException(
                 status_code=500, 
                 detail=f"チャット応答の生成に失敗しました: {str(e)}"
             )
 
+    async def chat_stream(
+        self,
+        slot: UserSlot,
+        message: str,
+        conversation_history: List[Dict] = None,
+        customer_context: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        ストリーミングでチャット応答を生成（テキストの差分ごとにイベントを返す）
+
+        同時実行枠は呼び出し側が応答開始前に reserve() で確保して渡す（上限超過の429を応答開始前に返すため）。
+        本文が1度も読まれない場合はこのジェネレーターの終了処理が動かないため、呼び出し側でも送信終了時に解放する
+        """
+        stream = None
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        try:
+            client = self._get_bedrock_client()
+            response = await self._run(
+                client.invoke_model_with_response_stream,
+                modelId=self.model_id,
+                body=self._build_request_body(message, conversation_history, customer_context),
+                contentType='application/json',
+                accept='application/json'
+            )
+            stream = response['body']
+            events = iter(stream)
+            while True:
+                # 次のチャンクの受信待ちだけをスレッドで行い、チャンク間はスレッドを占有しない
+                event = await self._run(next, events, None)
+                if event is None:
+                    break
+                if slot.expired:
+                    raise TimeoutError(f"応答が{BEDROCK_SLOT_TIMEOUT_SECONDS:.0f}秒以内に完了しませんでした")
+                if 'chunk' not in event:
+                    continue
+                chunk = json.loads(event['chunk']['bytes'])
+                if chunk['type'] == 'message_start':
+                    usage["input_tokens"] = chunk['message'].get('usage', {}).get('input_tokens', 0)
+                elif chunk['type'] == 'content_block_delta' and chunk['delta'].get('type') == 'text_delta':
+                    yield {"type": "delta", "text": chunk['delta']['text']}
+                elif chunk['type'] == 'message_delta':
+                    usage["output_tokens"] = chunk.get('usage', {}).get('output_tokens', 0)
+
+            logger.info(f"Chat stream completed successfully. Tokens used: {usage}")
+            CHAT_REQUESTS.inc(mode="stream", outcome="success")
+            yield {
+                "type": "done",
+                "timestamp": datetime.now().isoformat(),
+                "model": self.model_id,
+                "usage": usage
+            }
+        except Exception as e:
+            # 応答開始後はHTTPステータスを変えられないため、エラーイベントとして返す
+            logger.error(f"Error in chat stream: {e}")
+            CHAT_REQUESTS.inc(mode="stream", outcome="error")
+            yield {"type": "error", "detail": f"チャット応答の生成に失敗しました: {str(e)}"}
+        finally:
+            # クライアント切断時も上流のストリームを閉じて枠を解放する
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+            slot.release()
+
 # グローバルインスタンス
 bedrock_chat_service = BedrockChatService()
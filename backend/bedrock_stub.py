@@ -0,0 +1,82 @@
+"""
+Bedrock ローカルスタブ
+bedrock-runtime クライアントの invoke_model / invoke_model_with_response_stream と同じ形の応答を返す
+（BEDROCK_STUB=true でチャットサービスがこちらを使う。AWSに接続せずに動作確認・負荷試験を行うため）
+
+BEDROCK_STUB_DELAY_MS を指定するとトークンごとに同期的に待機し、実際のAPI呼び出しのような
+ブロッキングを再現する（イベントループを止めていないかの確認用）
+"""
+
+import io
+import json
+import os
+import time
+from typing import Dict, Iterator, List
+
+STUB_DELAY_MS = float(os.getenv("BEDROCK_STUB_DELAY_MS", 20))
+
+def _reply_tokens(body: Dict) -> List[str]:
+    """最後のユーザーメッセージを引用した定型の応答をトークン（語）単位で返す"""
+    message = body["messages"][-1]["content"] if body.get("messages") else ""
+    text = f"（スタブ応答）ご質問「{message[:50]}」について、一般的な情報としてお答えします。"
+    return [text[index:index + 4] for index in range(0, len(text), 4)]
+
+def _usage(body: Dict, tokens: List[str]) -> Dict:
+    prompt = body.get("system", "") + "".join(message["content"] for message in body.get("messages", []))
+    return {"input_tokens": len(prompt) // 2, "output_tokens": len(tokens)}
+
+class StubEventStream:
+    """botocore の EventStream と同様に {'chunk': {'bytes': ...}} を順に返す"""
+
+    def __init__(self, events: List[Dict], delay: float):
+        self._events = events
+        self._delay = delay
+        self.closed = False
+
+    def __iter__(self) -> Iterator[Dict]:
+        for event in self._events:
+            if self.closed:
+                return
+            if event["type"] == "content_block_delta":
+                time.sleep(self._delay)
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+
+    def close(self) -> None:
+        self.closed = True
+
+class StubBedrockClient:
+    """bedrock-runtime クライアントのスタブ"""
+
+    def __init__(self, delay_ms: float = STUB_DELAY_MS):
+        self.delay = delay_ms / 1000
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> Dict:
+        request = json.loads(body)
+        tokens = _reply_tokens(request)
+        time.sleep(self.delay * len(tokens))
+        payload = {
+            "id": "stub",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": [{"type": "text", "text": "".join(tokens)}],
+            "stop_reason": "end_turn",
+            "usage": _usage(request, tokens),
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode()), "contentType": "application/json"}
+
+    def invoke_model_with_response_stream(self, modelId: str, body: str, **kwargs) -> Dict:
+        request = json.loads(body)
+        tokens = _reply_tokens(request)
+        usage = _usage(request, tokens)
+        events = [
+            {"type": "message_start", "message": {"model": modelId, "usage": {"input_tokens": usage["input_tokens"]}}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            *[{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}
+              for token in tokens],
+            {"type": "content_block_stop", "index": 0},
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+             "usage": {"output_tokens": usage["output_tokens"]}},
+            {"type": "message_stop"},
+        ]
+        return {"body": StubEventStream(events, self.delay), "contentType": "application/json"}
@@ -1,21 +1,43 @@
 from typing import Optional, List
 from datetime import datetime, date
-from pydantic import BaseModel
-import requests
+from decimal import Decimal
+from pydantic import BaseModel, ValidationError
 
 """
 WealthAI CRM データ参照アプリケーション
 FastAPI + Jinja2 テンプレートを使用したWebアプリ
 """
 
-from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi import FastAPI, Request, Depends, HTTPException, Query, Body
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func, Column, Integer, String, Date
-from .models.database import get_db, Customer, SalesRepresentative, Product, Holding, SalesNote, CashInflow, EconomicEvent, Base
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse, StreamingResponse
+from sqlalchemy.orm import joinedload, contains_eager, raiseload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, or_, Column, Integer, String, Date
+from .models.database import get_db, init_db, Customer, SalesRepresentative, Product, Holding, SalesNote, CashInflow, EconomicEvent, Base
+from .services.stats_service import stats_service
+from .services.product_service import product_service
+from .services.product_sync_service import product_sync_service
+from .services.revaluation_service import revaluation_service
+from .services.portfolio_service import portfolio_service
+from .services.sales_note_search_service import sales_note_search_service
+from .services.bulk_write_service import bulk_write_service, holding_values, MAX_BULK_ROWS
+from .services.cash_inflow_forecast_service import cash_inflow_forecast_service
+from .services.maturity_ladder_service import maturity_ladder_service
+from .services.event_exposure_service import event_exposure_service
+from .services.chat_context_service import chat_context_service
+from .bedrock_chat import bedrock_chat_service, UserSlot
+from .utils.metrics import registry
+from .utils import query_counter, profiling
+from .utils.query_counter import query_budget
+from .utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, model_columns, resolve_fields, paginate, page_response
+from .utils.export import EXPORT_FORMATS, EXPORT_STREAMS, arrow_available
+from .utils.response_cache import response_cache
+from .utils.auth import authenticated_user_id
 from typing import List
+from contextlib import asynccontextmanager
+import json
 import os
 from pathlib import Path
 
@@ -58,91 +80,205 @@ class HoldingUpdate(BaseModel):
     product_id: Optional[int] = None
     quantity: Optional[float] = None
     purchase_price: Optional[float] = None
+    unit_price: Optional[float] = None
     current_price: Optional[float] = None
     purchase_date: Optional[date] = None
     maturity_date: Optional[date] = None
 
+class ChatRequest(BaseModel):
+    message: str
+    conversation_history: Optional[List[dict]] = None
+    customer_context: Optional[dict] = None
+    customer_id: Optional[int] = None
+
+def validate_bulk_rows(model, rows: List[dict]):
+    """一括登録の各行をPydanticで検証し、(有効行, 行エラー) を返す"""
+    if len(rows) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"Too many rows (max {MAX_BULK_ROWS})")
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, model(**row).dict()))
+        except ValidationError as e:
+            errors.append({"index": index, "detail": e.errors(include_url=False, include_context=False)})
+    return valid, errors
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時に集計テーブル等の未作成スキーマを作成し、共有HTTPクライアントを生成"""
+    await init_db()
+    await product_service.start()
+    yield
+    await product_service.close()
+    bedrock_chat_service.executor.shutdown(wait=False, cancel_futures=True)
+
+# 一覧APIの射影可能フィールド（保有商品は顧客・商品の列も指定時のみJOIN）
+CUSTOMER_FIELDS = model_columns(Customer)
+PRODUCT_FIELDS = model_columns(Product)
+HOLDING_FIELDS = {
+    **model_columns(Holding),
+    "customer_name": Customer.name,
+    "customer_code": Customer.customer_code,
+    "sales_rep_id": Customer.sales_rep_id,
+    "product_code": Product.product_code,
+    "product_name": Product.product_name,
+    "category_code": Product.category_code,
+    "currency": Product.currency,
+}
+
+def holdings_page_query(selected: dict, status: Optional[str] = None,
+                        sales_rep_id: Optional[int] = None, category_code: Optional[str] = None):
+    """保有商品一覧のSELECTを構築（必要な場合のみ顧客・商品をJOIN）"""
+    stmt = select(*[column.label(name) for name, column in selected.items()]).select_from(Holding)
+    tables = {column.class_ for column in selected.values()}
+    if Customer in tables or sales_rep_id is not None:
+        stmt = stmt.join(Customer, Holding.customer_id == Customer.customer_id)
+    if Product in tables or category_code:
+        stmt = stmt.join(Product, Holding.product_id == Product.product_id)
+    if status:
+        stmt = stmt.where(Holding.status == status)
+    if sales_rep_id is not None:
+        stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+    if category_code:
+        stmt = stmt.where(Product.category_code == category_code)
+    return stmt
+
+CASH_INFLOW_FIELDS = model_columns(CashInflow)
+
+def customers_without_notes_query(sales_rep_id: Optional[int] = None):
+    """営業メモ未作成の顧客（NOT EXISTSによるアンチジョイン、sales_notesの主キーで判定）"""
+    has_note = select(SalesNote.customer_id).where(SalesNote.customer_id == Customer.customer_id).exists()
+    stmt = select(Customer.customer_id, Customer.name, Customer.sales_rep_id).where(~has_note)
+    if sales_rep_id is not None:
+        stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+    return stmt
+
+def sales_note_coverage_query():
+    """担当者別の顧客数・メモ作成済み顧客数（1回のGROUP BY）"""
+    return (
+        select(
+            Customer.sales_rep_id,
+            SalesRepresentative.name.label("sales_rep_name"),
+            func.count(Customer.customer_id).label("customers"),
+            func.count(SalesNote.customer_id).label("with_notes"),
+        )
+        .select_from(Customer)
+        .outerjoin(SalesNote, SalesNote.customer_id == Customer.customer_id)
+        .outerjoin(SalesRepresentative, SalesRepresentative.rep_id == Customer.sales_rep_id)
+        .group_by(Customer.sales_rep_id, SalesRepresentative.name)
+        .order_by(Customer.sales_rep_id.nulls_last())
+    )
+
 # FastAPIアプリケーション初期化
-app = FastAPI(title="WealthAI CRM", description="ウェルスマネジメント向けCRMデータ参照システム")
+app = FastAPI(title="WealthAI CRM", description="ウェルスマネジメント向けCRMデータ参照システム", lifespan=lifespan)
 
 # テンプレートとスタティックファイルの設定
 BASE_DIR = Path(__file__).parent.parent
 templates = Jinja2Templates(directory=str(BASE_DIR / "web"))
+profiling.instrument_templates(templates)
 
 # スタティックファイルディレクトリを作成（存在しない場合）
 static_dir = BASE_DIR / "static"
 static_dir.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    """リクエストごとのSQL発行数・DB時間・描画時間を計測し、ページのクエリ予算を検査"""
+    counter = query_counter.start()
+    profile = profiling.start()
+    response = await call_next(request)
+    timings = profiling.record(request, response.status_code, profile, counter)
+    budget = query_counter.budget_of(request.scope.get("endpoint"))
+    error = query_counter.check_budget(request.url.path, counter, budget)
+    if error:
+        return JSONResponse(status_code=500, content={"detail": error})
+    response.headers["X-Query-Count"] = str(counter.count)
+    if profiling.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = profiling.server_timing(timings, counter.count)
+    return response
+
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+@query_budget(5)
+async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
     """ダッシュボード - 全体概要"""
     
-    # 基本統計情報を取得
-    stats = {
-        "total_customers": db.query(Customer).count(),
-        "total_products": db.query(Product).count(),
-        "total_holdings": db.query(Holding).count(),
-        "total_sales_notes": db.query(SalesNote.customer_id).count(),  # customer_id主キーに修正
-        "total_economic_events": db.query(EconomicEvent).count(),
-    }
-    
-    # 保有資産総額を計算
-    total_assets = db.query(func.sum(Holding.current_value)).scalar() or 0
+    # 件数・資産総額・簿価・含み損益を集計テーブルから1クエリで取得
+    stats = await stats_service.get_dashboard_stats(db)
     
-    # 簿価総額を計算
-    total_book_value = db.query(func.sum(Holding.quantity * Holding.unit_price)).scalar() or 0
-    
-    # 評価額総額を計算
-    total_market_value = db.query(func.sum(Holding.current_value)).scalar() or 0
-    
-    # 含み損益を計算
-    unrealized_gain_loss = total_market_value - total_book_value
-    
-    stats["total_assets"] = total_assets
-    stats["total_book_value"] = total_book_value
-    stats["total_market_value"] = total_market_value
-    stats["unrealized_gain_loss"] = unrealized_gain_loss
-    
-    return templates.TemplateResponse("dashboard.html", {
+    return templates.TemplateResponse(request, "dashboard.html", {
         "request": request,
         "stats": stats
     })
 
+@app.get("/api/stats")
+async def get_stats_api(db: AsyncSession = Depends(get_db)):
+    """ダッシュボード統計API"""
+    stats = await stats_service.get_dashboard_stats(db)
+    return {key: float(value) if isinstance(value, Decimal) else value for key, value in stats.items()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus形式メトリクス（コネクションプール・ルート別レイテンシ/SQL等）"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/customers", response_class=HTMLResponse)
-async def customers_list(request: Request, db: Session = Depends(get_db)):
-    """顧客一覧"""
-    customers = db.query(Customer).order_by(Customer.customer_id).all()
-    sales_reps = db.query(SalesRepresentative).all()
-    return templates.TemplateResponse("customers.html", {
+@response_cache.cached("customers")
+@query_budget(2)
+async def customers_list(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """顧客一覧（customer_idのキーセットページング）"""
+    customers, next_cursor = await paginate(
+        db,
+        select(Customer).options(joinedload(Customer.sales_rep), raiseload("*")),
+        Customer.customer_id, cursor, limit, scalars=True
+    )
+    sales_reps = (await db.scalars(select(SalesRepresentative))).all()
+    return templates.TemplateResponse(request, "customers.html", {
         "request": request,
         "customers": customers,
-        "sales_reps": sales_reps
+        "sales_reps": sales_reps,
+        "next_cursor": next_cursor,
+        "limit": limit
     })
 
 @app.get("/customers/{customer_id}", response_class=HTMLResponse)
-async def customer_detail(request: Request, customer_id: int, db: Session = Depends(get_db)):
+@query_budget(4)
+async def customer_detail(request: Request, customer_id: int, db: AsyncSession = Depends(get_db)):
     """顧客詳細"""
-    customer = db.query(Customer).filter(Customer.customer_id == customer_id).first()
+    customer = (await db.scalars(
+        select(Customer).options(joinedload(Customer.sales_rep), raiseload("*")).where(Customer.customer_id == customer_id)
+    )).first()
     if not customer:
-        return templates.TemplateResponse("404.html", {"request": request})
+        return templates.TemplateResponse(request, "404.html", {"request": request})
     
-    # 保有商品を取得
-    holdings = db.query(Holding).join(Product).filter(Holding.customer_id == customer_id).all()
+    # 保有商品を取得（商品はJOIN結果から読み込み）
+    holdings = (await db.scalars(
+        select(Holding).join(Product)
+        .options(contains_eager(Holding.product), raiseload("*"))
+        .where(Holding.customer_id == customer_id)
+    )).all()
     
     # 営業メモを取得（シンプル化後のフィールドのみ）
-    sales_notes = db.query(
+    sales_notes = (await db.execute(select(
         SalesNote.customer_id,
         SalesNote.sales_rep_id,
         SalesNote.content,
         SalesNote.created_at,
         SalesNote.updated_at
-    ).filter(SalesNote.customer_id == customer_id).all()
+    ).where(SalesNote.customer_id == customer_id))).all()
     
     # 入金予測を取得
-    cash_inflows = db.query(CashInflow).filter(CashInflow.customer_id == customer_id).all()
+    cash_inflows = (await db.scalars(
+        select(CashInflow).options(raiseload("*")).where(CashInflow.customer_id == customer_id)
+        .order_by(CashInflow.predicted_date)
+    )).all()
     
-    return templates.TemplateResponse("customer_detail.html", {
+    return templates.TemplateResponse(request, "customer_detail.html", {
         "request": request,
         "customer": customer,
         "holdings": holdings,
@@ -151,61 +287,188 @@ async def customer_detail(request: Request, customer_id: int, db: Session = Depe
     })
 
 @app.get("/holdings", response_class=HTMLResponse)
-async def holdings_list(request: Request, db: Session = Depends(get_db)):
-    """保有商品一覧"""
-    holdings = db.query(Holding).join(Customer).join(Product).filter(Holding.status == 'active').order_by(Holding.holding_id).all()
-    customers = db.query(Customer).all()
-    products = db.query(Product).all()
-    return templates.TemplateResponse("holdings.html", {
+@response_cache.cached("holdings", "customers", "products")
+@query_budget(1)
+async def holdings_list(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """保有商品一覧（holding_idのキーセットページング）
+
+    登録・編集モーダルの顧客・商品は /api/customers・/api/products の q 検索で選択するため、ここでは取得しない
+    """
+    holdings, next_cursor = await paginate(
+        db,
+        select(Holding)
+        .options(joinedload(Holding.customer, innerjoin=True), joinedload(Holding.product, innerjoin=True), raiseload("*"))
+        .where(Holding.status == 'active'),
+        Holding.holding_id, cursor, limit, scalars=True
+    )
+    return templates.TemplateResponse(request, "holdings.html", {
         "request": request,
         "holdings": holdings,
-        "customers": customers,
-        "products": products
+        "next_cursor": next_cursor,
+        "limit": limit
+    })
+
+@app.get("/maturities", response_class=HTMLResponse)
+@query_budget(2)
+async def maturities_list(
+    request: Request,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sales_rep_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """満期予定（月別の満期ラダーと、満期日順のキーセットページング）"""
+    ladder = await maturity_ladder_service.ladder(
+        db, period="month", date_from=date_from, date_to=date_to, sales_rep_id=sales_rep_id
+    )
+    maturities, next_cursor = await maturity_ladder_service.upcoming(
+        db, date_from=date_from, date_to=date_to, cursor=cursor, limit=limit, sales_rep_id=sales_rep_id
+    )
+    return templates.TemplateResponse(request, "maturities.html", {
+        "request": request,
+        "ladder": ladder,
+        "maturities": maturities,
+        "sales_rep_id": sales_rep_id,
+        "next_cursor": next_cursor,
+        "limit": limit
     })
 
 @app.get("/products", response_class=HTMLResponse)
-async def crm_products_list(request: Request, db: Session = Depends(get_db)):
+@response_cache.cached("products")
+@query_budget(1)
+async def crm_products_list(request: Request, db: AsyncSession = Depends(get_db)):
     """CRM商品一覧"""
-    products = db.query(Product).order_by(Product.product_code).all()
-    return templates.TemplateResponse("crm_products.html", {
+    products = (await db.scalars(select(Product).order_by(Product.product_code))).all()
+    return templates.TemplateResponse(request, "crm_products.html", {
         "request": request,
         "products": products
     })
 
 # 顧客 CRUD API
 @app.get("/api/customers")
-async def get_customers_api(db: Session = Depends(get_db)):
-    """顧客一覧API"""
-    customers = db.query(Customer).all()
-    return customers
+async def get_customers_api(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    sales_rep_id: Optional[int] = None,
+    q: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """顧客一覧API（キーセットページング・列射影・担当者フィルタ・q: 氏名の部分一致/顧客コードの前方一致）"""
+    selected = resolve_fields(fields, CUSTOMER_FIELDS, "customer_id")
+    stmt = select(*[column.label(name) for name, column in selected.items()])
+    if sales_rep_id is not None:
+        stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+    if q and q.strip():
+        term = q.strip()
+        stmt = stmt.where(or_(Customer.name.icontains(term, autoescape=True),
+                              Customer.customer_code.istartswith(term, autoescape=True)))
+    rows, next_cursor = await paginate(db, stmt, Customer.customer_id, cursor, limit)
+    return page_response(rows, next_cursor, limit)
+
+@app.get("/api/customers/{customer_id}/portfolio")
+async def get_customer_portfolio_api(customer_id: int, db: AsyncSession = Depends(get_db)):
+    """顧客ポートフォリオ概要API（評価額・簿価・損益・カテゴリ/通貨別配分）"""
+    portfolio = await portfolio_service.get_portfolio(db, customer_id)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return portfolio
+
+@app.get("/api/portfolios")
+async def get_portfolios_api(ids: str, db: AsyncSession = Depends(get_db)):
+    """複数顧客のポートフォリオ概要API（ids=1,2,3）"""
+    try:
+        customer_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if len(customer_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {MAX_PAGE_SIZE})")
+    portfolios = await portfolio_service.get_portfolios(db, customer_ids)
+    return {"portfolios": [portfolios[customer_id] for customer_id in customer_ids if customer_id in portfolios]}
+
+@app.get("/api/maturities/ladder")
+async def get_maturity_ladder(
+    period: str = Query("month", pattern="^(week|month|quarter|year)$"),
+    group_by: str = Query("none", pattern="^(none|customer|sales_rep)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sales_rep_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """満期ラダー（期間別・顧客別・担当者別の満期額、既定は本日から1年間）"""
+    return await maturity_ladder_service.ladder(
+        db, period=period, group_by=group_by, date_from=date_from, date_to=date_to,
+        sales_rep_id=sales_rep_id, customer_id=customer_id
+    )
+
+@app.get("/api/maturities/upcoming")
+async def get_upcoming_maturities(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sales_rep_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """満期予定の保有一覧API（満期日順のキーセットページング）"""
+    rows, next_cursor = await maturity_ladder_service.upcoming(
+        db, date_from=date_from, date_to=date_to, cursor=cursor, limit=limit,
+        sales_rep_id=sales_rep_id, customer_id=customer_id
+    )
+    return page_response(rows, next_cursor, limit)
 
 @app.get("/api/customers/{customer_id}")
-async def get_customer_api(customer_id: int, db: Session = Depends(get_db)):
+async def get_customer_api(customer_id: int, db: AsyncSession = Depends(get_db)):
     """顧客詳細API"""
-    customer = db.query(Customer).filter(Customer.customer_id == customer_id).first()
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
 
 @app.post("/api/customers")
-async def create_customer_api(customer_data: CustomerCreate, db: Session = Depends(get_db)):
+async def create_customer_api(customer_data: CustomerCreate, db: AsyncSession = Depends(get_db)):
     """顧客作成API"""
     # 顧客コード重複チェック
-    existing = db.query(Customer).filter(Customer.customer_code == customer_data.customer_code).first()
+    existing = (await db.scalars(
+        select(Customer.customer_id).where(Customer.customer_code == customer_data.customer_code)
+    )).first()
     if existing:
         raise HTTPException(status_code=400, detail="Customer code already exists")
     
     customer = Customer(**customer_data.dict())
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await response_cache.invalidate("customers")
+    await db.refresh(customer)
     return customer
 
+@app.post("/api/customers/bulk")
+async def create_customers_bulk_api(
+    rows: List[dict] = Body(...),
+    all_or_nothing: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """顧客一括登録API（1トランザクション・行単位エラー、all_or_nothing=trueでエラー時は全件中止）"""
+    valid, errors = validate_bulk_rows(CustomerCreate, rows)
+    result = await bulk_write_service.create_customers(db, valid, len(rows), errors, all_or_nothing)
+    if result["inserted_count"]:
+        await response_cache.invalidate("customers")
+    return result
+
 @app.put("/api/customers/{customer_id}")
-async def update_customer_api(customer_id: int, customer_data: CustomerUpdate, db: Session = Depends(get_db)):
+async def update_customer_api(customer_id: int, customer_data: CustomerUpdate, db: AsyncSession = Depends(get_db)):
     """顧客更新API"""
     try:
-        customer = db.query(Customer).filter(Customer.customer_id == customer_id).first()
+        customer = await db.get(Customer, customer_id)
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
         
@@ -231,125 +494,209 @@ async def update_customer_api(customer_id: int, customer_data: CustomerUpdate, d
                 
                 setattr(customer, field, value)
         
-        db.commit()
-        db.refresh(customer)
+        await db.commit()
+        await response_cache.invalidate("customers")
+        chat_context_service.invalidate([customer_id])
+        await db.refresh(customer)
         return customer
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Invalid data type: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Update failed: {str(e)}")
 
 # 保有商品 CRUD API
 @app.get("/api/holdings")
-async def get_holdings_api(db: Session = Depends(get_db)):
-    """保有商品一覧API"""
-    holdings = db.query(Holding).join(Customer).join(Product).all()
-    return holdings
+async def get_holdings_api(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    sales_rep_id: Optional[int] = None,
+    category_code: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """保有商品一覧API（キーセットページング・列射影・状態/担当者/商品カテゴリフィルタ）"""
+    selected = resolve_fields(fields, HOLDING_FIELDS, "holding_id")
+    stmt = holdings_page_query(selected, status, sales_rep_id, category_code)
+    rows, next_cursor = await paginate(db, stmt, Holding.holding_id, cursor, limit)
+    return page_response(rows, next_cursor, limit)
 
 @app.get("/api/holdings/{holding_id}")
-async def get_holding_api(holding_id: int, db: Session = Depends(get_db)):
+async def get_holding_api(holding_id: int, db: AsyncSession = Depends(get_db)):
     """保有商品詳細API"""
-    holding = db.query(Holding).filter(Holding.holding_id == holding_id).first()
+    holding = await db.get(Holding, holding_id)
     if not holding:
         raise HTTPException(status_code=404, detail="Holding not found")
     return holding
 
 @app.post("/api/holdings")
-async def create_holding_api(holding_data: HoldingCreate, db: Session = Depends(get_db)):
+async def create_holding_api(holding_data: HoldingCreate, db: AsyncSession = Depends(get_db)):
     """保有商品作成API"""
-    holding = Holding(**holding_data.dict())
-    holding.status = 'active'
-    holding.current_value = holding.quantity * (holding.current_price or holding.purchase_price)
+    holding = Holding(**holding_values(holding_data.dict()))
     db.add(holding)
-    db.commit()
-    db.refresh(holding)
+    await db.flush()
+    await stats_service.record_change(db, None, holding)
+    await portfolio_service.refresh(db, [holding.customer_id])
+    await db.commit()
+    await response_cache.invalidate("holdings")
+    chat_context_service.invalidate([holding.customer_id])
+    await db.refresh(holding)
     return holding
 
+@app.post("/api/holdings/bulk")
+async def create_holdings_bulk_api(
+    rows: List[dict] = Body(...),
+    all_or_nothing: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """保有商品一括登録API（1トランザクション・行単位エラー、集計も同じトランザクションで更新）"""
+    valid, errors = validate_bulk_rows(HoldingCreate, rows)
+    result = await bulk_write_service.create_holdings(db, valid, len(rows), errors, all_or_nothing)
+    if result["inserted_count"]:
+        await response_cache.invalidate("holdings")
+        chat_context_service.invalidate({row["customer_id"] for _, row in valid})
+    return result
+
 @app.put("/api/holdings/{holding_id}")
-async def update_holding_api(holding_id: int, holding_data: HoldingUpdate, db: Session = Depends(get_db)):
+async def update_holding_api(holding_id: int, holding_data: HoldingUpdate, db: AsyncSession = Depends(get_db)):
     """保有商品更新API"""
-    holding = db.query(Holding).filter(Holding.holding_id == holding_id).first()
+    holding = await db.get(Holding, holding_id)
     if not holding:
         raise HTTPException(status_code=404, detail="Holding not found")
+    before = stats_service.holding_figures(holding)
+    previous_customer_id = holding.customer_id
     
-    # 更新データの適用
+    # 更新データの適用（purchase_price は取得単価 unit_price として保存、数値はDECIMAL列に合わせる）
     update_data = holding_data.dict(exclude_unset=True)
+    if "purchase_price" in update_data:
+        purchase_price = update_data.pop("purchase_price")
+        if purchase_price is not None:
+            update_data["unit_price"] = purchase_price
     for field, value in update_data.items():
-        setattr(holding, field, value)
+        setattr(holding, field, Decimal(str(value)) if isinstance(value, float) else value)
     
-    # 現在価値を再計算
-    holding.current_value = holding.quantity * (holding.current_price or holding.purchase_price)
+    # 評価額・損益を再計算（現在単価が無ければ取得単価）
+    holding.current_value = holding.quantity * (holding.current_price or holding.unit_price)
+    holding.unrealized_gain_loss = holding.current_value - holding.quantity * holding.unit_price
+    await stats_service.record_change(db, before, holding)
+    await db.flush()
+    await portfolio_service.refresh(db, [previous_customer_id, holding.customer_id])
     
-    db.commit()
-    db.refresh(holding)
+    await db.commit()
+    await response_cache.invalidate("holdings")
+    chat_context_service.invalidate([previous_customer_id, holding.customer_id])
+    await db.refresh(holding)
     return holding
 
 # CRM商品 API
 @app.get("/api/crm-products")
-async def get_crm_products_api(db: Session = Depends(get_db)):
+@response_cache.cached("products")
+async def get_crm_products_api(request: Request, db: AsyncSession = Depends(get_db)):
     """CRM商品一覧API"""
-    products = db.query(Product).all()
+    products = (await db.scalars(select(Product))).all()
     return products
 
+@app.get("/api/products")
+async def get_products_api(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    category_code: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """CRM商品検索API（キーセットページング・列射影・カテゴリフィルタ・q: 商品名の部分一致/商品コードの前方一致）"""
+    selected = resolve_fields(fields, PRODUCT_FIELDS, "product_id")
+    stmt = select(*[column.label(name) for name, column in selected.items()])
+    if category_code:
+        stmt = stmt.where(Product.category_code == category_code)
+    if q and q.strip():
+        term = q.strip()
+        stmt = stmt.where(or_(Product.product_name.icontains(term, autoescape=True),
+                              Product.product_code.istartswith(term, autoescape=True)))
+    rows, next_cursor = await paginate(db, stmt, Product.product_id, cursor, limit)
+    return page_response(rows, next_cursor, limit)
+
+@app.get("/api/export/{resource}")
+async def export_table(
+    resource: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv|arrow)$"),
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    sales_rep_id: Optional[int] = None,
+    category_code: Optional[str] = None
+):
+    """全件エクスポート（NDJSON/CSV/Arrowをサーバーサイドカーソルでストリーミング）
+
+    resource: customers / holdings / cash-inflows
+    """
+    if resource == "customers":
+        selected = resolve_fields(fields, CUSTOMER_FIELDS, "customer_id")
+        stmt = select(*[column.label(name) for name, column in selected.items()])
+        if sales_rep_id is not None:
+            stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+        key_column = Customer.customer_id
+    elif resource == "holdings":
+        selected = resolve_fields(fields, HOLDING_FIELDS, "holding_id")
+        stmt = holdings_page_query(selected, status, sales_rep_id, category_code)
+        key_column = Holding.holding_id
+    elif resource == "cash-inflows":
+        selected = resolve_fields(fields, CASH_INFLOW_FIELDS, "inflow_id")
+        stmt = select(*[column.label(name) for name, column in selected.items()])
+        if status:
+            stmt = stmt.where(CashInflow.status == status)
+        if sales_rep_id is not None:
+            stmt = stmt.where(CashInflow.sales_rep_id == sales_rep_id)
+        key_column = CashInflow.inflow_id
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown export resource: {resource}")
+    if format == "arrow" and not arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        EXPORT_STREAMS[format](stmt.order_by(key_column), list(selected)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{resource}.{extension}"'},
+    )
+
 @app.post("/api/sync-products")
-async def sync_products_from_master(db: Session = Depends(get_db)):
-    """ProductMasterから商品同期"""
+async def sync_products_from_master(
+    since: Optional[str] = None,
+    full: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """ProductMasterから商品同期（差分のみバッチUPSERT、since/ETagによる差分モード）"""
     try:
-        # ProductMaster APIから商品情報取得
-        response = requests.get("http://localhost:8001/api/products")
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="ProductMaster API error")
-        
-        products_data = response.json()
-        products = products_data.get("products", [])
-        
-        sync_count = 0
-        for product_data in products:
-            # 既存商品確認
-            existing = db.query(Product).filter(
-                Product.product_code == product_data["product_code"]
-            ).first()
-            
-            if existing:
-                # 更新
-                existing.product_name = product_data["product_name"]
-                existing.category_code = product_data.get("category_code", "")
-                existing.currency = product_data.get("currency", "JPY")
-                existing.issuer = product_data.get("issuer", "")
-                existing.maturity_date = product_data.get("maturity_date")
-                existing.risk_level = product_data.get("risk_level", 1)
-                existing.minimum_investment = product_data.get("minimum_investment", 0)
-            else:
-                # 新規作成
-                product = Product(
-                    product_code=product_data["product_code"],
-                    product_name=product_data["product_name"],
-                    category_code=product_data.get("category_code", ""),
-                    currency=product_data.get("currency", "JPY"),
-                    issuer=product_data.get("issuer", ""),
-                    maturity_date=product_data.get("maturity_date"),
-                    risk_level=product_data.get("risk_level", 1),
-                    minimum_investment=product_data.get("minimum_investment", 0)
-                )
-                db.add(product)
-            sync_count += 1
-        
-        db.commit()
-        return {"status": "success", "synced_count": sync_count}
-        
+        result = await product_sync_service.sync(db, since=since, full=full)
+        if result.get("updated_count"):
+            # 商品分類・通貨の変更は顧客コンテキストの資産配分に影響する
+            chat_context_service.invalidate()
+        return result
     except Exception as e:
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
 
+@app.post("/api/revaluation")
+async def revalue_holdings(db: AsyncSession = Depends(get_db)):
+    """最新価格で全アクティブ保有を一括再評価"""
+    try:
+        result = await revaluation_service.revalue(db)
+        await response_cache.invalidate("holdings")
+        chat_context_service.invalidate()
+        return result
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Revaluation error: {str(e)}")
+
 @app.get("/api/assets/book-value")
-async def get_total_book_value(db: Session = Depends(get_db)):
+async def get_total_book_value(db: AsyncSession = Depends(get_db)):
     """顧客資産簿価総額取得API"""
     try:
-        # 簿価総額 = quantity × unit_price の合計
-        total_book_value = db.query(
-            func.sum(Holding.quantity * Holding.unit_price)
-        ).scalar() or 0
+        # 簿価総額 = quantity × unit_price の合計（集計テーブルから取得）
+        total_book_value = (await stats_service.get_dashboard_stats(db))["total_book_value"]
         
         return {
             "status": "success",
@@ -360,13 +707,11 @@ async def get_total_book_value(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"簿価総額取得エラー: {str(e)}")
 
 @app.get("/api/assets/market-value")
-async def get_total_market_value(db: Session = Depends(get_db)):
+async def get_total_market_value(db: AsyncSession = Depends(get_db)):
     """顧客資産評価額総額取得API"""
     try:
-        # 評価額総額 = current_value の合計
-        total_market_value = db.query(
-            func.sum(Holding.current_value)
-        ).scalar() or 0
+        # 評価額総額 = current_value の合計（集計テーブルから取得）
+        total_market_value = (await stats_service.get_dashboard_stats(db))["total_market_value"]
         
         return {
             "status": "success",
@@ -378,35 +723,88 @@ async def get_total_market_value(db: Session = Depends(get_db)):
 
 # 他のエンドポイント（省略）
 @app.get("/sales-notes", response_class=HTMLResponse)
-async def sales_notes_list(request: Request, db: Session = Depends(get_db)):
-    """営業メモ一覧"""
-    # シンプル化後のフィールドのみ取得
-    sales_notes = db.query(
+@query_budget(2)
+async def sales_notes_list(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """営業メモ一覧（customer_idのキーセットページング）"""
+    sales_notes, next_cursor = await paginate(db, select(
         SalesNote.customer_id,
         SalesNote.sales_rep_id,
         SalesNote.content,
         SalesNote.created_at,
         SalesNote.updated_at,
         Customer.name.label('customer_name')
-    ).join(Customer).order_by(SalesNote.customer_id).all()
+    ).join(Customer), SalesNote.customer_id, cursor, limit)
     
-    # メモが未作成の顧客のみ取得
-    customers_with_notes = db.query(SalesNote.customer_id).distinct().subquery()
-    customers_without_notes = db.query(Customer).filter(
-        ~Customer.customer_id.in_(db.query(customers_with_notes.c.customer_id))
-    ).order_by(Customer.customer_id).all()
+    # 追加モーダル用: メモ未作成の顧客の先頭ページ（続きは /api/sales-notes/customers-without-notes）
+    customers_without_notes, customers_cursor = await paginate(
+        db, customers_without_notes_query(), Customer.customer_id, None, limit
+    )
     
-    return templates.TemplateResponse("sales_notes.html", {
+    return templates.TemplateResponse(request, "sales_notes.html", {
         "request": request,
         "sales_notes": sales_notes,
-        "customers": customers_without_notes
+        "customers": customers_without_notes,
+        "customers_cursor": customers_cursor,
+        "next_cursor": next_cursor,
+        "limit": limit
     })
 
+@app.get("/api/sales-notes/customers-without-notes")
+async def get_customers_without_notes(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sales_rep_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """営業メモ未作成の顧客一覧API（キーセットページング・担当者フィルタ）"""
+    rows, next_cursor = await paginate(db, customers_without_notes_query(sales_rep_id), Customer.customer_id, cursor, limit)
+    return page_response(rows, next_cursor, limit)
+
+@app.get("/api/sales-notes/coverage")
+async def get_sales_note_coverage(db: AsyncSession = Depends(get_db)):
+    """担当者別の営業メモ作成状況（メモあり/なし顧客数と作成率）"""
+    items = []
+    for row in (await db.execute(sales_note_coverage_query())).all():
+        items.append({
+            "sales_rep_id": row.sales_rep_id,
+            "sales_rep_name": row.sales_rep_name,
+            "customers": row.customers,
+            "with_notes": row.with_notes,
+            "without_notes": row.customers - row.with_notes,
+            "coverage_rate": row.with_notes / row.customers if row.customers else None,
+        })
+    total = sum(item["customers"] for item in items)
+    with_notes = sum(item["with_notes"] for item in items)
+    return {
+        "items": items,
+        "total": {
+            "customers": total,
+            "with_notes": with_notes,
+            "without_notes": total - with_notes,
+            "coverage_rate": with_notes / total if total else None,
+        },
+    }
+
+@app.get("/api/sales-notes/search")
+async def search_sales_notes(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    sales_rep_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """営業メモ全文検索（関連度順・強調表示付きスニペット）"""
+    return await sales_note_search_service.search(db, q, limit=limit, sales_rep_id=sales_rep_id)
+
 # 営業メモ CRUD API
 @app.post("/api/sales-notes")
 async def create_sales_note(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """営業メモ作成"""
     try:
@@ -420,112 +818,231 @@ async def create_sales_note(
             content=content
         )
         db.add(new_note)
-        db.commit()
-        db.refresh(new_note)
+        await db.commit()
+        chat_context_service.invalidate([customer_id])
+        await db.refresh(new_note)
         return {"status": "success", "customer_id": new_note.customer_id}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/sales-notes/{customer_id}")
 async def update_sales_note(
     customer_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """営業メモ更新"""
     try:
         form = await request.form()
         content = form.get("content", "")
         
-        note = db.query(SalesNote).filter(SalesNote.customer_id == customer_id).first()
+        note = await db.get(SalesNote, customer_id)
         if not note:
             raise HTTPException(status_code=404, detail="メモが見つかりません")
         
         note.content = content
-        db.commit()
+        await db.commit()
+        chat_context_service.invalidate([customer_id])
         return {"status": "success"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/sales-notes/{customer_id}")
-async def delete_sales_note(customer_id: int, db: Session = Depends(get_db)):
+async def delete_sales_note(customer_id: int, db: AsyncSession = Depends(get_db)):
     """営業メモ削除"""
     try:
-        note = db.query(SalesNote).filter(SalesNote.customer_id == customer_id).first()
+        note = await db.get(SalesNote, customer_id)
         if not note:
             raise HTTPException(status_code=404, detail="メモが見つかりません")
         
-        db.delete(note)
-        db.commit()
+        await db.delete(note)
+        await db.commit()
+        chat_context_service.invalidate([customer_id])
         return {"status": "success"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/cash-inflows", response_class=HTMLResponse)
-async def cash_inflows_list(request: Request, db: Session = Depends(get_db)):
-    """入金予測一覧"""
-    cash_inflows = db.query(CashInflow).join(Customer).all()
-    return templates.TemplateResponse("cash_inflows.html", {
+@query_budget(1)
+async def cash_inflows_list(
+    request: Request,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """入金予測一覧（予測日順、期間指定は predicted_date のインデックスで絞り込み）"""
+    stmt = (
+        select(CashInflow).join(Customer)
+        .options(contains_eager(CashInflow.customer), joinedload(CashInflow.sales_rep), raiseload("*"))
+        .order_by(CashInflow.predicted_date, CashInflow.inflow_id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(CashInflow.predicted_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(CashInflow.predicted_date <= date_to)
+    cash_inflows = (await db.scalars(stmt)).all()
+    return templates.TemplateResponse(request, "cash_inflows.html", {
         "request": request,
         "cash_inflows": cash_inflows
     })
 
+@app.get("/api/cash-inflows/forecast")
+async def get_cash_inflow_forecast(
+    period: str = Query("month", pattern="^(week|month)$"),
+    group_by: str = Query("none", pattern="^(none|sales_rep|customer)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sales_rep_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """入金見込み（確度加重）と予実精度を週・月単位で集計"""
+    return await cash_inflow_forecast_service.forecast(
+        db, period=period, group_by=group_by, date_from=date_from, date_to=date_to,
+        sales_rep_id=sales_rep_id, customer_id=customer_id
+    )
+
 @app.get("/economic-events", response_class=HTMLResponse)
-async def economic_events_list(request: Request, db: Session = Depends(get_db)):
+@response_cache.cached("economic_events")
+@query_budget(1)
+async def economic_events_list(request: Request, db: AsyncSession = Depends(get_db)):
     """経済イベント一覧"""
-    economic_events = db.query(EconomicEvent).all()
-    return templates.TemplateResponse("economic_events.html", {
+    economic_events = (await db.scalars(select(EconomicEvent))).all()
+    return templates.TemplateResponse(request, "economic_events.html", {
         "request": request,
-        "economic_events": economic_events
+        "economic_events": economic_events,
+        "today": date.today()
     })
 
+@app.get("/api/economic-events")
+async def get_economic_events_api(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    currency: Optional[str] = None,
+    sector: Optional[str] = None,
+    impact_level: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """経済イベント一覧API（開催日順のキーセットページング・期間/影響通貨/影響セクターで絞り込み）"""
+    rows, next_cursor = await event_exposure_service.list_events(
+        db, date_from=date_from, date_to=date_to, currency=currency, sector=sector,
+        impact_level=impact_level, cursor=cursor, limit=limit
+    )
+    return page_response(rows, next_cursor, limit)
+
+@app.get("/api/economic-events/exposure")
+async def get_event_exposure(
+    event_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sales_rep_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """イベント（event_id）または期間内のイベントの影響を受ける顧客（影響額順）"""
+    if event_id is None and date_from is None and date_to is None:
+        raise HTTPException(status_code=400, detail="event_id or date_from/date_to is required")
+    return await event_exposure_service.exposed_customers(
+        db, event_id=event_id, date_from=date_from, date_to=date_to, sales_rep_id=sales_rep_id, limit=limit
+    )
+
+@app.get("/api/economic-events/{event_id}/holdings")
+async def get_event_exposed_holdings(
+    event_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """イベントの影響を受けるアクティブ保有（holding_idのキーセットページング）"""
+    rows, next_cursor = await event_exposure_service.exposed_holdings(db, event_id, cursor=cursor, limit=limit)
+    return page_response(rows, next_cursor, limit)
+
 @app.delete("/api/holdings/{holding_id}")
-async def delete_holding_api(holding_id: int, db: Session = Depends(get_db)):
+async def delete_holding_api(holding_id: int, db: AsyncSession = Depends(get_db)):
     """保有商品削除API"""
     try:
-        holding = db.query(Holding).filter(Holding.holding_id == holding_id).first()
+        holding = await db.get(Holding, holding_id)
         if not holding:
             raise HTTPException(status_code=404, detail="Holding not found")
         
-        db.delete(holding)
-        db.commit()
+        before = stats_service.holding_figures(holding)
+        await db.delete(holding)
+        await stats_service.record_change(db, before, None)
+        await db.flush()
+        await portfolio_service.refresh(db, [holding.customer_id])
+        await db.commit()
+        await response_cache.invalidate("holdings")
+        chat_context_service.invalidate([holding.customer_id])
         return {"message": "Holding deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
+# AIチャット API
+async def chat_customer_context(chat_request: ChatRequest) -> Optional[dict]:
+    """明示されたコンテキストを優先し、顧客IDのみの場合はキャッシュ済みのコンテキストを使う"""
+    if chat_request.customer_context is None and chat_request.customer_id is not None:
+        return await chat_context_service.get(chat_request.customer_id)
+    return chat_request.customer_context
+
+def sse_event(payload: dict) -> str:
+    """Server-Sent Events の1イベント"""
+    return f"event: {payload['type']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+class ChatStreamingResponse(StreamingResponse):
+    """送信の終了時に同時実行枠を解放するストリーミング応答
+
+    送信開始前の切断などで本文が1度も読まれない場合や、送信中の例外で background が
+    実行されない場合も解放する
+    """
+
+    def __init__(self, content, slot: UserSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+@app.post("/api/chat")
+async def chat_api(chat_request: ChatRequest, user_id: str = Depends(authenticated_user_id)):
+    """AIチャットAPI（応答完了後にまとめて返す。同時実行数は認証済みの利用者ごとに制限）"""
+    customer_context = await chat_customer_context(chat_request)
+    return await bedrock_chat_service.chat(
+        chat_request.message, chat_request.conversation_history, customer_context,
+        user_id=user_id
+    )
+
+@app.post("/api/chat/stream")
+async def chat_stream_api(chat_request: ChatRequest, user_id: str = Depends(authenticated_user_id)):
+    """AIチャットAPI（Server-Sent Eventsで delta / done / error イベントを逐次返す）"""
+    customer_context = await chat_customer_context(chat_request)
+    # 枠の確保から応答を返すまでの間に await を挟まない（例外で枠が残らないように）
+    slot = bedrock_chat_service.reserve(user_id)
+    events = bedrock_chat_service.chat_stream(
+        slot, chat_request.message, chat_request.conversation_history, customer_context
+    )
+
+    async def body():
+        try:
+            async for event in events:
+                yield sse_event(event)
+        finally:
+            # クライアント切断時も上流のストリームを閉じ、同時実行枠を解放する
+            await events.aclose()
+
+    return ChatStreamingResponse(body(), slot, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
-@app.get("/api/holdings/{holding_id}")
-async def get_holding_api(holding_id: int, db: Session = Depends(get_db)):
-    """保有商品取得API"""
-    holding = db.query(Holding).filter(Holding.holding_id == holding_id).first()
-    if not holding:
-        raise HTTPException(status_code=404, detail="Holding not found")
-    return holding
-
-@app.put("/api/holdings/{holding_id}")
-async def update_holding_api(holding_id: int, holding_data: dict, db: Session = Depends(get_db)):
-    """保有商品更新API"""
-    try:
-        holding = db.query(Holding).filter(Holding.holding_id == holding_id).first()
-        if not holding:
-            raise HTTPException(status_code=404, detail="Holding not found")
-        
-        # 更新可能フィールドのみ更新
-        updatable_fields = ['quantity', 'unit_price', 'current_price', 'purchase_date', 'maturity_date']
-        for field, value in holding_data.items():
-            if field in updatable_fields and hasattr(holding, field) and value is not None:
-                if value != '':
-                    setattr(holding, field, value)
-        
-        db.commit()
-        db.refresh(holding)
-        return holding
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Update failed: {str(e)}")
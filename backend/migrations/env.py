@@ -0,0 +1,47 @@
+"""
+WealthAI CRM マイグレーション実行環境
+アプリと同じ DB_* 設定で接続し、アプリの statement_timeout（既定30秒）は適用しない
+（大きなテーブルへのインデックス作成・補完が途中で打ち切られないように）
+
+lock_timeout（MIGRATION_LOCK_TIMEOUT_MS）を超えてロックを待つ場合は失敗させ、
+稼働中のアプリの書き込みをマイグレーションのロック待ちの後ろに長時間並ばせない
+"""
+
+import os
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from backend.models.database import Base, DATABASE_URL
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+STATEMENT_TIMEOUT_MS = int(os.getenv("MIGRATION_STATEMENT_TIMEOUT_MS", 0))
+LOCK_TIMEOUT_MS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", 10000))
+
+def run_migrations_offline():
+    """SQLを出力するだけ（alembic upgrade head --sql）"""
+    context.configure(url=DATABASE_URL, target_metadata=Base.metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=NullPool,
+        connect_args={
+            "application_name": "wealthai-crm-migrate",
+            "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS} -c lock_timeout={LOCK_TIMEOUT_MS}",
+        },
+    )
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=Base.metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
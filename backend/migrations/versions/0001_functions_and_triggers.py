@@ -0,0 +1,112 @@
+"""集計テーブル・全文検索・入金予測集計の関数とトリガー
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+以前はアプリ起動時（init_db）に毎回実行していたDDLのうち、関数・トリガーと集計テーブルの作成を行う
+（インデックスは 0003 で CONCURRENTLY 作成、既存メモの search_vector 補完は 0002 でバッチ実行）
+
+入金予測集計（cash_inflow_buckets）の初回作成はトリガー作成と同じトランザクションで行う。
+トリガー作成で cash_inflows への書き込みはコミットまで待たされるため、作成中の書き込みが
+トリガーと初回作成の両方で二重に加算されることはない（書き込みが止まるのはこの集計1文の間だけ）
+"""
+
+from alembic import op
+from backend.models.database import (
+    Base, CRM_BIGRAMS_FUNCTION, CASH_INFLOW_BUCKET_COLUMNS, CASH_INFLOW_BUCKET_SELECT,
+)
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# このリビジョンで追加した集計テーブル（未作成の場合のみ作成）
+SUMMARY_TABLES = ("portfolio_stats", "customer_portfolios", "customer_portfolio_allocations", "cash_inflow_buckets")
+
+CASH_INFLOW_TRIGGERS = {
+    "cash_inflow_buckets_insert": "AFTER INSERT ON cash_inflows REFERENCING NEW TABLE AS new_rows",
+    "cash_inflow_buckets_update": "AFTER UPDATE ON cash_inflows REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "cash_inflow_buckets_delete": "AFTER DELETE ON cash_inflows REFERENCING OLD TABLE AS old_rows",
+    "cash_inflow_buckets_truncate": "AFTER TRUNCATE ON cash_inflows",
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    Base.metadata.create_all(bind, tables=[Base.metadata.tables[name] for name in SUMMARY_TABLES])
+    # NULL可・既定値なしの列追加はテーブルの書き換えを伴わない
+    op.execute("ALTER TABLE sales_notes ADD COLUMN IF NOT EXISTS search_vector tsvector")
+
+    # 営業メモ全文検索
+    op.execute(CRM_BIGRAMS_FUNCTION)
+    op.execute("""
+    CREATE OR REPLACE FUNCTION sales_notes_search_vector_update() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple', crm_bigrams(NEW.content));
+        RETURN NEW;
+    END
+    $$
+    """)
+    op.execute("DROP TRIGGER IF EXISTS sales_notes_search_vector_trigger ON sales_notes")
+    op.execute("""
+    CREATE TRIGGER sales_notes_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF content ON sales_notes
+    FOR EACH ROW EXECUTE FUNCTION sales_notes_search_vector_update()
+    """)
+
+    # 入金予測の期間別集計: 文単位トリガーの遷移テーブルから差分をまとめて加減算（COPYでも1文1回）
+    op.execute(f"""
+    CREATE OR REPLACE FUNCTION cash_inflow_buckets_merge(changed cash_inflows[], direction integer) RETURNS void
+    LANGUAGE sql AS $$
+        INSERT INTO cash_inflow_buckets AS b ({CASH_INFLOW_BUCKET_COLUMNS})
+        {CASH_INFLOW_BUCKET_SELECT.format(sign="direction", source="unnest(changed)")}
+        ON CONFLICT (period, bucket_start, customer_id, sales_rep_id, confidence_level, status) DO UPDATE SET
+            inflow_count = b.inflow_count + EXCLUDED.inflow_count,
+            predicted_amount = b.predicted_amount + EXCLUDED.predicted_amount,
+            actual_count = b.actual_count + EXCLUDED.actual_count,
+            actual_amount = b.actual_amount + EXCLUDED.actual_amount,
+            matched_predicted_amount = b.matched_predicted_amount + EXCLUDED.matched_predicted_amount,
+            abs_error_amount = b.abs_error_amount + EXCLUDED.abs_error_amount,
+            date_slip_days = b.date_slip_days + EXCLUDED.date_slip_days
+    $$
+    """)
+    op.execute("""
+    CREATE OR REPLACE FUNCTION cash_inflow_buckets_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            TRUNCATE cash_inflow_buckets;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM cash_inflow_buckets_merge(ARRAY(SELECT ROW(o.*)::cash_inflows FROM old_rows o), -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM cash_inflow_buckets_merge(ARRAY(SELECT ROW(n.*)::cash_inflows FROM new_rows n), 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """)
+    for name, timing in CASH_INFLOW_TRIGGERS.items():
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON cash_inflows")
+        op.execute(f"CREATE TRIGGER {name} {timing} FOR EACH STATEMENT EXECUTE FUNCTION cash_inflow_buckets_trigger()")
+
+    # 集計テーブル新設時は既存の入金予測から作成（作成済みの環境では何もしない）
+    op.execute(f"""
+    INSERT INTO cash_inflow_buckets ({CASH_INFLOW_BUCKET_COLUMNS})
+    {CASH_INFLOW_BUCKET_SELECT.format(sign=1, source="cash_inflows")}
+    HAVING NOT EXISTS (SELECT 1 FROM cash_inflow_buckets)
+    """)
+
+
+def downgrade():
+    for name in CASH_INFLOW_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON cash_inflows")
+    op.execute("DROP FUNCTION IF EXISTS cash_inflow_buckets_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS cash_inflow_buckets_merge(cash_inflows[], integer)")
+    op.execute("DROP TRIGGER IF EXISTS sales_notes_search_vector_trigger ON sales_notes")
+    op.execute("DROP FUNCTION IF EXISTS sales_notes_search_vector_update()")
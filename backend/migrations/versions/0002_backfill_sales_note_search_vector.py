@@ -0,0 +1,42 @@
+"""既存の営業メモの search_vector 補完（バッチ）
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+トリガー導入前のメモを MIGRATION_BATCH_SIZE 件ずつ別トランザクションで更新する
+（1文で全件を更新すると長時間の行ロックと大量のWALが1トランザクションに集中するため）。
+新規・更新されたメモは 0001 のトリガーで維持されるため、途中で中断しても再実行で続きから補完できる
+"""
+
+import os
+from alembic import op
+from sqlalchemy import text
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 5000))
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            updated = bind.execute(text("""
+                UPDATE sales_notes SET search_vector = to_tsvector('simple', crm_bigrams(content))
+                WHERE customer_id IN (
+                    SELECT customer_id FROM sales_notes
+                    WHERE search_vector IS NULL
+                    ORDER BY customer_id
+                    LIMIT :batch_size
+                )
+            """), {"batch_size": BATCH_SIZE}).rowcount
+            if not updated:
+                break
+
+
+def downgrade():
+    pass
@@ -0,0 +1,61 @@
+"""検索・満期ラダー・影響マッチング・入金予測のインデックス（CONCURRENTLY）
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+CREATE INDEX CONCURRENTLY はトランザクション内で実行できないため autocommit で1件ずつ作成する
+（作成中もテーブルへの書き込みは止まらない）。以前の作成が中断して無効（INVALID）なまま残った
+インデックスは IF NOT EXISTS では作り直されないため、先に削除してから作成する
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    # 営業メモ全文検索
+    "ix_sales_notes_search_vector": "sales_notes USING gin (search_vector)",
+    # 担当者別のメモ未作成顧客ページング・作成状況集計用（customer_idまで含めて索引だけで走査）
+    "ix_customers_sales_rep_id_customer_id": "customers (sales_rep_id, customer_id)",
+    # 満期ラダー: 保有の満期日、または満期日未設定の保有を商品の満期日から範囲検索
+    "ix_holdings_active_maturity_date": "holdings (maturity_date) WHERE status = 'active'",
+    "ix_holdings_active_inherited_maturity": "holdings (product_id) WHERE status = 'active' AND maturity_date IS NULL",
+    "ix_products_maturity_date": "products (maturity_date) WHERE maturity_date IS NOT NULL",
+    # 顧客別の保有参照（顧客詳細・顧客別集計・顧客指定の満期予定）
+    "ix_holdings_customer_id_status": "holdings (customer_id, status)",
+    # 経済イベント影響マッチング: 影響通貨・セクター配列のGIN、開催日、配分の軸・区分からの逆引き
+    "ix_economic_events_affected_currencies": "economic_events USING gin (affected_currencies)",
+    "ix_economic_events_affected_sectors": "economic_events USING gin (affected_sectors)",
+    "ix_economic_events_event_date": "economic_events (event_date, event_id)",
+    "ix_customer_portfolio_allocations_dimension_bucket": "customer_portfolio_allocations (dimension, bucket)",
+    "ix_products_currency": "products (currency)",
+    "ix_products_category_code": "products (category_code)",
+    "ix_holdings_active_product_id": "holdings (product_id) WHERE status = 'active'",
+    # 入金予測: 期間指定の一覧・顧客詳細用の複合インデックス
+    "ix_cash_inflows_predicted_date_sales_rep": "cash_inflows (predicted_date, sales_rep_id)",
+    "ix_cash_inflows_customer_predicted_date": "cash_inflows (customer_id, predicted_date)",
+}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for name, definition in INDEXES.items():
+            invalid = bind.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {"name": name}).first()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,108 @@
+"""ダッシュボード集計の分散（ストライプ）化と件数のトリガー維持
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+portfolio_stats を STATS_STRIPES 行に分散し、保有の書き込みが単一行のロックで直列化しないようにする。
+あわせて顧客・商品・営業メモ・経済イベントの件数も文単位トリガーで加減算し、ダッシュボードでの
+count(*) をなくす。加算先は接続（バックエンドPID）ごとの行で、アプリの apply_delta と同じ規則
+
+初回の集計はトリガー作成と同じトランザクションで行う（0001 の入金予測集計と同じく、作成中の
+書き込みはコミットまで待たされるため二重に加算されない）
+"""
+
+from alembic import op
+from backend.models.database import STATS_STRIPES, PORTFOLIO_STATS_REBUILD_SQL
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# 件数を維持するテーブル → portfolio_stats の列
+COUNTED_TABLES = {
+    "customers": "customers_count",
+    "products": "products_count",
+    "sales_notes": "sales_notes_count",
+    "economic_events": "economic_events_count",
+}
+
+COUNT_TRIGGERS = {
+    "insert": "AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows",
+    "delete": "AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows",
+    "truncate": "AFTER TRUNCATE ON {table}",
+}
+
+
+def upgrade():
+    # NOT NULL でも定数の既定値ならテーブルの書き換えを伴わない
+    for column in COUNTED_TABLES.values():
+        op.execute(f"ALTER TABLE portfolio_stats ADD COLUMN IF NOT EXISTS {column} integer NOT NULL DEFAULT 0")
+
+    op.execute(f"""
+    CREATE OR REPLACE FUNCTION portfolio_stats_count_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        stripe integer := pg_backend_pid() % {STATS_STRIPES};
+        delta bigint;
+        updated bigint;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            EXECUTE format('UPDATE portfolio_stats SET %I = 0', TG_ARGV[0]);
+            RETURN NULL;
+        ELSIF TG_OP = 'INSERT' THEN
+            SELECT count(*) INTO delta FROM new_rows;
+        ELSE
+            SELECT -count(*) INTO delta FROM old_rows;
+        END IF;
+        IF delta = 0 THEN
+            RETURN NULL;
+        END IF;
+        EXECUTE format('UPDATE portfolio_stats SET %1$I = %1$I + $1, updated_at = now() WHERE stats_id = $2',
+                       TG_ARGV[0]) USING delta, stripe;
+        GET DIAGNOSTICS updated = ROW_COUNT;
+        IF updated = 0 THEN
+            INSERT INTO portfolio_stats (stats_id, holdings_count, total_market_value, total_book_value,
+                                         customers_count, products_count, sales_notes_count, economic_events_count)
+            VALUES (stripe, 0, 0, 0, 0, 0, 0, 0)
+            ON CONFLICT (stats_id) DO NOTHING;
+            EXECUTE format('UPDATE portfolio_stats SET %1$I = %1$I + $1, updated_at = now() WHERE stats_id = $2',
+                           TG_ARGV[0]) USING delta, stripe;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """)
+    for table, column in COUNTED_TABLES.items():
+        for event, timing in COUNT_TRIGGERS.items():
+            name = f"{table}_stats_{event}"
+            op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            op.execute(f"CREATE TRIGGER {name} {timing.format(table=table)} "
+                       f"FOR EACH STATEMENT EXECUTE FUNCTION portfolio_stats_count_trigger('{column}')")
+
+    for statement in PORTFOLIO_STATS_REBUILD_SQL:
+        op.execute(statement)
+
+
+def downgrade():
+    for table in COUNTED_TABLES:
+        for event in COUNT_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_stats_{event} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS portfolio_stats_count_trigger()")
+    # 保有集計を分散前と同じく1行にまとめる
+    op.execute("""
+    UPDATE portfolio_stats SET
+        holdings_count = t.holdings_count,
+        total_market_value = t.total_market_value,
+        total_book_value = t.total_book_value
+    FROM (
+        SELECT sum(holdings_count) AS holdings_count, sum(total_market_value) AS total_market_value,
+               sum(total_book_value) AS total_book_value
+        FROM portfolio_stats
+    ) t
+    WHERE stats_id = 1
+    """)
+    op.execute("DELETE FROM portfolio_stats WHERE stats_id <> 1")
+    for column in COUNTED_TABLES.values():
+        op.execute(f"ALTER TABLE portfolio_stats DROP COLUMN IF EXISTS {column}")
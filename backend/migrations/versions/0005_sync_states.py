@@ -0,0 +1,25 @@
+"""外部マスタ同期の状態テーブル
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+商品同期の差分取得の基準時刻とETagをワーカーのメモリではなくDBに保持する
+（ワーカーごとに別の基準時刻で同期したり、再起動のたびに全件取得したりしないように）
+"""
+
+from alembic import op
+from backend.models.database import Base
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    Base.metadata.create_all(op.get_bind(), tables=[Base.metadata.tables["sync_states"]])
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS sync_states")
@@ -0,0 +1,58 @@
+"""入金予測集計の件数0の行を削除する
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+0001 の cash_inflow_buckets_merge は入金予測の削除・更新で件数を減算するだけで、件数が0になった
+行（予定日や状態の変更で移動した元の区分など）が残り続け、更新のたびに集計テーブルが大きくなる。
+減算した区分のうち件数が0になった行を同じ関数内で削除し、既存の0件の行も削除する
+"""
+
+from alembic import op
+from backend.models.database import CASH_INFLOW_BUCKET_COLUMNS, CASH_INFLOW_BUCKET_SELECT
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+BUCKET_KEYS = "period, bucket_start, customer_id, sales_rep_id, confidence_level, status"
+
+UPSERT_SQL = f"""
+    INSERT INTO cash_inflow_buckets AS b ({CASH_INFLOW_BUCKET_COLUMNS})
+    {CASH_INFLOW_BUCKET_SELECT.format(sign="direction", source="unnest(changed)")}
+    ON CONFLICT ({BUCKET_KEYS}) DO UPDATE SET
+        inflow_count = b.inflow_count + EXCLUDED.inflow_count,
+        predicted_amount = b.predicted_amount + EXCLUDED.predicted_amount,
+        actual_count = b.actual_count + EXCLUDED.actual_count,
+        actual_amount = b.actual_amount + EXCLUDED.actual_amount,
+        matched_predicted_amount = b.matched_predicted_amount + EXCLUDED.matched_predicted_amount,
+        abs_error_amount = b.abs_error_amount + EXCLUDED.abs_error_amount,
+        date_slip_days = b.date_slip_days + EXCLUDED.date_slip_days
+"""
+
+# 減算した区分（同じ集計SELECTのキー列）のうち件数が0になった行を削除
+DELETE_EMPTY_SQL = f"""
+    DELETE FROM cash_inflow_buckets b
+    USING ({CASH_INFLOW_BUCKET_SELECT.format(sign="direction", source="unnest(changed)")}) AS d({CASH_INFLOW_BUCKET_COLUMNS})
+    WHERE direction < 0 AND b.inflow_count = 0
+      AND ({", ".join(f"b.{key}" for key in BUCKET_KEYS.split(", "))}) = ({", ".join(f"d.{key}" for key in BUCKET_KEYS.split(", "))})
+"""
+
+def create_merge_function(body: str) -> None:
+    op.execute(f"""
+    CREATE OR REPLACE FUNCTION cash_inflow_buckets_merge(changed cash_inflows[], direction integer) RETURNS void
+    LANGUAGE sql AS $$
+        {body}
+    $$
+    """)
+
+
+def upgrade():
+    create_merge_function(f"{UPSERT_SQL};\n{DELETE_EMPTY_SQL}")
+    op.execute("DELETE FROM cash_inflow_buckets WHERE inflow_count = 0")
+
+
+def downgrade():
+    create_merge_function(UPSERT_SQL)
@@ -3,21 +3,94 @@ WealthAI データベースモデル定義
 SQLAlchemyを使用したORMモデル
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Boolean, DECIMAL, Text, ForeignKey, ARRAY
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Date, DateTime, Boolean, DECIMAL, Text, ForeignKey, ARRAY, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import logging
 import os
+import time
 from dotenv import load_dotenv
+from ..utils.metrics import registry
+from ..utils import query_counter
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # データベース接続設定
-DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+DATABASE_DSN = f"{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+DATABASE_URL = f"postgresql+psycopg2://{DATABASE_DSN}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_DSN}"
+
+# コネクションプール設定（環境変数で上書き可能）
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 20))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "wealthai-crm")
+
+POOL_OPTIONS = {
+    "pool_size": POOL_SIZE,
+    "max_overflow": POOL_MAX_OVERFLOW,
+    "pool_timeout": POOL_TIMEOUT,
+    "pool_recycle": POOL_RECYCLE,
+    "pool_pre_ping": POOL_PRE_PING,
+}
 
-engine = create_engine(DATABASE_URL)
+# 同期エンジン（スクリプト・バッチ処理用）
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={
+        "application_name": f"{APPLICATION_NAME}-sync",
+        "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+    },
+    **POOL_OPTIONS
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 非同期エンジン（FastAPIルート用）
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={
+        "server_settings": {
+            "application_name": APPLICATION_NAME,
+            "statement_timeout": str(STATEMENT_TIMEOUT_MS),
+        },
+    },
+    **POOL_OPTIONS
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# プールメトリクス（/metrics で公開）
+POOLS = {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+
+def _pool_values(read):
+    return [({"engine": name}, read(pool)) for name, pool in POOLS.items()]
+
+registry.gauge("db_pool_size", "Configured pool size", lambda: _pool_values(lambda pool: pool.size()))
+registry.gauge("db_pool_checked_out", "Connections currently checked out", lambda: _pool_values(lambda pool: pool.checkedout()))
+registry.gauge("db_pool_idle", "Idle connections in the pool", lambda: _pool_values(lambda pool: pool.checkedin()))
+registry.gauge("db_pool_overflow", "Current overflow connections", lambda: _pool_values(lambda pool: max(pool.overflow(), 0)))
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds", "Time to acquire a connection (pool wait + connect + pre-ping)"
+)
+POOL_CONNECTS = registry.counter("db_pool_connects_total", "New physical connections opened")
+POOL_INVALIDATIONS = registry.counter("db_pool_invalidations_total", "Connections invalidated (stale/failover)")
+POOL_TIMEOUTS = registry.counter("db_pool_timeouts_total", "Checkouts that timed out waiting for the pool")
+
+ENGINE_NAMES = {engine: "sync", async_engine.sync_engine: "async"}
+
+for _engine, _name in ENGINE_NAMES.items():
+    query_counter.install(_engine)
+    event.listen(_engine, "connect", lambda *args, _name=_name: POOL_CONNECTS.inc(engine=_name))
+    event.listen(_engine, "invalidate", lambda *args, _name=_name: POOL_INVALIDATIONS.inc(engine=_name))
 Base = declarative_base()
 
 # 営業担当者モデル
@@ -160,8 +233,238 @@ class EconomicEvent(Base):
     affected_currencies = Column(ARRAY(String(50)))
     created_at = Column(DateTime, server_default=func.now())
 
-# データベースセッション取得関数
-def get_db():
+# ダッシュボード集計の分散行数（同時の書き込みが1行のロックで直列化しないよう接続ごとに別の行へ加算する）
+STATS_STRIPES = 16
+
+# ポートフォリオ集計モデル（ダッシュボード用の件数・保有集計。全行の合計が全体の値）
+# stats_id はストライプ番号。件数は各テーブルのトリガー、保有の評価額・簿価はアプリが差分を加算する
+class PortfolioStats(Base):
+    __tablename__ = "portfolio_stats"
+    
+    stats_id = Column(Integer, primary_key=True)
+    holdings_count = Column(Integer, nullable=False, default=0)
+    total_market_value = Column(DECIMAL(20,2), nullable=False, default=0)
+    total_book_value = Column(DECIMAL(20,2), nullable=False, default=0)
+    customers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    products_count = Column(Integer, nullable=False, default=0, server_default="0")
+    sales_notes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    economic_events_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+# 顧客別ポートフォリオ集計モデル（アクティブ保有の評価額・簿価）
+class CustomerPortfolio(Base):
+    __tablename__ = "customer_portfolios"
+    
+    customer_id = Column(Integer, ForeignKey("customers.customer_id", ondelete="CASCADE"), primary_key=True)
+    holdings_count = Column(Integer, nullable=False, default=0)
+    total_market_value = Column(DECIMAL(20,2), nullable=False, default=0)
+    total_book_value = Column(DECIMAL(20,2), nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+# 顧客別資産配分モデル（dimension: category / currency）
+class CustomerPortfolioAllocation(Base):
+    __tablename__ = "customer_portfolio_allocations"
+    
+    customer_id = Column(Integer, ForeignKey("customers.customer_id", ondelete="CASCADE"), primary_key=True)
+    dimension = Column(String(20), primary_key=True)
+    bucket = Column(String(50), primary_key=True)
+    holdings_count = Column(Integer, nullable=False, default=0)
+    market_value = Column(DECIMAL(20,2), nullable=False, default=0)
+    book_value = Column(DECIMAL(20,2), nullable=False, default=0)
+
+# 入金予測の期間別集計モデル（週・月 × 顧客 × 担当者 × 確度 × ステータス、トリガーで差分維持）
+class CashInflowBucket(Base):
+    __tablename__ = "cash_inflow_buckets"
+    
+    period = Column(String(10), primary_key=True)
+    bucket_start = Column(Date, primary_key=True)
+    customer_id = Column(Integer, primary_key=True)  # 0 = 顧客未設定
+    sales_rep_id = Column(Integer, primary_key=True)  # 0 = 担当者未設定
+    confidence_level = Column(String(20), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    inflow_count = Column(Integer, nullable=False, default=0)
+    predicted_amount = Column(BigInteger, nullable=False, default=0)
+    actual_count = Column(Integer, nullable=False, default=0)
+    actual_amount = Column(BigInteger, nullable=False, default=0)
+    matched_predicted_amount = Column(BigInteger, nullable=False, default=0)  # 実績のある予測の予測額合計
+    abs_error_amount = Column(BigInteger, nullable=False, default=0)
+    date_slip_days = Column(BigInteger, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_cash_inflow_buckets_rep", "period", "sales_rep_id", "bucket_start"),
+    )
+
+# 外部マスタ同期の状態（複数ワーカーで共有する差分取得の基準時刻とETag）
+class SyncState(Base):
+    __tablename__ = "sync_states"
+    
+    source = Column(String(50), primary_key=True)
+    synced_at = Column(DateTime)  # 差分取得（updated_since）の基準時刻
+    etag = Column(Text)  # 結果全体が1ページに収まった取得のETag（それ以外はNULL）
+    etag_since = Column(String(40))  # etag を取得したときの updated_since（NULL = 全件）
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+# cash_inflows の行集合（source）を期間別集計の加算値（sign=-1なら減算値）に変換するSELECT
+CASH_INFLOW_BUCKET_SELECT = """
+    SELECT p.period, date_trunc(p.period, r.predicted_date)::date,
+           coalesce(r.customer_id, 0), coalesce(r.sales_rep_id, 0),
+           coalesce(r.confidence_level, ''), coalesce(r.status, ''),
+           {sign} * count(*),
+           {sign} * sum(r.predicted_amount),
+           {sign} * count(r.actual_amount),
+           {sign} * coalesce(sum(r.actual_amount), 0),
+           {sign} * coalesce(sum(r.predicted_amount) FILTER (WHERE r.actual_amount IS NOT NULL), 0),
+           {sign} * coalesce(sum(abs(r.actual_amount - r.predicted_amount)), 0),
+           {sign} * coalesce(sum(abs(r.actual_date - r.predicted_date)), 0)
+    FROM {source} AS r, (VALUES ('week'), ('month')) AS p(period)
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+CASH_INFLOW_BUCKET_COLUMNS = (
+    "period, bucket_start, customer_id, sales_rep_id, confidence_level, status, "
+    "inflow_count, predicted_amount, actual_count, actual_amount, "
+    "matched_predicted_amount, abs_error_amount, date_slip_days"
+)
+
+# ダッシュボード集計を作り直すSQL（順に実行）。全ストライプ行をロックして実行中の加算の完了を待ってから
+# 数え直し、ストライプ0に合計、それ以外に0を置く（マイグレーション・インポート・評価替えで使用）
+PORTFOLIO_STATS_REBUILD_SQL = (
+    f"""
+    INSERT INTO portfolio_stats (stats_id, holdings_count, total_market_value, total_book_value,
+                                 customers_count, products_count, sales_notes_count, economic_events_count)
+    SELECT stripe, 0, 0, 0, 0, 0, 0, 0 FROM generate_series(0, {STATS_STRIPES - 1}) AS stripe
+    ON CONFLICT (stats_id) DO NOTHING
+    """,
+    "SELECT stats_id FROM portfolio_stats ORDER BY stats_id FOR UPDATE",
+    """
+    UPDATE portfolio_stats s SET
+        holdings_count = CASE WHEN s.stats_id = 0 THEN t.holdings_count ELSE 0 END,
+        total_market_value = CASE WHEN s.stats_id = 0 THEN t.total_market_value ELSE 0 END,
+        total_book_value = CASE WHEN s.stats_id = 0 THEN t.total_book_value ELSE 0 END,
+        customers_count = CASE WHEN s.stats_id = 0 THEN t.customers_count ELSE 0 END,
+        products_count = CASE WHEN s.stats_id = 0 THEN t.products_count ELSE 0 END,
+        sales_notes_count = CASE WHEN s.stats_id = 0 THEN t.sales_notes_count ELSE 0 END,
+        economic_events_count = CASE WHEN s.stats_id = 0 THEN t.economic_events_count ELSE 0 END,
+        updated_at = now()
+    FROM (
+        SELECT count(*) AS holdings_count,
+               coalesce(sum(current_value), 0) AS total_market_value,
+               coalesce(sum(quantity * unit_price), 0) AS total_book_value,
+               (SELECT count(*) FROM customers) AS customers_count,
+               (SELECT count(*) FROM products) AS products_count,
+               (SELECT count(*) FROM sales_notes) AS sales_notes_count,
+               (SELECT count(*) FROM economic_events) AS economic_events_count
+        FROM holdings
+    ) t
+    """,
+)
+
+# 顧客別ポートフォリオ集計（有効な保有のみ。配分は商品カテゴリ・通貨の2軸で、NULLは 'UNKNOWN'）
+# {customer_filter} は顧客ID列に続ける条件: 全顧客は ALL_CUSTOMERS、指定顧客は SELECTED_CUSTOMERS（:customer_ids）
+ALL_CUSTOMERS = "IS NOT NULL"
+SELECTED_CUSTOMERS = "= ANY(:customer_ids)"
+
+# 顧客ごとの保有件数・評価額・簿価（保有の無い顧客は0件の行）
+CUSTOMER_PORTFOLIO_SUMMARY_SELECT = """
+    SELECT c.customer_id, count(h.holding_id) AS holdings_count,
+           coalesce(sum(h.current_value), 0) AS total_market_value,
+           coalesce(sum(h.quantity * h.unit_price), 0) AS total_book_value
+    FROM customers c
+    LEFT JOIN holdings h ON h.customer_id = c.customer_id AND h.status = 'active'
+    WHERE c.customer_id {customer_filter}
+    GROUP BY c.customer_id
+"""
+
+# 顧客×配分軸×区分ごとの保有件数・評価額・簿価
+CUSTOMER_PORTFOLIO_ALLOCATION_SELECT = """
+    SELECT h.customer_id, d.dimension,
+           coalesce(CASE d.dimension WHEN 'category' THEN p.category_code ELSE p.currency END, 'UNKNOWN') AS bucket,
+           count(*) AS holdings_count,
+           coalesce(sum(h.current_value), 0) AS market_value,
+           coalesce(sum(h.quantity * h.unit_price), 0) AS book_value
+    FROM holdings h
+    JOIN products p ON p.product_id = h.product_id
+    CROSS JOIN (VALUES ('category'), ('currency')) AS d(dimension)
+    WHERE h.status = 'active' AND h.customer_id {customer_filter}
+    GROUP BY 1, 2, 3
+"""
+
+# 顧客別ポートフォリオ集計を保有から作り直すSQL（順に実行。アプリの再集計とインポートで使用）
+# 概要は顧客ごとに1行のため upsert、配分は区分の増減があるため削除して作り直す
+CUSTOMER_PORTFOLIO_REFRESH_SQL = (
+    f"""
+    INSERT INTO customer_portfolios (customer_id, holdings_count, total_market_value, total_book_value)
+    {CUSTOMER_PORTFOLIO_SUMMARY_SELECT}
+    ON CONFLICT (customer_id) DO UPDATE SET
+        holdings_count = excluded.holdings_count,
+        total_market_value = excluded.total_market_value,
+        total_book_value = excluded.total_book_value,
+        updated_at = now()
+    """,
+    "DELETE FROM customer_portfolio_allocations WHERE customer_id {customer_filter}",
+    f"""
+    INSERT INTO customer_portfolio_allocations
+        (customer_id, dimension, bucket, holdings_count, market_value, book_value)
+    {CUSTOMER_PORTFOLIO_ALLOCATION_SELECT}
+    """,
+)
+
+# 営業メモ全文検索: 日本語向けに空白除去後の文字bigramを'simple'辞書でtsvector化する関数
+# （マイグレーションとベンチマークで使用。定義を変える場合は新しいマイグレーションで再作成する）
+CRM_BIGRAMS_FUNCTION = """
+    CREATE OR REPLACE FUNCTION crm_bigrams(txt text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT CASE WHEN char_length(t) < 2 THEN t
+                    ELSE (SELECT string_agg(substr(t, i, 2), ' ' ORDER BY i)
+                          FROM generate_series(1, char_length(t) - 1) AS i)
+               END
+        FROM (SELECT lower(regexp_replace(coalesce(txt, ''), '[[:space:]]+', '', 'g')) AS t) s
+    $$
+"""
+
+# マイグレーション設定（関数・トリガー・インデックス・既存データの補完は起動時ではなく
+# `alembic upgrade head` で適用する。backend/migrations を参照）
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic.ini")
+
+def _pending_migrations(sync_conn) -> bool:
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    heads = set(ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_heads())
+    return set(MigrationContext.configure(sync_conn).get_current_heads()) != heads
+
+# スキーマ初期化（未作成のテーブルのみ作成。既存テーブルへのDDLは実行しない）
+async def init_db():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        if await conn.run_sync(_pending_migrations):
+            logger.warning("Database schema is not at the latest migration; run `alembic upgrade head`")
+
+# 接続取得までの待ち時間を計測（プール枯渇の検知用）。セッションは最初のSQL実行時に
+# トランザクションを開始して接続を取得するため、その開始（after_transaction_create）から
+# 接続上での BEGIN（after_begin）までを計る
+@event.listens_for(Session, "after_transaction_create")
+def _on_transaction_create(session, transaction):
+    if transaction.parent is None:
+        session.info["checkout_started"] = time.perf_counter()
+
+@event.listens_for(Session, "after_begin")
+def _on_begin(session, transaction, connection):
+    started = session.info.pop("checkout_started", None)
+    if started is not None:
+        POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, engine=ENGINE_NAMES.get(connection.engine, "other"))
+
+# データベースセッション取得関数（非同期・FastAPIルート用）
+# 接続はSQLを実行するまで取得しない（キャッシュから応答するリクエストはプールを使わない）
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(engine="async")
+            raise
+
+# データベースセッション取得関数（同期・スクリプト用）
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,201 @@
+"""
+顧客・保有商品の一括登録サービス
+重複・参照先の存在チェックを集合演算のSELECT1回ずつで行い、有効行を1トランザクションでバッチINSERTする
+行単位のエラーは入力順のインデックス付きで返す
+"""
+
+import time
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from sqlalchemy import any_, bindparam, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Customer, Holding, Product, SalesRepresentative
+from .stats_service import stats_service
+from .portfolio_service import portfolio_service
+
+# 1リクエストあたりの上限行数
+MAX_BULK_ROWS = 50000
+
+# (入力インデックス, 行データ) のリスト
+IndexedRows = List[Tuple[int, Dict]]
+
+def holding_values(row: Dict) -> Dict:
+    """HoldingCreate 相当の辞書を holdings の列に変換
+
+    purchase_price は取得単価（unit_price）として保存し、評価額は現在単価（無ければ取得単価）で計算する
+    """
+    quantity = Decimal(str(row["quantity"]))
+    unit_price = Decimal(str(row["purchase_price"]))
+    current_price = Decimal(str(row["current_price"])) if row.get("current_price") is not None else None
+    current_value = quantity * (current_price or unit_price)
+    return {
+        "customer_id": row["customer_id"],
+        "product_id": row["product_id"],
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "purchase_date": row["purchase_date"],
+        "current_price": current_price,
+        "current_value": current_value,
+        "unrealized_gain_loss": current_value - quantity * unit_price,
+        "maturity_date": row.get("maturity_date"),
+        "status": "active",
+    }
+
+def _result(total: int, ids: Dict[int, int], errors: List[Dict], started: float, committed: bool) -> Dict:
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "success" if not errors else ("partial" if ids else "failed"),
+        "committed": committed,
+        "received_count": total,
+        "inserted_count": len(ids),
+        "error_count": len(errors),
+        "ids": [ids.get(index) for index in range(total)],
+        "errors": sorted(errors, key=lambda error: error["index"]),
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_second": round(len(ids) / elapsed, 1) if elapsed and ids else 0,
+    }
+
+class BulkWriteService:
+    """顧客・保有商品の一括登録"""
+
+    def __init__(self, batch_size: int = 1000):
+        # INSERTの1文あたりの行数（asyncpgのパラメータ数上限 32767 に収まる値）
+        self.batch_size = batch_size
+
+    async def _existing_ids(self, db: AsyncSession, column, values) -> set:
+        """指定値のうちテーブルに存在するものを1回のSELECTで取得
+
+        数万件でもバインドパラメータ数の上限に当たらないよう、IN (...) ではなく配列1個の = ANY で渡す
+        """
+        values = list(values)
+        if not values:
+            return set()
+        candidates = bindparam("candidates", values, type_=ARRAY(column.type))
+        return set((await db.scalars(select(column).where(column == any_(candidates)))).all())
+
+    async def create_customers(self, db: AsyncSession, rows: IndexedRows, total: int,
+                               errors: List[Dict], all_or_nothing: bool = False) -> Dict:
+        """検証済みの顧客行を一括登録
+
+        rows: (入力インデックス, CustomerCreate相当の辞書)。sales_rep は担当者コードまたは氏名
+        errors: 呼び出し側での検証エラー（ここで検出したエラーを追記する）
+        """
+        started = time.perf_counter()
+
+        # バッチ内の重複は先勝ち
+        seen, unique_rows = set(), []
+        for index, row in rows:
+            if row["customer_code"] in seen:
+                errors.append({"index": index, "detail": f"Duplicate customer_code in batch: {row['customer_code']}"})
+            else:
+                seen.add(row["customer_code"])
+                unique_rows.append((index, row))
+
+        existing_codes = await self._existing_ids(db, Customer.customer_code, seen)
+
+        # 担当者はコード・氏名のどちらでも指定可（1回のSELECTで解決）
+        rep_keys = {row["sales_rep"] for _, row in unique_rows if row.get("sales_rep")}
+        rep_ids = {}
+        if rep_keys:
+            keys = bindparam("rep_keys", list(rep_keys), type_=ARRAY(SalesRepresentative.rep_code.type))
+            for rep in (await db.execute(
+                select(SalesRepresentative.rep_id, SalesRepresentative.rep_code, SalesRepresentative.name)
+                .where(or_(SalesRepresentative.rep_code == any_(keys), SalesRepresentative.name == any_(keys)))
+            )).all():
+                rep_ids.setdefault(rep.rep_code, rep.rep_id)
+                rep_ids.setdefault(rep.name, rep.rep_id)
+
+        values, index_of_code = [], {}
+        for index, row in unique_rows:
+            code = row["customer_code"]
+            if code in existing_codes:
+                errors.append({"index": index, "detail": f"Customer code already exists: {code}"})
+                continue
+            sales_rep = row.get("sales_rep")
+            if sales_rep and sales_rep not in rep_ids:
+                errors.append({"index": index, "detail": f"Unknown sales_rep: {sales_rep}"})
+                continue
+            values.append({
+                "customer_code": code,
+                "name": row["name"],
+                "name_kana": row.get("name_kana"),
+                "birth_date": row.get("birth_date"),
+                "occupation": row.get("occupation"),
+                "annual_income": int(row["annual_income"]) if row.get("annual_income") is not None else None,
+                "net_worth": int(row["net_worth"]) if row.get("net_worth") is not None else None,
+                "risk_tolerance": str(row["risk_tolerance"]) if row.get("risk_tolerance") is not None else None,
+                "investment_experience": row.get("investment_experience"),
+                "sales_rep_id": rep_ids.get(sales_rep),
+            })
+            index_of_code[code] = index
+
+        if errors and all_or_nothing:
+            await db.rollback()
+            return _result(total, {}, errors, started, committed=False)
+
+        ids = {}
+        for start in range(0, len(values), self.batch_size):
+            # 同時実行された登録との競合は ON CONFLICT で行エラーに落とす
+            stmt = (
+                pg_insert(Customer)
+                .on_conflict_do_nothing(index_elements=[Customer.customer_code])
+                .returning(Customer.customer_id, Customer.customer_code)
+            )
+            for customer_id, code in (await db.execute(stmt, values[start:start + self.batch_size])).all():
+                ids[index_of_code[code]] = customer_id
+        for code, index in index_of_code.items():
+            if index not in ids:
+                errors.append({"index": index, "detail": f"Customer code already exists: {code}"})
+
+        if errors and all_or_nothing:
+            await db.rollback()
+            return _result(total, {}, errors, started, committed=False)
+        await db.commit()
+        return _result(total, ids, errors, started, committed=True)
+
+    async def create_holdings(self, db: AsyncSession, rows: IndexedRows, total: int,
+                              errors: List[Dict], all_or_nothing: bool = False) -> Dict:
+        """検証済みの保有行を一括登録し、集計（portfolio_stats・顧客別）を同じトランザクションで更新
+
+        rows: (入力インデックス, HoldingCreate相当の辞書)。列への変換は holding_values
+        """
+        started = time.perf_counter()
+        customer_ids = await self._existing_ids(db, Customer.customer_id, {row["customer_id"] for _, row in rows})
+        product_ids = await self._existing_ids(db, Product.product_id, {row["product_id"] for _, row in rows})
+
+        values, indexes = [], []
+        count, market_total, book_total = 0, Decimal("0"), Decimal("0")
+        for index, row in rows:
+            if row["customer_id"] not in customer_ids:
+                errors.append({"index": index, "detail": f"Customer not found: {row['customer_id']}"})
+                continue
+            if row["product_id"] not in product_ids:
+                errors.append({"index": index, "detail": f"Product not found: {row['product_id']}"})
+                continue
+            value = holding_values(row)
+            values.append(value)
+            indexes.append(index)
+            count += 1
+            market_total += value["current_value"]
+            book_total += value["quantity"] * value["unit_price"]
+
+        if errors and all_or_nothing:
+            await db.rollback()
+            return _result(total, {}, errors, started, committed=False)
+
+        ids = {}
+        for start in range(0, len(values), self.batch_size):
+            stmt = pg_insert(Holding).returning(Holding.holding_id, sort_by_parameter_order=True)
+            batch_ids = (await db.scalars(stmt, values[start:start + self.batch_size])).all()
+            ids.update(zip(indexes[start:start + self.batch_size], batch_ids))
+
+        if values:
+            await stats_service.apply_delta(db, count, market_total, book_total)
+            await portfolio_service.refresh(db, {value["customer_id"] for value in values})
+        await db.commit()
+        return _result(total, ids, errors, started, committed=True)
+
+# シングルトンインスタンス
+bulk_write_service = BulkWriteService()
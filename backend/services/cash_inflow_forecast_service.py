@@ -0,0 +1,148 @@
+"""
+入金予測サービス
+期間別集計テーブル（cash_inflow_buckets）から、確度で重み付けした入金見込額を週・月単位で集計し、
+同じ集計で予測と実績の精度（誤差率・バイアス・入金日のずれ）も算出する
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Optional
+from sqlalchemy import case, delete, func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import (
+    Customer, SalesRepresentative, CashInflowBucket,
+    CASH_INFLOW_BUCKET_COLUMNS, CASH_INFLOW_BUCKET_SELECT,
+)
+
+# 確度ごとの入金見込みの重み（確度未設定・不明は DEFAULT_CONFIDENCE_WEIGHT）
+CONFIDENCE_WEIGHTS = {"high": 0.9, "medium": 0.6, "low": 0.3}
+DEFAULT_CONFIDENCE_WEIGHT = 0.5
+
+# 見込額から除外するステータス
+EXCLUDED_STATUSES = ("cancelled",)
+
+PERIODS = ("week", "month")
+GROUP_BY_OPTIONS = ("none", "sales_rep", "customer")
+
+REBUILD_SQL = text(
+    f"INSERT INTO cash_inflow_buckets ({CASH_INFLOW_BUCKET_COLUMNS}) "
+    + CASH_INFLOW_BUCKET_SELECT.format(sign=1, source="cash_inflows")
+)
+
+def bucket_start_of(day: date, period: str) -> date:
+    """日付を含む週（月曜始まり、date_trunc('week')と同じ）または月の初日"""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def _ratio(numerator, denominator) -> Optional[float]:
+    return float(numerator) / float(denominator) if denominator else None
+
+class CashInflowForecastService:
+    """確度加重の入金見込み・予実精度の集計"""
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        """期間別集計を cash_inflows から作り直す（通常はトリガーで差分維持、コミットは呼び出し側）"""
+        await db.execute(delete(CashInflowBucket))
+        await db.execute(REBUILD_SQL)
+
+    async def forecast(self, db: AsyncSession, period: str = "month", group_by: str = "none",
+                       date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       sales_rep_id: Optional[int] = None, customer_id: Optional[int] = None) -> Dict:
+        bucket = CashInflowBucket
+        active = bucket.status.notin_(EXCLUDED_STATUSES)
+        # 重みは数値リテラルで埋め込む（バインド変数だと bigint * $n の型推論で整数扱いになるため）
+        weight = case(
+            {level: literal_column(repr(value)) for level, value in CONFIDENCE_WEIGHTS.items()},
+            value=bucket.confidence_level,
+            else_=literal_column(repr(DEFAULT_CONFIDENCE_WEIGHT)),
+        )
+
+        group_columns = [bucket.bucket_start]
+        label_column = None
+        if group_by == "sales_rep":
+            group_columns.append(bucket.sales_rep_id)
+            label_column = SalesRepresentative.name
+        elif group_by == "customer":
+            group_columns.append(bucket.customer_id)
+            label_column = Customer.name
+
+        stmt = select(
+            *group_columns,
+            *([label_column.label("label")] if label_column is not None else []),
+            func.sum(bucket.inflow_count).filter(active).label("inflow_count"),
+            func.sum(bucket.predicted_amount).filter(active).label("predicted_amount"),
+            func.sum(bucket.predicted_amount * weight).filter(active).label("expected_amount"),
+            func.sum(bucket.inflow_count).filter(~active).label("cancelled_count"),
+            func.sum(bucket.actual_count).label("actual_count"),
+            func.sum(bucket.actual_amount).label("actual_amount"),
+            func.sum(bucket.matched_predicted_amount).label("matched_predicted_amount"),
+            func.sum(bucket.abs_error_amount).label("abs_error_amount"),
+            func.sum(bucket.date_slip_days).label("date_slip_days"),
+        ).where(bucket.period == period)
+        if group_by == "sales_rep":
+            stmt = stmt.outerjoin(SalesRepresentative, SalesRepresentative.rep_id == bucket.sales_rep_id)
+        elif group_by == "customer":
+            stmt = stmt.outerjoin(Customer, Customer.customer_id == bucket.customer_id)
+
+        # 期間の途中の日付は、その日を含むバケットから対象にする
+        if date_from is not None:
+            stmt = stmt.where(bucket.bucket_start >= bucket_start_of(date_from, period))
+        if date_to is not None:
+            stmt = stmt.where(bucket.bucket_start <= date_to)
+        if sales_rep_id is not None:
+            stmt = stmt.where(bucket.sales_rep_id == sales_rep_id)
+        if customer_id is not None:
+            stmt = stmt.where(bucket.customer_id == customer_id)
+        if label_column is not None:
+            group_columns.append(label_column)
+        stmt = stmt.group_by(*group_columns).order_by(*group_columns[:2])
+
+        rows = (await db.execute(stmt)).all()
+        buckets = []
+        totals = dict.fromkeys((
+            "inflow_count", "predicted_amount", "expected_amount", "cancelled_count", "actual_count",
+            "actual_amount", "matched_predicted_amount", "abs_error_amount", "date_slip_days",
+        ), 0)
+        for row in rows:
+            values = {key: row._mapping[key] or 0 for key in totals}
+            for key, value in values.items():
+                totals[key] += value
+            item = {"bucket_start": row.bucket_start}
+            if group_by == "sales_rep":
+                item.update(sales_rep_id=row.sales_rep_id or None, sales_rep_name=row.label)
+            elif group_by == "customer":
+                item.update(customer_id=row.customer_id or None, customer_name=row.label)
+            item.update(self._figures(values))
+            buckets.append(item)
+
+        return {
+            "period": period,
+            "group_by": group_by,
+            "date_from": date_from,
+            "date_to": date_to,
+            "confidence_weights": {**CONFIDENCE_WEIGHTS, "default": DEFAULT_CONFIDENCE_WEIGHT},
+            "buckets": buckets,
+            "totals": self._figures(totals),
+        }
+
+    @staticmethod
+    def _figures(values: Dict) -> Dict:
+        """集計値をレスポンス形式に変換し、予実精度の指標を付与"""
+        matched = values["matched_predicted_amount"]
+        return {
+            "inflow_count": int(values["inflow_count"]),
+            "cancelled_count": int(values["cancelled_count"]),
+            "predicted_amount": int(values["predicted_amount"]),
+            "expected_amount": round(float(values["expected_amount"])),
+            "actual_count": int(values["actual_count"]),
+            "actual_amount": int(values["actual_amount"]),
+            "accuracy": {
+                # 実績のある予測について: 絶対誤差率（WAPE）・バイアス（実績/予測 - 1）・入金日の平均ずれ
+                "weighted_abs_error_rate": _ratio(values["abs_error_amount"], matched),
+                "bias": _ratio(values["actual_amount"] - matched, matched),
+                "mean_date_slip_days": _ratio(values["date_slip_days"], values["actual_count"]),
+            },
+        }
+
+# シングルトンインスタンス
+cash_inflow_forecast_service = CashInflowForecastService()
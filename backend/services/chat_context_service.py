@@ -0,0 +1,190 @@
+"""
+AIチャット用コンテキストサービス
+顧客ごとのコンテキスト（属性・資産概要・資産配分・営業メモ抜粋）をシステムプロンプト用の
+テキストに整形してキャッシュし、会話履歴はトークン予算内に収まるよう古いやり取りを要約する
+
+コンテキストは保有・営業メモ・顧客情報の更新時に invalidate() で破棄する
+（インポート等アプリ外の更新は CHAT_CONTEXT_CACHE_TTL で期限切れになる）
+
+読み込みは同一顧客の同時リクエストで合流し、呼び出し元が切断しても続行するため、
+リクエストのセッションではなく読み込み専用のセッションで行う
+"""
+
+import os
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import AsyncSessionLocal, Customer, SalesNote
+from ..utils.cache import AsyncTTLCache
+from .portfolio_service import portfolio_service
+
+# 会話履歴（直近のやり取り）のトークン予算と、それより古いやり取りの要約の予算
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 2000))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", 300))
+# 予算内でもそのまま送る最大往復数
+MAX_RECENT_TURNS = 10
+
+# 資産配分・営業メモの掲載量
+ALLOCATION_TOP_N = 5
+NOTE_EXCERPT_CHARS = 200
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（英数字は約4文字で1トークン、日本語等は1文字1トークンとして多めに見積もる）"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    """要約用に最初の文を取り出し、長ければ切り詰める"""
+    text = " ".join((text or "").split())
+    for delimiter in ("。", "？", "！", "?", "!", ". "):
+        index = text.find(delimiter)
+        if 0 <= index < max_chars:
+            return text[:index + len(delimiter)].strip()
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    # 1文字1トークンとみなして保守的に切り詰める
+    return text[:max(budget - 1, 0)] + "…"
+
+def compact_history(history: Optional[List[Dict]], budget: int = HISTORY_TOKEN_BUDGET,
+                    summary_budget: int = SUMMARY_TOKEN_BUDGET) -> Tuple[List[Dict], Optional[str]]:
+    """会話履歴を (そのまま送る直近のやり取り, それより古いやり取りの要約) に分ける
+
+    直近から予算に収まる分（最大 MAX_RECENT_TURNS 往復）を残し、古いものは各往復の最初の文だけを
+    箇条書きにした要約にする（要約のためにモデルを呼び出さないので追加の遅延・コストはない）
+    """
+    if not history:
+        return [], None
+
+    recent: List[Dict] = []
+    used = 0
+    for item in reversed(history):
+        user_message = item.get("user_message", "")
+        assistant_message = item.get("assistant_message", "")
+        cost = estimate_tokens(user_message) + estimate_tokens(assistant_message)
+        if len(recent) >= MAX_RECENT_TURNS or (recent and used + cost > budget):
+            break
+        if not recent and cost > budget:
+            # 直前のやり取りだけで予算を超える場合は応答側を切り詰めて残す
+            assistant_message = _truncate_to_tokens(assistant_message, max(budget - estimate_tokens(user_message), 0))
+            cost = budget
+        recent.append({"user_message": user_message, "assistant_message": assistant_message})
+        used += cost
+    recent.reverse()
+
+    older = history[:len(history) - len(recent)]
+    if not older:
+        return recent, None
+    lines: List[str] = []
+    used = 0
+    # 新しい順に予算まで採用し、入りきらない古いものは件数のみ記載
+    for item in reversed(older):
+        line = (f"- Q: {_first_sentence(item.get('user_message', ''), 60)} "
+                f"/ A: {_first_sentence(item.get('assistant_message', ''), 80)}")
+        cost = estimate_tokens(line)
+        if used + cost > summary_budget:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    omitted = len(older) - len(lines)
+    if omitted:
+        lines.insert(0, f"- （さらに前の{omitted}件のやり取りは省略）")
+    return recent, "\n".join(lines)
+
+def _age(birth_date: Optional[date], today: date) -> Optional[int]:
+    if birth_date is None:
+        return None
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+def _allocation_text(allocation: List[Dict]) -> str:
+    return "、".join(
+        f"{item['bucket']} {item['weight'] * 100:.0f}%"
+        for item in allocation[:ALLOCATION_TOP_N] if item.get("weight") is not None
+    ) or "N/A"
+
+class ChatContextService:
+    """顧客コンテキストの組み立てとキャッシュ"""
+
+    def __init__(self):
+        # 更新時は invalidate() で破棄するため、期限切れの値は返さずに読み込み直す（stale_ttl=0）
+        self.cache = AsyncTTLCache(
+            maxsize=int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("CHAT_CONTEXT_CACHE_TTL", 600)),
+            stale_ttl=0,
+        )
+
+    def invalidate(self, customer_ids: Optional[Iterable[Optional[int]]] = None) -> None:
+        """指定顧客（省略時は全件）のコンテキストを破棄"""
+        if customer_ids is None:
+            self.cache.invalidate()
+            return
+        for customer_id in customer_ids:
+            if customer_id is not None:
+                self.cache.invalidate(customer_id)
+
+    async def get(self, customer_id: int) -> Dict:
+        """顧客コンテキスト（キャッシュ済みならDBアクセスなし）"""
+        context = await self.cache.get_or_load(customer_id, lambda: self._load(customer_id))
+        if context is None:
+            self.cache.invalidate(customer_id)
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return context
+
+    async def _load(self, customer_id: int) -> Optional[Dict]:
+        async with AsyncSessionLocal() as db:
+            return await self._build(db, customer_id)
+
+    async def _build(self, db: AsyncSession, customer_id: int) -> Optional[Dict]:
+        row = (await db.execute(
+            select(
+                Customer.name, Customer.birth_date, Customer.occupation,
+                Customer.investment_experience, Customer.risk_tolerance, SalesNote.content,
+            )
+            .outerjoin(SalesNote, SalesNote.customer_id == Customer.customer_id)
+            .where(Customer.customer_id == customer_id)
+        )).first()
+        if row is None:
+            return None
+        portfolio = await portfolio_service.get_portfolio(db, customer_id) or {}
+        age = _age(row.birth_date, date.today())
+        total_assets = portfolio.get("total_market_value")
+        gain_loss = portfolio.get("unrealized_gain_loss")
+        return_rate = portfolio.get("return_rate")
+        allocation = portfolio.get("allocation", {})
+        note = " ".join((row.content or "").split())
+
+        lines = [
+            "現在の顧客情報：",
+            f"- 顧客名: {row.name}",
+            f"- 年齢: {age if age is not None else 'N/A'}",
+            f"- 職業: {row.occupation or 'N/A'}",
+            f"- 投資経験: {row.investment_experience or 'N/A'}",
+            f"- リスク許容度: {row.risk_tolerance or 'N/A'}",
+            f"- 総資産（評価額）: {total_assets:,.0f}円" if total_assets is not None else "- 総資産（評価額）: N/A",
+            f"- 含み損益: {gain_loss:,.0f}円" + (f"（{return_rate * 100:+.1f}%）" if return_rate is not None else "")
+            if gain_loss is not None else "- 含み損益: N/A",
+            f"- 商品分類別配分: {_allocation_text(allocation.get('category', []))}",
+            f"- 通貨別配分: {_allocation_text(allocation.get('currency', []))}",
+        ]
+        if note:
+            lines.append(f"- 営業メモ（抜粋）: {note[:NOTE_EXCERPT_CHARS]}")
+        lines.append("")
+        lines.append("この顧客情報を参考にして、より個別化された回答を提供してください。")
+
+        return {
+            "customer_id": customer_id,
+            "name": row.name,
+            "age": age,
+            "investment_experience": row.investment_experience,
+            "risk_tolerance": row.risk_tolerance,
+            "total_assets": total_assets,
+            "context_block": "\n".join(lines),
+        }
+
+# シングルトンインスタンス
+chat_context_service = ChatContextService()
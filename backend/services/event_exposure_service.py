@@ -0,0 +1,173 @@
+"""
+経済イベント影響マッチングサービス
+イベントの影響通貨・影響セクターと、顧客別資産配分（customer_portfolio_allocations の
+currency / category 軸）を突き合わせ、影響を受ける顧客・保有を1回のインデックス検索で求める
+
+イベント側の配列は GIN インデックス、配分側は (dimension, bucket) インデックスで引く
+（backend/migrations/versions/0003_concurrent_indexes.py を参照）
+"""
+
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import Integer, and_, any_, bindparam, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Customer, CustomerPortfolioAllocation, EconomicEvent, Holding, Product
+from ..utils.pagination import decode_cursor, encode_cursor, model_columns, paginate
+
+# イベントの配列 → 資産配分の集計軸
+EXPOSURE_DIMENSIONS = {
+    "currency": EconomicEvent.affected_currencies,
+    "category": EconomicEvent.affected_sectors,
+}
+
+def _parse_event_key(key) -> Tuple[date, int]:
+    return date.fromisoformat(key[0]), int(key[1])
+
+class EventExposureService:
+    """経済イベントと顧客・保有の影響マッチング"""
+
+    @staticmethod
+    def _event_filter(event_id: Optional[int], date_from: Optional[date], date_to: Optional[date]) -> List:
+        conditions = []
+        if event_id is not None:
+            conditions.append(EconomicEvent.event_id == event_id)
+        if date_from is not None:
+            conditions.append(EconomicEvent.event_date >= date_from)
+        if date_to is not None:
+            conditions.append(EconomicEvent.event_date <= date_to)
+        return conditions
+
+    async def list_events(self, db: AsyncSession, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                          currency: Optional[str] = None, sector: Optional[str] = None,
+                          impact_level: Optional[str] = None, cursor: Optional[str] = None,
+                          limit: int = 100) -> Tuple[List, Optional[str]]:
+        """イベント一覧（開催日・イベントID順のキーセットページング、通貨・セクターはGINで絞り込み）"""
+        stmt = select(*model_columns(EconomicEvent).values()).where(*self._event_filter(None, date_from, date_to))
+        # 配列の包含（@>）はGINインデックスで処理される
+        for column, value in ((EconomicEvent.affected_currencies, currency), (EconomicEvent.affected_sectors, sector)):
+            if value:
+                stmt = stmt.where(column.op("@>")(array([value], type_=column.type.item_type)))
+        if impact_level:
+            stmt = stmt.where(EconomicEvent.impact_level == impact_level)
+        last_key = decode_cursor(cursor, parse=_parse_event_key)
+        if last_key is not None:
+            last_date, last_id = last_key
+            stmt = stmt.where(or_(
+                EconomicEvent.event_date > last_date,
+                and_(EconomicEvent.event_date == last_date, EconomicEvent.event_id > last_id),
+            ))
+        events = (await db.execute(
+            stmt.order_by(EconomicEvent.event_date, EconomicEvent.event_id).limit(limit + 1)
+        )).all()
+
+        next_cursor = None
+        if len(events) > limit:
+            events = events[:limit]
+            next_cursor = encode_cursor([events[-1].event_date.isoformat(), events[-1].event_id])
+        return events, next_cursor
+
+    @staticmethod
+    def _allocation_match(allocation):
+        """配分行がイベントの影響通貨・影響セクターに該当する条件"""
+        return or_(*[
+            and_(allocation.dimension == literal_column(f"'{dimension}'"), allocation.bucket == any_(column))
+            for dimension, column in EXPOSURE_DIMENSIONS.items()
+        ])
+
+    async def exposed_customers(self, db: AsyncSession, event_id: Optional[int] = None,
+                                date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                sales_rep_id: Optional[int] = None, limit: int = 100) -> Dict:
+        """イベント（または期間内のイベント）の影響を受ける顧客を影響額の大きい順に返す"""
+        event_filter = self._event_filter(event_id, date_from, date_to)
+        allocation = CustomerPortfolioAllocation
+        # 配分行は該当イベントの有無（EXISTS）だけで絞り込む（イベントと結合すると該当イベント数だけ重複加算される）
+        matching_event = select(EconomicEvent.event_id).where(*event_filter, self._allocation_match(allocation)).exists()
+        currency_value = func.coalesce(func.sum(allocation.market_value).filter(allocation.dimension == "currency"), 0)
+        sector_value = func.coalesce(func.sum(allocation.market_value).filter(allocation.dimension == "category"), 0)
+        exposure = func.greatest(currency_value, sector_value)
+        stmt = (
+            select(
+                allocation.customer_id,
+                Customer.name.label("customer_name"),
+                Customer.sales_rep_id,
+                currency_value.label("currency_exposure"),
+                sector_value.label("sector_exposure"),
+                func.array_agg(func.distinct(allocation.dimension + ":" + allocation.bucket)).label("matched"),
+                func.count().over().label("total"),
+            )
+            .join(Customer, Customer.customer_id == allocation.customer_id)
+            .where(matching_event)
+            .group_by(allocation.customer_id, Customer.name, Customer.sales_rep_id)
+        )
+        if sales_rep_id is not None:
+            stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+        stmt = stmt.order_by(exposure.desc(), allocation.customer_id).limit(limit)
+        rows = (await db.execute(stmt)).all()
+
+        # 該当イベントIDは返却する顧客の分だけ別に集める
+        event_ids: Dict[int, List[int]] = {}
+        if rows:
+            event_ids = dict((await db.execute(
+                select(allocation.customer_id, func.array_agg(func.distinct(EconomicEvent.event_id)))
+                .join(allocation, self._allocation_match(allocation))
+                .where(*event_filter, allocation.customer_id == any_(bindparam("customer_ids", [row.customer_id for row in rows], type_=ARRAY(Integer))))
+                .group_by(allocation.customer_id)
+            )).all())
+
+        return {
+            "event_id": event_id,
+            "date_from": date_from,
+            "date_to": date_to,
+            "total": rows[0].total if rows else 0,
+            "items": [
+                {
+                    "customer_id": row.customer_id,
+                    "customer_name": row.customer_name,
+                    "sales_rep_id": row.sales_rep_id,
+                    # 通貨軸・セクター軸それぞれで影響を受ける評価額（同じ保有が両方に含まれ得るため合算しない）
+                    "currency_exposure": float(row.currency_exposure),
+                    "sector_exposure": float(row.sector_exposure),
+                    "event_ids": sorted(event_ids.get(row.customer_id, [])),
+                    "matched": sorted(row.matched),
+                }
+                for row in rows
+            ],
+        }
+
+    async def exposed_holdings(self, db: AsyncSession, event_id: int, cursor: Optional[str] = None,
+                               limit: int = 100) -> Tuple[List, Optional[str]]:
+        """イベントの影響を受けるアクティブ保有（holding_idのキーセットページング）"""
+        event = await db.get(EconomicEvent, event_id)
+        if event is None:
+            raise HTTPException(status_code=404, detail="Economic event not found")
+        currencies = list(event.affected_currencies or [])
+        sectors = list(event.affected_sectors or [])
+        if not currencies and not sectors:
+            return [], None
+
+        stmt = (
+            select(
+                Holding.holding_id,
+                Holding.customer_id,
+                Customer.name.label("customer_name"),
+                Customer.sales_rep_id,
+                Holding.product_id,
+                Product.product_code,
+                Product.product_name,
+                Product.category_code,
+                Product.currency,
+                Holding.current_value,
+            )
+            .join(Product, Product.product_id == Holding.product_id)
+            .join(Customer, Customer.customer_id == Holding.customer_id)
+            .where(
+                Holding.status == literal_column("'active'"),
+                or_(Product.currency.in_(currencies), Product.category_code.in_(sectors)),
+            )
+        )
+        return await paginate(db, stmt, Holding.holding_id, cursor, limit)
+
+# シングルトンインスタンス
+event_exposure_service = EventExposureService()
@@ -0,0 +1,160 @@
+"""
+満期ラダーサービス
+アクティブ保有の満期日（保有の満期日、未設定なら商品の満期日）を期間・顧客・担当者別に集計し、
+満期が近い保有を満期日順にページングして返す
+
+満期日の範囲検索は以下の部分インデックスで処理する（backend/migrations/versions/0003_concurrent_indexes.py を参照）
+    holdings (maturity_date) WHERE status = 'active'
+    products (maturity_date) + holdings (product_id) WHERE status = 'active' AND maturity_date IS NULL
+"""
+
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Date, and_, func, literal_column, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Customer, Holding, Product, SalesRepresentative
+from ..utils.pagination import decode_cursor, encode_cursor
+
+PERIODS = ("week", "month", "quarter", "year")
+GROUP_BY_OPTIONS = ("none", "customer", "sales_rep")
+
+# 満期日の既定の対象期間（本日から）
+DEFAULT_WINDOW_DAYS = 365
+
+# 部分インデックスの条件と一致させるため、ステータスはバインド変数ではなくリテラルで比較する
+ACTIVE = literal_column("'active'")
+
+def window(date_from: Optional[date], date_to: Optional[date]) -> Tuple[date, date]:
+    """対象期間を補完（既定は本日から DEFAULT_WINDOW_DAYS 日間のローリングウィンドウ）"""
+    date_from = date_from or date.today()
+    return date_from, date_to or date_from + timedelta(days=DEFAULT_WINDOW_DAYS)
+
+def _parse_cursor_key(key) -> Tuple[date, int]:
+    return date.fromisoformat(key[0]), int(key[1])
+
+class MaturityLadderService:
+    """満期ラダー・満期予定の集計"""
+
+    def _maturities(self, date_from: date, date_to: date, customer_id: Optional[int] = None):
+        """期間内に満期を迎えるアクティブ保有（保有の満期日優先、未設定は商品の満期日）"""
+        amount = func.coalesce(Holding.current_value, Holding.quantity * Holding.unit_price).label("amount")
+        own = (
+            select(Holding.holding_id, Holding.customer_id, Holding.product_id,
+                   Holding.maturity_date.label("maturity_date"), amount)
+            .where(Holding.status == ACTIVE, Holding.maturity_date.between(date_from, date_to))
+        )
+        inherited = (
+            select(Holding.holding_id, Holding.customer_id, Holding.product_id,
+                   Product.maturity_date.label("maturity_date"), amount)
+            .join(Product, Product.product_id == Holding.product_id)
+            .where(Holding.status == ACTIVE, Holding.maturity_date.is_(None),
+                   Product.maturity_date.between(date_from, date_to))
+        )
+        if customer_id is not None:
+            own = own.where(Holding.customer_id == customer_id)
+            inherited = inherited.where(Holding.customer_id == customer_id)
+        return union_all(own, inherited).subquery("maturities")
+
+    async def ladder(self, db: AsyncSession, period: str = "month", group_by: str = "none",
+                     date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     sales_rep_id: Optional[int] = None, customer_id: Optional[int] = None) -> Dict:
+        """期間（週・月・四半期・年）ごとの満期額・件数"""
+        date_from, date_to = window(date_from, date_to)
+        maturities = self._maturities(date_from, date_to, customer_id)
+        # 期間単位はGROUP BYで同一式と判定されるようリテラルで埋め込む（PERIODSで検証済みの値のみ）
+        bucket_start = func.date_trunc(literal_column(f"'{period}'"), maturities.c.maturity_date).cast(Date)
+
+        group_columns = [bucket_start]
+        if group_by == "customer":
+            group_columns += [maturities.c.customer_id, Customer.name]
+        elif group_by == "sales_rep":
+            group_columns += [Customer.sales_rep_id, SalesRepresentative.name]
+
+        stmt = (
+            select(
+                *group_columns,
+                func.count().label("holdings_count"),
+                func.count(func.distinct(maturities.c.customer_id)).label("customers_count"),
+                func.coalesce(func.sum(maturities.c.amount), 0).label("amount"),
+            )
+            .select_from(maturities)
+            .outerjoin(Customer, Customer.customer_id == maturities.c.customer_id)
+        )
+        if group_by == "sales_rep":
+            stmt = stmt.outerjoin(SalesRepresentative, SalesRepresentative.rep_id == Customer.sales_rep_id)
+        if sales_rep_id is not None:
+            stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+        stmt = stmt.group_by(*group_columns).order_by(*group_columns[:2])
+
+        buckets = []
+        total_amount, total_count = 0, 0
+        for row in (await db.execute(stmt)).all():
+            item = {"bucket_start": row[0]}
+            if group_by == "customer":
+                item.update(customer_id=row[1], customer_name=row[2])
+            elif group_by == "sales_rep":
+                item.update(sales_rep_id=row[1], sales_rep_name=row[2])
+            item.update(
+                holdings_count=row.holdings_count,
+                customers_count=row.customers_count,
+                amount=float(row.amount),
+            )
+            total_amount += row.amount
+            total_count += row.holdings_count
+            buckets.append(item)
+
+        return {
+            "period": period,
+            "group_by": group_by,
+            "date_from": date_from,
+            "date_to": date_to,
+            "buckets": buckets,
+            "total": {"holdings_count": total_count, "amount": float(total_amount)},
+        }
+
+    async def upcoming(self, db: AsyncSession, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       cursor: Optional[str] = None, limit: int = 100,
+                       sales_rep_id: Optional[int] = None, customer_id: Optional[int] = None) -> Tuple[List, Optional[str]]:
+        """満期日・保有ID順の満期予定（(満期日, 保有ID) のキーセットページング）"""
+        date_from, date_to = window(date_from, date_to)
+        maturities = self._maturities(date_from, date_to, customer_id)
+        stmt = (
+            select(
+                maturities.c.holding_id,
+                maturities.c.maturity_date,
+                maturities.c.amount,
+                maturities.c.customer_id,
+                Customer.name.label("customer_name"),
+                Customer.customer_code,
+                Customer.sales_rep_id,
+                maturities.c.product_id,
+                Product.product_code,
+                Product.product_name,
+                Product.category_code,
+                Product.currency,
+            )
+            .select_from(maturities)
+            .join(Customer, Customer.customer_id == maturities.c.customer_id)
+            .join(Product, Product.product_id == maturities.c.product_id)
+        )
+        if sales_rep_id is not None:
+            stmt = stmt.where(Customer.sales_rep_id == sales_rep_id)
+        last_key = decode_cursor(cursor, parse=_parse_cursor_key)
+        if last_key is not None:
+            last_date, last_id = last_key
+            stmt = stmt.where(or_(
+                maturities.c.maturity_date > last_date,
+                and_(maturities.c.maturity_date == last_date, maturities.c.holding_id > last_id),
+            ))
+        rows = (await db.execute(
+            stmt.order_by(maturities.c.maturity_date, maturities.c.holding_id).limit(limit + 1)
+        )).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].maturity_date.isoformat(), rows[-1].holding_id])
+        return rows, next_cursor
+
+# シングルトンインスタンス
+maturity_ladder_service = MaturityLadderService()
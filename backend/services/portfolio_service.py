@@ -0,0 +1,146 @@
+"""
+顧客別ポートフォリオ集計サービス
+customer_portfolios / customer_portfolio_allocations を保有の変更に合わせて再集計し、
+顧客ごとの評価額・簿価・損益・資産配分を取得する
+
+集計の作成・更新は書き込み側（保有の変更・再評価・商品同期・インポート）だけで行い、
+参照時に集計が無い顧客（新規登録直後など）は保有からその場で計算して返す（書き込みはしない）
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import Integer, String, any_, bindparam, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import (
+    Customer, Holding, Product, CustomerPortfolio, CustomerPortfolioAllocation,
+    ALL_CUSTOMERS, SELECTED_CUSTOMERS, CUSTOMER_PORTFOLIO_SUMMARY_SELECT, CUSTOMER_PORTFOLIO_ALLOCATION_SELECT,
+    CUSTOMER_PORTFOLIO_REFRESH_SQL,
+)
+
+ZERO = Decimal("0")
+
+def _any(name: str, values: List, item_type=Integer):
+    """= ANY(配列1個) で渡す（IN (...) は値ごとにバインドパラメータとなり、数万件で上限32767を超える）"""
+    return any_(bindparam(name, values, type_=ARRAY(item_type)))
+
+def _for_customers(sql: str, customer_ids: Optional[List[int]]):
+    """集計SQLを対象顧客（None は全顧客）に絞った文にする"""
+    if customer_ids is None:
+        return text(sql.format(customer_filter=ALL_CUSTOMERS))
+    return text(sql.format(customer_filter=SELECTED_CUSTOMERS)).bindparams(
+        bindparam("customer_ids", customer_ids, type_=ARRAY(Integer))
+    )
+
+class PortfolioService:
+    """顧客別ポートフォリオ集計の維持と取得
+
+    集計のSQLは models/database.py の CUSTOMER_PORTFOLIO_* （インポートの再構築と共通）
+    """
+
+    async def _lock(self, db: AsyncSession, customer_ids: Optional[List[int]]) -> None:
+        """同じ顧客の再集計を直列化する（配分行の削除→再作成が同時に走ると主キー重複・古い行の残留になる）
+
+        顧客行を顧客ID順に FOR NO KEY UPDATE でロックする（保有登録時の外部キー検査の
+        FOR KEY SHARE とは競合しない）。全件の再集計とは配分テーブルのロックで直列化する
+        （個別同士は両立する ROW EXCLUSIVE、全件は自身・個別と競合する SHARE ROW EXCLUSIVE を
+        最初に取得するため、概要行のロックと順序が逆転してデッドロックすることはない）
+        """
+        if customer_ids is None:
+            await db.execute(text("LOCK TABLE customer_portfolio_allocations IN SHARE ROW EXCLUSIVE MODE"))
+            return
+        await db.execute(text("LOCK TABLE customer_portfolio_allocations IN ROW EXCLUSIVE MODE"))
+        await db.execute(
+            select(Customer.customer_id)
+            .where(Customer.customer_id == _any("customer_ids", customer_ids))
+            .order_by(Customer.customer_id)
+            .with_for_update(key_share=True)
+        )
+
+    async def refresh(self, db: AsyncSession, customer_ids: Optional[Iterable[Optional[int]]] = None) -> None:
+        """指定顧客（省略時は全顧客）の集計を保有から作り直す（コミットは呼び出し側）"""
+        if customer_ids is not None:
+            customer_ids = sorted({customer_id for customer_id in customer_ids if customer_id is not None})
+            if not customer_ids:
+                return
+        await self._lock(db, customer_ids)
+        # 配分の削除→再作成は _lock により同じ顧客では直列
+        for statement in CUSTOMER_PORTFOLIO_REFRESH_SQL:
+            await db.execute(_for_customers(statement, customer_ids))
+
+    async def refresh_for_products(self, db: AsyncSession, product_codes: List[str]) -> None:
+        """商品属性（カテゴリ・通貨）の変更を、その商品を保有する顧客の集計に反映"""
+        if not product_codes:
+            return
+        customer_ids = (await db.scalars(
+            select(Holding.customer_id).distinct()
+            .join(Product, Holding.product_id == Product.product_id)
+            .where(Product.product_code == _any("product_codes", list(product_codes), String))
+        )).all()
+        await self.refresh(db, customer_ids)
+
+    async def get_portfolios(self, db: AsyncSession, customer_ids: List[int]) -> Dict[int, Dict]:
+        """顧客ID→ポートフォリオ概要（集計が未作成の顧客は保有から計算するだけで保存しない）"""
+        customer_ids = sorted(set(customer_ids))
+        summaries = {
+            row.customer_id: row for row in (await db.scalars(
+                select(CustomerPortfolio).where(CustomerPortfolio.customer_id == _any("customer_ids", customer_ids))
+            )).all()
+        }
+        allocations: Dict[int, Dict[str, List]] = {}
+        if summaries:
+            for row in (await db.scalars(
+                select(CustomerPortfolioAllocation)
+                .where(CustomerPortfolioAllocation.customer_id == _any("customer_ids", list(summaries)))
+                .order_by(CustomerPortfolioAllocation.market_value.desc())
+            )).all():
+                allocations.setdefault(row.customer_id, {}).setdefault(row.dimension, []).append(row)
+
+        missing = [customer_id for customer_id in customer_ids if customer_id not in summaries]
+        if missing:
+            for row in (await db.execute(_for_customers(CUSTOMER_PORTFOLIO_SUMMARY_SELECT, missing))).all():
+                summaries[row.customer_id] = row
+            rows = (await db.execute(
+                _for_customers(CUSTOMER_PORTFOLIO_ALLOCATION_SELECT + " ORDER BY market_value DESC", missing)
+            )).all()
+            for row in rows:
+                allocations.setdefault(row.customer_id, {}).setdefault(row.dimension, []).append(row)
+
+        return {
+            customer_id: self._to_dict(summary, allocations.get(customer_id, {}))
+            for customer_id, summary in summaries.items()
+        }
+
+    async def get_portfolio(self, db: AsyncSession, customer_id: int) -> Optional[Dict]:
+        return (await self.get_portfolios(db, [customer_id])).get(customer_id)
+
+    @staticmethod
+    def _to_dict(summary, allocations: Dict[str, List]) -> Dict:
+        market_value = summary.total_market_value or ZERO
+        book_value = summary.total_book_value or ZERO
+        gain_loss = market_value - book_value
+        return {
+            "customer_id": summary.customer_id,
+            "holdings_count": summary.holdings_count,
+            "total_market_value": float(market_value),
+            "total_book_value": float(book_value),
+            "unrealized_gain_loss": float(gain_loss),
+            "return_rate": float(gain_loss / book_value) if book_value else None,
+            "allocation": {
+                dimension: [
+                    {
+                        "bucket": row.bucket,
+                        "holdings_count": row.holdings_count,
+                        "market_value": float(row.market_value),
+                        "book_value": float(row.book_value),
+                        "weight": float(row.market_value / market_value) if market_value else None,
+                    }
+                    for row in rows
+                ]
+                for dimension, rows in allocations.items()
+            },
+            "updated_at": getattr(summary, "updated_at", None),
+        }
+
+# シングルトンインスタンス
+portfolio_service = PortfolioService()
@@ -3,13 +3,29 @@ ProductMaster System API呼び出しサービス
 """
 
 import httpx
+import asyncio
+import logging
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+from ..utils.cache import AsyncTTLCache
+
+logger = logging.getLogger(__name__)
+
+# 一時的なエラーとして再試行するステータス
+RETRY_STATUS_CODES = {502, 503, 504}
+
+def _http2_available() -> bool:
+    """HTTP/2用のh2パッケージが導入済みか"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
 
 class ProductMasterService:
     """ProductMaster System APIクライアント"""
-    
+
     def __init__(self):
         self.base_url = os.getenv("PRODUCT_MASTER_URL", "http://localhost:8001")
         self.api_token = os.getenv("PRODUCT_MASTER_TOKEN", "demo-token-12345")
@@ -17,43 +33,93 @@ class ProductMasterService:
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
-    
+        # 接続プール・再試行設定
+        self.timeout = float(os.getenv("PRODUCT_MASTER_TIMEOUT", 10.0))
+        self.max_connections = int(os.getenv("PRODUCT_MASTER_MAX_CONNECTIONS", 50))
+        self.max_keepalive = int(os.getenv("PRODUCT_MASTER_MAX_KEEPALIVE", 20))
+        self.http2 = os.getenv("PRODUCT_MASTER_HTTP2", "true").lower() in ("1", "true", "yes") and _http2_available()
+        self.retries = int(os.getenv("PRODUCT_MASTER_RETRIES", 2))
+        self._client: Optional[httpx.AsyncClient] = None
+        # 参照系レスポンスキャッシュ（商品・カテゴリは変更頻度が低い）
+        self.cache = AsyncTTLCache(
+            maxsize=int(os.getenv("PRODUCT_MASTER_CACHE_SIZE", 2048)),
+            ttl=float(os.getenv("PRODUCT_MASTER_CACHE_TTL", 300)),
+            stale_ttl=float(os.getenv("PRODUCT_MASTER_CACHE_STALE_TTL", 1800)),
+        )
+
+    async def start(self) -> None:
+        """アプリ起動時に共有クライアントを生成"""
+        if self._client is None or self._client.is_closed:
+            # 接続数上限・HTTP/2・接続エラー時の再試行はトランスポートで設定
+            transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                retries=self.retries,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+            )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                transport=transport,
+            )
+
+    async def close(self) -> None:
+        """アプリ終了時に共有クライアントを破棄"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # ライフスパン外（スクリプト等）からの呼び出しでは遅延生成
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        return self._client
+
+    async def _request(self, path: str, params: Optional[Dict] = None,
+                       headers: Optional[Dict] = None) -> httpx.Response:
+        """共有クライアントでGET（接続エラーはトランスポート、5xxはここで再試行）"""
+        client = await self._get_client()
+        for attempt in range(self.retries + 1):
+            response = await client.get(path, params=params, headers=headers)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                return response
+            await asyncio.sleep(0.2 * (2 ** attempt))
+        return response
+
+    async def _get_json(self, path: str, params: Optional[Dict] = None):
+        response = await self._request(path, params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _cached_json(self, path: str, params: Optional[Dict] = None):
+        """キャッシュ経由のGET（同一リクエストは1回の上流呼び出しに合流）"""
+        key = (path, tuple(sorted((params or {}).items())))
+        return await self.cache.get_or_load(key, lambda: self._get_json(path, params))
+
     async def get_products(self, limit: int = 100, category_code: Optional[str] = None) -> List[Dict]:
         """商品一覧を取得"""
         try:
             params = {"limit": limit}
             if category_code:
                 params["category_code"] = category_code
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/products/",
-                    headers=self.headers,
-                    params=params,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching products: {e}")
+
+            return await self._cached_json("/api/products/", params)
+        except Exception:
+            logger.exception("Error fetching products")
             return []
-    
+
     async def get_product(self, product_id: int) -> Optional[Dict]:
         """商品詳細を取得"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/products/{product_id}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching product {product_id}: {e}")
+            return await self._cached_json(f"/api/products/{product_id}")
+        except Exception:
+            logger.exception("Error fetching product %s", product_id)
             return None
-    
-    async def search_products(self, query: str, category_code: Optional[str] = None, 
+
+    async def search_products(self, query: str, category_code: Optional[str] = None,
                             risk_level: Optional[int] = None) -> Dict:
         """商品検索"""
         try:
@@ -62,65 +128,85 @@ class ProductMasterService:
                 params["category_code"] = category_code
             if risk_level:
                 params["risk_level"] = risk_level
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/products/search",
-                    headers=self.headers,
-                    params=params,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error searching products: {e}")
+
+            return await self._get_json("/api/products/search", params)
+        except Exception:
+            logger.exception("Error searching products")
             return {"products": [], "total": 0, "page": 1, "size": 20, "pages": 0}
-    
+
     async def get_similar_products(self, product_id: int, limit: int = 5) -> List[Dict]:
         """類似商品を取得"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/products/{product_id}/similar",
-                    headers=self.headers,
-                    params={"limit": limit},
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching similar products for {product_id}: {e}")
+            return await self._cached_json(f"/api/products/{product_id}/similar", {"limit": limit})
+        except Exception:
+            logger.exception("Error fetching similar products for %s", product_id)
             return []
-    
+
     async def get_latest_price(self, product_id: int) -> Optional[Dict]:
-        """最新価格を取得"""
+        """最新価格を取得（価格は鮮度が重要なためキャッシュしない）"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/prices/{product_id}/latest",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching latest price for product {product_id}: {e}")
+            return await self._get_json(f"/api/prices/{product_id}/latest")
+        except Exception:
+            logger.exception("Error fetching latest price for product %s", product_id)
             return None
-    
+
     async def get_categories(self) -> List[Dict]:
         """商品カテゴリ一覧を取得"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/categories/",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            print(f"Error fetching categories: {e}")
+            return await self._cached_json("/api/categories/")
+        except Exception:
+            logger.exception("Error fetching categories")
             return []
 
+    def invalidate_cache(self) -> None:
+        """商品同期後などにレスポンスキャッシュを破棄"""
+        self.cache.invalidate()
+
+    @staticmethod
+    def _extract_products(payload) -> Tuple[List[Dict], int]:
+        """商品一覧レスポンスから（商品リスト, 総ページ数）を取り出す"""
+        if isinstance(payload, list):
+            return payload, 1
+        return payload.get("products", []), int(payload.get("pages") or 1)
+
+    async def fetch_catalogue(self, page_size: int = 500, since: Optional[str] = None,
+                              etag: Optional[str] = None, concurrency: int = 4) -> Dict:
+        """商品カタログ全体をページ単位で並列取得（同期処理用・エラーは呼び出し側へ送出）
+
+        since: 指定時刻以降に更新された商品のみ取得（差分モード）
+        etag: 同じ条件での前回取得時のETag（1ページ目に付けて送り、変更が無ければ not_modified=True を返す）
+
+        ETag は1ページ目のレスポンスの版でしかないため、結果全体が1ページに収まった
+        （件数がページサイズ未満で、追加があれば1ページ目が変わる）場合のみ返し、それ以外は None を返す
+        """
+        params = {"page": 1, "size": page_size}
+        if since:
+            params["updated_since"] = since
+
+        # 1ページ目で総ページ数とETagを確認
+        response = await self._request("/api/products/", params, headers={"If-None-Match": etag} if etag else None)
+        if response.status_code == 304:
+            return {"not_modified": True, "etag": etag, "products": [], "pages": 0}
+        response.raise_for_status()
+        products, pages = self._extract_products(response.json())
+
+        # 残りのページは同時実行数を制限して並列取得
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_page(page: int) -> List[Dict]:
+            async with semaphore:
+                return self._extract_products(await self._get_json("/api/products/", {**params, "page": page}))[0]
+
+        for page_products in await asyncio.gather(*[fetch_page(page) for page in range(2, pages + 1)]):
+            products.extend(page_products)
+
+        covers_all = pages == 1 and len(products) < page_size
+        return {
+            "not_modified": False,
+            "etag": response.headers.get("ETag") if covers_all else None,
+            "products": products,
+            "pages": pages,
+        }
+
 # シングルトンインスタンス
 product_service = ProductMasterService()
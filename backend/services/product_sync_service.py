@@ -0,0 +1,153 @@
+"""
+ProductMaster商品同期サービス
+カタログを並列取得し、既存商品との差分のみをバッチUPSERTする
+
+差分取得の基準時刻とETagは sync_states に保持し、全ワーカーで共有する。
+同期中は状態の行をロックするため、複数ワーカーからの同期は順番に実行される
+"""
+
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Product, SyncState
+from .product_service import product_service
+from .portfolio_service import portfolio_service
+from ..utils.response_cache import response_cache
+
+# 同期対象カラム（ProductMasterの値で上書きする列）
+SYNC_COLUMNS = (
+    "product_name", "category_code", "currency", "issuer",
+    "maturity_date", "risk_level", "minimum_investment",
+)
+
+# sync_states の行
+SYNC_SOURCE = "product_master"
+
+def to_date(value) -> Optional[date]:
+    """外部APIの日付文字列をdateに変換（asyncpgは文字列を受け付けないため）"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10]) if value else None
+
+def normalize_product(product_data: Dict) -> Dict:
+    """ProductMasterの商品データをproductsテーブルの列に変換（既定値は従来の同期処理と同じ）"""
+    return {
+        "product_code": product_data["product_code"],
+        "product_name": product_data["product_name"],
+        "category_code": product_data.get("category_code", ""),
+        "currency": product_data.get("currency", "JPY"),
+        "issuer": product_data.get("issuer", ""),
+        "maturity_date": to_date(product_data.get("maturity_date")),
+        "risk_level": product_data.get("risk_level", 1),
+        "minimum_investment": product_data.get("minimum_investment", 0),
+    }
+
+class ProductSyncService:
+    """ProductMaster → CRM products の差分同期"""
+
+    def __init__(self, batch_size: int = 500, page_size: int = 500):
+        self.batch_size = batch_size
+        self.page_size = page_size
+
+    async def _lock_state(self, db: AsyncSession) -> SyncState:
+        """同期状態の行をロックして取得（無ければ作成）"""
+        await db.execute(pg_insert(SyncState).values(source=SYNC_SOURCE).on_conflict_do_nothing())
+        return (await db.scalars(
+            select(SyncState).where(SyncState.source == SYNC_SOURCE).with_for_update()
+        )).one()
+
+    async def _load_existing(self, db: AsyncSession, codes: List[str]) -> Dict[str, Tuple]:
+        """既存商品を product_code → 同期対象列のタプル として一括取得"""
+        columns = [getattr(Product, column) for column in SYNC_COLUMNS]
+        existing = {}
+        for start in range(0, len(codes), self.batch_size):
+            chunk = codes[start:start + self.batch_size]
+            rows = await db.execute(select(Product.product_code, *columns).where(Product.product_code.in_(chunk)))
+            for row in rows:
+                existing[row[0]] = tuple(row[1:])
+        return existing
+
+    async def _upsert(self, db: AsyncSession, rows: List[Dict]) -> None:
+        """変更行を product_code をキーにバッチUPSERT"""
+        for start in range(0, len(rows), self.batch_size):
+            stmt = pg_insert(Product).values(rows[start:start + self.batch_size])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Product.product_code],
+                set_={
+                    **{column: getattr(stmt.excluded, column) for column in SYNC_COLUMNS},
+                    "updated_at": func.now(),
+                },
+            )
+            await db.execute(stmt)
+
+    async def sync(self, db: AsyncSession, since: Optional[str] = None, full: bool = False) -> Dict:
+        """商品同期を実行
+
+        since: 指定時刻以降の更新分のみ取得（省略時は前回同期時刻、full=Trueで全件）
+
+        ETag は同じ条件（since）で結果全体を取得したときのものだけを送るため、304 は
+        その条件の結果全体が変わっていないことを意味する。取得件数が0件の場合は基準時刻を進めず、
+        次回も同じ条件・ETagで問い合わせる（変更が無い間は304で済む）
+        """
+        started = time.perf_counter()
+        started_at = datetime.now()
+        state = await self._lock_state(db)
+        if full:
+            since = None
+        elif since is None and state.synced_at is not None:
+            since = state.synced_at.isoformat()
+        etag = state.etag if not full and state.etag_since == since else None
+
+        catalogue = await product_service.fetch_catalogue(page_size=self.page_size, since=since, etag=etag)
+        if catalogue["not_modified"]:
+            await db.commit()
+            return {
+                "status": "not_modified",
+                "synced_count": 0,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+
+        # 同一コードの重複はカタログ後勝ち
+        incoming = {}
+        for product_data in catalogue["products"]:
+            product = normalize_product(product_data)
+            incoming[product["product_code"]] = product
+
+        existing = await self._load_existing(db, list(incoming))
+        inserted, updated = [], []
+        for code, product in incoming.items():
+            values = tuple(product[column] for column in SYNC_COLUMNS)
+            if code not in existing:
+                inserted.append(product)
+            elif existing[code] != values:
+                updated.append(product)
+
+        await self._upsert(db, inserted + updated)
+        # カテゴリ・通貨の変更を保有顧客の資産配分に反映
+        await portfolio_service.refresh_for_products(db, [product["product_code"] for product in updated])
+        if incoming or full:
+            state.synced_at = started_at
+        state.etag = catalogue["etag"]
+        state.etag_since = since
+        await db.commit()
+        if inserted or updated:
+            product_service.invalidate_cache()
+            await response_cache.invalidate("products")
+
+        return {
+            "status": "success",
+            "synced_count": len(inserted) + len(updated),
+            "fetched_count": len(incoming),
+            "inserted_count": len(inserted),
+            "updated_count": len(updated),
+            "unchanged_count": len(incoming) - len(inserted) - len(updated),
+            "pages": catalogue["pages"],
+            "delta_since": since,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+# シングルトンインスタンス
+product_sync_service = ProductSyncService()
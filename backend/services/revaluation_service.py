@@ -0,0 +1,138 @@
+"""
+保有商品一括時価評価サービス
+保有中の全商品の最新価格を並列取得し、一時テーブル経由の1回のUPDATEで全保有を再評価する
+
+夜間バッチとして実行:
+    python -m backend.services.revaluation_service
+"""
+
+import asyncio
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Holding
+from .product_service import product_service
+from .stats_service import stats_service
+from .portfolio_service import portfolio_service
+
+# 価格レスポンスで価格を表すキー（優先順）
+PRICE_KEYS = ("price", "current_price", "close_price", "latest_price")
+
+def extract_price(payload: Optional[Dict]) -> Optional[Decimal]:
+    """最新価格APIのレスポンスから価格を取り出す"""
+    if not payload:
+        return None
+    for key in PRICE_KEYS:
+        value = payload.get(key)
+        if value is not None:
+            try:
+                return Decimal(str(value))
+            except InvalidOperation:
+                return None
+    return None
+
+REVALUE_SQL = text("""
+    UPDATE holdings AS h
+    SET current_price = lp.price,
+        current_value = h.quantity * lp.price,
+        unrealized_gain_loss = h.quantity * (lp.price - h.unit_price),
+        updated_at = NOW()
+    FROM latest_prices AS lp
+    WHERE h.product_id = lp.product_id
+      AND h.status = 'active'
+      AND (h.current_price IS DISTINCT FROM lp.price
+           OR h.current_value IS DISTINCT FROM h.quantity * lp.price)
+""")
+
+class RevaluationService:
+    """最新価格による保有の一括再評価"""
+
+    def __init__(self, concurrency: int = 16, batch_size: int = 200):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+    async def fetch_latest_prices(self, product_ids: List[int]) -> Dict[int, Decimal]:
+        """最新価格をバッチ単位・同時実行数制限付きで並列取得"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(product_id: int):
+            async with semaphore:
+                return product_id, extract_price(await product_service.get_latest_price(product_id))
+
+        prices = {}
+        for start in range(0, len(product_ids), self.batch_size):
+            batch = product_ids[start:start + self.batch_size]
+            for product_id, price in await asyncio.gather(*[fetch(product_id) for product_id in batch]):
+                if price is not None:
+                    prices[product_id] = price
+        return prices
+
+    async def revalue(self, db: AsyncSession) -> Dict:
+        """全アクティブ保有を再評価し、件数と各段階の所要時間を返す"""
+        timings = {}
+        started = time.perf_counter()
+
+        product_ids = list((await db.scalars(
+            select(Holding.product_id).where(Holding.status == 'active').distinct()
+        )).all())
+        timings["load_products_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        step = time.perf_counter()
+        prices = await self.fetch_latest_prices(product_ids)
+        timings["fetch_prices_ms"] = round((time.perf_counter() - step) * 1000, 2)
+
+        step = time.perf_counter()
+        await db.execute(text(
+            "CREATE TEMP TABLE latest_prices (product_id INTEGER PRIMARY KEY, price NUMERIC(15,2) NOT NULL) "
+            "ON COMMIT DROP"
+        ))
+        if prices:
+            await db.execute(
+                text("INSERT INTO latest_prices (product_id, price) VALUES (:product_id, :price)"),
+                [{"product_id": product_id, "price": price} for product_id, price in prices.items()]
+            )
+        timings["load_prices_ms"] = round((time.perf_counter() - step) * 1000, 2)
+
+        step = time.perf_counter()
+        result = await db.execute(REVALUE_SQL)
+        updated_holdings = result.rowcount
+        timings["update_holdings_ms"] = round((time.perf_counter() - step) * 1000, 2)
+
+        # 評価額が変わったためダッシュボード集計・顧客別集計を再構築
+        step = time.perf_counter()
+        await stats_service.rebuild(db)
+        await portfolio_service.refresh(db)
+        await db.commit()
+        timings["refresh_rollups_ms"] = round((time.perf_counter() - step) * 1000, 2)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        return {
+            "status": "success",
+            "held_products": len(product_ids),
+            "priced_products": len(prices),
+            "missing_prices": len(product_ids) - len(prices),
+            "updated_holdings": updated_holdings,
+            "timings": timings,
+        }
+
+# シングルトンインスタンス
+revaluation_service = RevaluationService()
+
+async def _run_nightly():
+    from ..models.database import AsyncSessionLocal
+    print("🚀 Starting holdings revaluation...")
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await revaluation_service.revalue(db)
+    finally:
+        await product_service.close()
+    print(f"✅ Revalued {result['updated_holdings']:,} holdings "
+          f"({result['priced_products']:,}/{result['held_products']:,} products priced, "
+          f"{result['timings']['total_ms'] / 1000:.2f}s)")
+    if result["missing_prices"]:
+        print(f"⚠️  No price for {result['missing_prices']:,} held products (kept previous values)")
+
+if __name__ == "__main__":
+    asyncio.run(_run_nightly())
@@ -0,0 +1,108 @@
+"""
+営業メモ全文検索サービス
+search_vector（文字bigramのtsvector・GINインデックス）でランク付き検索し、強調表示付きスニペットを返す
+
+日本語は単語の区切りが無いため、pg_bigm/pgroonga と同様の考え方で空白除去後の2文字単位に分割して索引する
+（DB側は crm_bigrams() とトリガーで維持: backend/migrations/versions/0001_functions_and_triggers.py を参照）
+"""
+
+import html
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import and_, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Customer, SalesNote
+
+# スニペットとして切り出す文字数と、一致位置より前に含める文字数
+SNIPPET_LENGTH = 120
+SNIPPET_LEAD = 40
+
+def bigrams(term: str) -> str:
+    """DB側の crm_bigrams() と同じ規則で検索語を2文字単位に分割"""
+    normalized = re.sub(r"\s+", "", term).lower()
+    if len(normalized) < 2:
+        return normalized
+    return " ".join(normalized[i:i + 2] for i in range(len(normalized) - 1))
+
+def highlight(snippet: str, terms: List[str]) -> str:
+    """スニペットをHTMLエスケープし、検索語を<mark>で囲む"""
+    if not snippet:
+        return ""
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts, last = [], 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        last = match.end()
+    parts.append(html.escape(snippet[last:]))
+    return "".join(parts)
+
+class SalesNoteSearchService:
+    """営業メモのランク付き全文検索"""
+
+    async def search(self, db: AsyncSession, query: str, limit: int = 20,
+                     sales_rep_id: Optional[int] = None) -> Dict:
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return {"query": query, "total": 0, "items": []}
+
+        # 2文字以上の語はGINインデックスで検索、1文字の語はbigramに載らないためILIKEで絞り込む
+        long_terms = [term for term in terms if len(term) >= 2]
+        short_terms = [term for term in terms if len(term) < 2]
+        conditions = []
+        rank = literal(0.0)
+        if long_terms:
+            # 語ごとにbigramの隣接（<->）を要求する（plainto_tsquery の AND だけでは「東京都」が
+            # 別々の位置の「東京」「京都」にも一致する）
+            tsquery = None
+            for term in long_terms:
+                phrase = func.phraseto_tsquery("simple", bigrams(term))
+                tsquery = phrase if tsquery is None else tsquery.op("&&")(phrase)
+            conditions.append(SalesNote.search_vector.op("@@")(tsquery))
+            rank = func.ts_rank_cd(SalesNote.search_vector, tsquery)
+        for term in short_terms:
+            # 「%」「_」も文字そのものとして探す（ワイルドカードのままだと全件に一致する）
+            escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append(SalesNote.content.ilike(f"%{escaped}%", escape="\\"))
+        if sales_rep_id is not None:
+            conditions.append(SalesNote.sales_rep_id == sales_rep_id)
+
+        # スニペットは最初の検索語の一致位置の前後をDB側で切り出す（本文全体は転送しない）
+        position = func.strpos(func.lower(SalesNote.content), terms[0].lower())
+        snippet = func.substr(SalesNote.content, func.greatest(position - SNIPPET_LEAD, 1), SNIPPET_LENGTH)
+        rank = rank.label("rank")
+
+        rows = (await db.execute(
+            select(
+                SalesNote.customer_id,
+                SalesNote.sales_rep_id,
+                Customer.name.label("customer_name"),
+                SalesNote.updated_at,
+                rank,
+                snippet.label("snippet"),
+                func.count().over().label("total"),
+            )
+            .join(Customer, Customer.customer_id == SalesNote.customer_id)
+            .where(and_(*conditions))
+            .order_by(rank.desc(), SalesNote.updated_at.desc().nulls_last(), SalesNote.customer_id)
+            .limit(limit)
+        )).all()
+
+        return {
+            "query": query,
+            "total": rows[0].total if rows else 0,
+            "items": [
+                {
+                    "customer_id": row.customer_id,
+                    "customer_name": row.customer_name,
+                    "sales_rep_id": row.sales_rep_id,
+                    "rank": round(float(row.rank), 6),
+                    "snippet": highlight(row.snippet, terms),
+                    "updated_at": row.updated_at,
+                }
+                for row in rows
+            ],
+        }
+
+# シングルトンインスタンス
+sales_note_search_service = SalesNoteSearchService()
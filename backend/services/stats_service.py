@@ -0,0 +1,111 @@
+"""
+ポートフォリオ統計サービス
+ダッシュボード集計の一括取得と保有集計テーブル（portfolio_stats）の差分更新
+
+portfolio_stats は STATS_STRIPES 行に分散しており、読み出し時に合計する。
+顧客・商品・営業メモ・経済イベントの件数は各テーブルのトリガー（0004_striped_portfolio_stats）が、
+保有の件数・評価額・簿価は保有の書き込みと同じトランザクションで apply_delta が加算する
+"""
+
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.database import Holding, PortfolioStats, STATS_STRIPES, PORTFOLIO_STATS_REBUILD_SQL
+
+ZERO = Decimal("0")
+
+class PortfolioStatsService:
+    """保有集計の取得・維持を行うサービス"""
+
+    def _stats_query(self):
+        """全ストライプの件数と保有集計の合計を1回のSELECTで取得するクエリ（元テーブルは走査しない）"""
+        return select(
+            func.count().label("stripes"),
+            func.sum(PortfolioStats.customers_count).label("total_customers"),
+            func.sum(PortfolioStats.products_count).label("total_products"),
+            func.sum(PortfolioStats.sales_notes_count).label("total_sales_notes"),
+            func.sum(PortfolioStats.economic_events_count).label("total_economic_events"),
+            func.sum(PortfolioStats.holdings_count).label("holdings_count"),
+            func.sum(PortfolioStats.total_market_value).label("total_market_value"),
+            func.sum(PortfolioStats.total_book_value).label("total_book_value"),
+        )
+
+    async def get_dashboard_stats(self, db: AsyncSession) -> Dict:
+        """ダッシュボード用の統計値を取得（集計行が無ければ再構築）"""
+        row = (await db.execute(self._stats_query())).one()
+        if not row.stripes:
+            await self.rebuild(db)
+            await db.commit()
+            row = (await db.execute(self._stats_query())).one()
+
+        total_market_value = row.total_market_value or ZERO
+        total_book_value = row.total_book_value or ZERO
+        return {
+            "total_customers": row.total_customers,
+            "total_products": row.total_products,
+            "total_holdings": row.holdings_count,
+            "total_sales_notes": row.total_sales_notes,
+            "total_economic_events": row.total_economic_events,
+            "total_assets": total_market_value,
+            "total_book_value": total_book_value,
+            "total_market_value": total_market_value,
+            "unrealized_gain_loss": total_market_value - total_book_value,
+        }
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        """件数と保有集計を数え直して集計行を作り直す（コミットは呼び出し側）
+
+        行の作成は INSERT ... ON CONFLICT DO NOTHING のため、同時に呼ばれても一意制約違反にならない
+        """
+        for statement in PORTFOLIO_STATS_REBUILD_SQL:
+            await db.execute(text(statement))
+
+    @staticmethod
+    def holding_figures(holding: Optional[Holding]) -> Tuple[Decimal, Decimal]:
+        """保有1件分の（評価額, 簿価）を返す（NULLは0扱い、SUMと同じ意味）"""
+        if holding is None:
+            return ZERO, ZERO
+        market_value = Decimal(str(holding.current_value or 0))
+        if holding.quantity is None or holding.unit_price is None:
+            return market_value, ZERO
+        return market_value, Decimal(str(holding.quantity)) * Decimal(str(holding.unit_price))
+
+    async def apply_delta(self, db: AsyncSession, count: int = 0,
+                    market_value: Decimal = ZERO, book_value: Decimal = ZERO) -> None:
+        """保有の書き込みと同じトランザクションで集計行に差分を加算
+
+        加算先は接続（バックエンドPID）ごとのストライプ。1トランザクション内の加算は件数トリガーも含めて
+        同じ行に集まるため、トランザクション間で複数行のロックを取り合うことはない
+        """
+        stmt = pg_insert(PortfolioStats).values(
+            stats_id=func.pg_backend_pid() % STATS_STRIPES,
+            holdings_count=count,
+            total_market_value=market_value,
+            total_book_value=book_value,
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[PortfolioStats.stats_id],
+            set_={
+                "holdings_count": PortfolioStats.holdings_count + stmt.excluded.holdings_count,
+                "total_market_value": PortfolioStats.total_market_value + stmt.excluded.total_market_value,
+                "total_book_value": PortfolioStats.total_book_value + stmt.excluded.total_book_value,
+                "updated_at": func.now(),
+            },
+        ))
+
+    async def record_change(self, db: AsyncSession, before: Optional[Tuple[Decimal, Decimal]],
+                      after: Optional[Holding]) -> None:
+        """保有の作成・更新・削除を集計行に反映
+
+        before: 変更前にholding_figuresで取得した値（新規作成時はNone）
+        after: 変更後の保有（削除時はNone）
+        """
+        old_market, old_book = before or (ZERO, ZERO)
+        new_market, new_book = self.holding_figures(after)
+        count = (1 if after is not None else 0) - (1 if before is not None else 0)
+        await self.apply_delta(db, count, new_market - old_market, new_book - old_book)
+
+# シングルトンインスタンス
+stats_service = PortfolioStatsService()
@@ -0,0 +1,66 @@
+"""
+利用者の認証（署名付きトークン）
+ポータル等の発行側と CHAT_AUTH_SECRET を共有し、HMAC-SHA256 で署名した
+「利用者ID.有効期限.署名」形式のトークンを Authorization: Bearer で受け取る
+
+クライアントが自由に付けられるヘッダーや接続元アドレス（プロキシ配下では全員同じになる）は
+利用者の識別に使わない。秘密鍵が未設定の場合は全て未認証として扱う
+
+発行: python -m backend.utils.auth <利用者ID> [有効秒数]
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+from typing import Optional
+from fastapi import HTTPException, Request
+
+AUTH_SECRET = os.getenv("CHAT_AUTH_SECRET", "")
+# 発行時の既定の有効期間（秒）
+TOKEN_TTL_SECONDS = int(os.getenv("CHAT_AUTH_TOKEN_TTL", 12 * 3600))
+
+def _signature(payload: str, secret: str) -> str:
+    digest = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def issue_token(user_id: str, ttl: int = TOKEN_TTL_SECONDS, secret: Optional[str] = None) -> str:
+    """利用者IDの署名付きトークンを発行"""
+    secret = secret if secret is not None else AUTH_SECRET
+    if not secret:
+        raise RuntimeError("CHAT_AUTH_SECRET is not set")
+    encoded = base64.urlsafe_b64encode(user_id.encode()).rstrip(b"=").decode()
+    payload = f"{encoded}.{int(time.time()) + ttl}"
+    return f"{payload}.{_signature(payload, secret)}"
+
+def verify_token(token: str, secret: Optional[str] = None) -> Optional[str]:
+    """トークンを検証して利用者IDを返す（不正・期限切れ・秘密鍵未設定は None）"""
+    secret = secret if secret is not None else AUTH_SECRET
+    if not secret:
+        return None
+    try:
+        encoded, expires, signature = token.split(".")
+        if not hmac.compare_digest(signature, _signature(f"{encoded}.{expires}", secret)):
+            return None
+        if int(expires) < time.time():
+            return None
+        user_id = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except ValueError:
+        return None
+    return user_id or None
+
+def authenticated_user_id(request: Request) -> str:
+    """Authorization: Bearer の署名付きトークンから利用者IDを取得（無効なら401）"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    user_id = verify_token(token.strip()) if scheme.lower() == "bearer" else None
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Authentication required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return user_id
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m backend.utils.auth <user_id> [ttl_seconds]")
+    print(issue_token(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else TOKEN_TTL_SECONDS))
@@ -0,0 +1,110 @@
+"""
+非同期TTL+LRUキャッシュ
+stale-while-revalidate と同一キーの同時読み込みの合流（リクエストコアレッシング）に対応
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+Loader = Callable[[], Awaitable[Any]]
+
+class AsyncTTLCache:
+    """TTL付きLRUキャッシュ
+
+    ttl: この秒数以内は新鮮な値としてそのまま返す
+    stale_ttl: ttl経過後この秒数以内は古い値を返しつつバックグラウンドで再取得する
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, stale_ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # invalidate() ごとに進める世代（読み込み中に破棄されたキーの古い結果を格納しないため）
+        self._generation = 0
+        self._key_generations: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def peek(self, key: Hashable) -> Tuple[Optional[Any], Optional[float]]:
+        """値と経過秒数を返す（無ければ (None, None)）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        self._entries.move_to_end(key)
+        return entry[0], time.monotonic() - entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._store(key, value)
+
+    def _generation_of(self, key: Hashable) -> Tuple[int, int]:
+        return self._generation, self._key_generations.get(key, 0)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """指定キー（省略時は全件）を破棄
+
+        読み込み中の結果も破棄の前に読んだ値の可能性があるため格納せず、以降の呼び出しは読み込み直す
+        """
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+            self._key_generations.clear()
+            self._generation += 1
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+            self._key_generations[key] = self._key_generations.get(key, 0) + 1
+
+    async def _load(self, key: Hashable, loader: Loader) -> Any:
+        """同一キーの読み込みを1回の呼び出しに合流"""
+        future = self._inflight.get(key)
+        if future is None:
+            generation = self._generation_of(key)
+            future = asyncio.ensure_future(loader())
+            self._inflight[key] = future
+
+            def done(completed: asyncio.Future) -> None:
+                if self._inflight.get(key) is completed:
+                    self._inflight.pop(key)
+                if completed.cancelled() or completed.exception() is not None:
+                    return
+                if self._generation_of(key) == generation:
+                    self._store(key, completed.result())
+
+            future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    async def get_or_load(self, key: Hashable, loader: Loader) -> Any:
+        """キャッシュから取得、無ければloaderで読み込む"""
+        value, age = self.peek(key)
+        if age is not None and age <= self.ttl:
+            self.hits += 1
+            return value
+        if age is not None and age <= self.ttl + self.stale_ttl:
+            # 古い値を即返し、再取得はバックグラウンドで1回だけ実行
+            self.stale_hits += 1
+            if key not in self._inflight:
+                refresh = asyncio.ensure_future(self._load(key, loader))
+                refresh.add_done_callback(lambda task: task.cancelled() or task.exception())
+            return value
+        self.misses += 1
+        return await self._load(key, loader)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,124 @@
+"""
+テーブルエクスポート用ストリーミングユーティリティ
+サーバーサイドカーソル（yield_per）でチャンク単位に読み出し、NDJSON/CSV/Arrow IPCへ逐次変換する
+メモリ使用量はチャンクサイズ分のみで、テーブル件数に依存しない
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Sequence
+from ..models.database import AsyncSessionLocal
+
+EXPORT_CHUNK_SIZE = 2000
+
+# 形式 → (Content-Type, 拡張子)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+def arrow_available() -> bool:
+    """Arrow出力用のpyarrowが導入済みか"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+async def stream_chunks(stmt, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Sequence]]:
+    """サーバーサイドカーソルで chunk_size 行ずつ取得
+
+    レスポンス送信中も接続を保持する必要があるため、リクエストのセッションではなく専用セッションを使う
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions(chunk_size):
+            yield partition
+
+async def ndjson_stream(stmt, columns: List[str]) -> AsyncIterator[bytes]:
+    """1行1JSONオブジェクト"""
+    async for rows in stream_chunks(stmt):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + "\n"
+            for row in rows
+        ).encode()
+
+async def csv_stream(stmt, columns: List[str]) -> AsyncIterator[bytes]:
+    """ヘッダー付きCSV（Excelで開けるようBOM付きUTF-8）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield ("\ufeff" + buffer.getvalue()).encode()
+    async for rows in stream_chunks(stmt):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+def arrow_schema(stmt, columns: List[str]):
+    """SELECT列の型からArrowスキーマを決定（先頭チャンクが全てNULLでも型が揺れないように）"""
+    import pyarrow as pa
+
+    fields = []
+    for name, column in zip(columns, stmt.selected_columns):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        if python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        elif python_type is Decimal:
+            arrow_type = pa.decimal128(column.type.precision or 38, column.type.scale or 0)
+        elif python_type is datetime:
+            arrow_type = pa.timestamp("us")
+        elif python_type is date:
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+async def arrow_stream(stmt, columns: List[str]) -> AsyncIterator[bytes]:
+    """Arrow IPCストリーム形式（チャンクごとに1レコードバッチを書き出し、書いた分だけ送出）"""
+    import pyarrow as pa
+
+    schema = arrow_schema(stmt, columns)
+    buffer = io.BytesIO()
+    writer = pa.ipc.new_stream(buffer, schema)
+
+    def drain() -> bytes:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    yield drain()
+    async for rows in stream_chunks(stmt):
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array([row[index] for row in rows], type=field.type) for index, field in enumerate(schema)],
+            schema=schema,
+        ))
+        yield drain()
+    writer.close()
+    yield drain()
+
+EXPORT_STREAMS: Dict[str, Any] = {
+    "ndjson": ndjson_stream,
+    "csv": csv_stream,
+    "arrow": arrow_stream,
+}
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+WealthAI 合成データ生成スクリプト
+import_data.py で投入できるCSV（data/csv）を、保有件数を基準にした規模で生成する
+
+    python -m backend.utils.generate_data --holdings 1000000 --seed 42
+    python -m backend.utils.import_data
+
+顧客・商品・担当者数などは保有件数から比例で決まる（個別に上書き可能）
+同じシード・基準日なら同じデータになり、行は逐次書き出すため規模によらずメモリは一定
+"""
+
+import argparse
+import csv
+import random
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+# 保有件数の想定範囲（これを外れる場合は警告のみ）
+MIN_HOLDINGS = 10_000
+MAX_HOLDINGS = 10_000_000
+
+# 保有件数からの既定比率
+HOLDINGS_PER_CUSTOMER = 8
+CUSTOMERS_PER_REP = 200
+# customers.annual_income / net_worth は INTEGER 列のため上限で頭打ちにする
+INT4_MAX = 2**31 - 1
+NOTE_COVERAGE = 0.7
+INFLOWS_PER_CUSTOMER = 1.5
+
+CATEGORIES = ("BOND", "STOCK_DOM", "STOCK_US", "FUND", "STRUCT")
+CURRENCIES = ("JPY", "JPY", "JPY", "USD", "USD", "EUR", "AUD")
+ISSUERS = ("日本国", "トヨタ自動車", "三菱UFJ", "ソフトバンクG", "米国財務省", "Apple", "Microsoft", "欧州投資銀行")
+BRANCHES = ("東京", "大阪", "名古屋", "福岡", "札幌")
+DEPARTMENTS = ("ウェルスマネジメント部", "プライベートバンキング部", "法人営業部")
+LAST_NAMES = ("佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤")
+FIRST_NAMES = ("太郎", "花子", "一郎", "美咲", "健", "陽子", "大輔", "由美", "翔", "真理")
+OCCUPATIONS = ("会社役員", "医師", "弁護士", "会社員", "自営業", "不動産賃貸業", "退職者")
+EXPERIENCES = ("初心者", "経験者", "上級者")
+SOURCE_TYPES = ("business_sale", "retirement", "inheritance", "dividend", "maturity", "bonus", "salary", "other")
+CONFIDENCE_LEVELS = ("high", "medium", "low")
+EVENT_TYPES = ("金融政策", "経済指標", "決算", "選挙", "地政学")
+NOTE_PHRASES = (
+    "満期償還金の再投資について相談あり",
+    "米ドル建て債券に関心",
+    "相続対策として保険商品を検討中",
+    "事業売却の資金使途をヒアリング",
+    "リスク許容度の見直しを提案",
+    "投資信託の分配金受取方法を変更希望",
+    "為替ヘッジの有無について説明",
+    "退職金の運用方針を打ち合わせ",
+)
+
+def rep_of(customer_id: int, reps: int) -> int:
+    """顧客の担当者ID（顧客・メモ・入金予定で同じ担当者にする）"""
+    return (customer_id - 1) % reps + 1
+
+def skewed_id(rng: random.Random, count: int) -> int:
+    """IDの小さいものほど選ばれやすい（一部の顧客・商品に保有が集中する実データの偏りを再現）"""
+    return int(count * rng.random() ** 2) + 1
+
+def _date(value) -> str:
+    return value.isoformat() if value else ""
+
+def sales_representatives(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["rep_id", "rep_code", "name", "department", "branch", "email", "phone", "hire_date"]
+    for rep_id in range(1, counts["reps"] + 1):
+        yield [
+            rep_id, f"R{rep_id:05d}",
+            rng.choice(LAST_NAMES) + rng.choice(FIRST_NAMES),
+            rng.choice(DEPARTMENTS), rng.choice(BRANCHES),
+            f"rep{rep_id}@example.com", f"03-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            _date(as_of - timedelta(days=rng.randint(365, 365 * 30))),
+        ]
+
+def products(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["product_id", "product_code", "product_name", "category_code", "currency", "issuer",
+           "maturity_date", "interest_rate", "risk_level", "minimum_investment", "commission_rate", "is_active"]
+    for product_id in range(1, counts["products"] + 1):
+        category = rng.choice(CATEGORIES)
+        currency = "JPY" if category == "STOCK_DOM" else rng.choice(CURRENCIES)
+        issuer = rng.choice(ISSUERS)
+        has_maturity = category in ("BOND", "STRUCT")
+        yield [
+            product_id, f"P{product_id:07d}", f"{issuer} {category} {currency} 第{product_id}回",
+            category, currency, issuer,
+            _date(as_of + timedelta(days=rng.randint(-180, 365 * 10))) if has_maturity else "",
+            f"{rng.uniform(0.001, 0.08):.4f}" if has_maturity else "",
+            rng.randint(1, 5), rng.choice((10_000, 100_000, 1_000_000, 10_000_000)),
+            f"{rng.uniform(0.0, 0.03):.4f}", "true" if rng.random() < 0.97 else "false",
+        ]
+
+def economic_events(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["event_id", "event_type", "title", "description", "event_date", "impact_level",
+           "affected_sectors", "affected_currencies"]
+    for event_id in range(1, counts["events"] + 1):
+        event_type = rng.choice(EVENT_TYPES)
+        sectors = sorted(rng.sample(CATEGORIES, rng.randint(1, 3)))
+        currencies = sorted(rng.sample(sorted(set(CURRENCIES)), rng.randint(1, 2)))
+        yield [
+            event_id, event_type, f"{event_type}イベント #{event_id}", f"{'・'.join(currencies)}市場への影響が想定される",
+            _date(as_of + timedelta(days=rng.randint(-365, 365))), rng.choice(CONFIDENCE_LEVELS),
+            "{" + ",".join(sectors) + "}", "{" + ",".join(currencies) + "}",
+        ]
+
+def customers(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["customer_id", "customer_code", "name", "name_kana", "birth_date", "gender", "phone", "email",
+           "address", "occupation", "annual_income", "net_worth", "risk_tolerance", "investment_experience",
+           "sales_rep_id"]
+    for customer_id in range(1, counts["customers"] + 1):
+        income = min(int(rng.lognormvariate(16.5, 0.8)), INT4_MAX)
+        net_worth = min(income * rng.randint(3, 40), INT4_MAX)
+        yield [
+            customer_id, f"C{customer_id:08d}",
+            rng.choice(LAST_NAMES) + " " + rng.choice(FIRST_NAMES), "",
+            _date(as_of - timedelta(days=rng.randint(365 * 25, 365 * 90))), rng.choice(("男性", "女性")),
+            f"090-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}", f"customer{customer_id}@example.com",
+            f"{rng.choice(BRANCHES)}市{rng.randint(1, 9)}-{rng.randint(1, 30)}",
+            rng.choice(OCCUPATIONS), income, net_worth,
+            str(rng.randint(1, 5)), rng.choice(EXPERIENCES), rep_of(customer_id, counts["reps"]),
+        ]
+
+def holdings(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["holding_id", "customer_id", "product_id", "quantity", "unit_price", "purchase_date",
+           "current_price", "current_value", "unrealized_gain_loss", "maturity_date", "status"]
+    for holding_id in range(1, counts["holdings"] + 1):
+        quantity = rng.choice((10, 100, 500, 1000, 5000))
+        unit_price = round(rng.uniform(100, 20_000), 2)
+        current_price = round(unit_price * rng.lognormvariate(0.02, 0.15), 2)
+        # 保有固有の満期日は一部のみ（それ以外は商品の満期日を使う）
+        own_maturity = as_of + timedelta(days=rng.randint(0, 365 * 5)) if rng.random() < 0.1 else None
+        yield [
+            holding_id, skewed_id(rng, counts["customers"]), skewed_id(rng, counts["products"]),
+            quantity, f"{unit_price:.2f}", _date(as_of - timedelta(days=rng.randint(1, 365 * 10))),
+            f"{current_price:.2f}", f"{quantity * current_price:.2f}",
+            f"{quantity * (current_price - unit_price):.2f}", _date(own_maturity),
+            "active" if rng.random() < 0.95 else "sold",
+        ]
+
+def sales_notes(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    # 主キーは customer_id（顧客ごとに1件）。一部の顧客はメモなしのまま残す
+    yield ["customer_id", "sales_rep_id", "content"]
+    for customer_id in range(1, counts["customers"] + 1):
+        if rng.random() >= NOTE_COVERAGE:
+            continue
+        phrases = rng.sample(NOTE_PHRASES, rng.randint(1, 4))
+        yield [customer_id, rep_of(customer_id, counts["reps"]), "。".join(phrases) + "。"]
+
+def cash_inflows(rng: random.Random, counts: Dict, as_of: date) -> Iterator[List]:
+    yield ["inflow_id", "customer_id", "source_type", "predicted_amount", "predicted_date", "confidence_level",
+           "source_note", "actual_amount", "actual_date", "status", "sales_rep_id"]
+    for inflow_id in range(1, counts["inflows"] + 1):
+        customer_id = rng.randint(1, counts["customers"])
+        predicted_date = as_of + timedelta(days=rng.randint(-365, 365))
+        predicted_amount = rng.randint(1, 500) * 100_000
+        status = "predicted"
+        actual_amount, actual_date = "", None
+        if predicted_date < as_of:
+            status = rng.choice(("received", "received", "cancelled", "confirmed"))
+            if status == "received":
+                actual_amount = int(predicted_amount * rng.uniform(0.7, 1.2))
+                actual_date = predicted_date + timedelta(days=rng.randint(-15, 30))
+        elif rng.random() < 0.3:
+            status = "confirmed"
+        yield [
+            inflow_id, customer_id, rng.choice(SOURCE_TYPES), predicted_amount, _date(predicted_date),
+            rng.choice(CONFIDENCE_LEVELS), "", actual_amount, _date(actual_date), status,
+            rep_of(customer_id, counts["reps"]),
+        ]
+
+# CSVファイル名 → 行ジェネレータ（import_data.IMPORT_STAGES のファイル名と一致させる）
+GENERATORS: Dict[str, Callable] = {
+    "sales_representatives.csv": sales_representatives,
+    "products.csv": products,
+    "economic_events.csv": economic_events,
+    "customers.csv": customers,
+    "holdings.csv": holdings,
+    "sales_notes.csv": sales_notes,
+    "cash_inflows.csv": cash_inflows,
+}
+
+def scale_counts(holdings_count: int, overrides: Dict) -> Dict:
+    """保有件数から各テーブルの件数を決める（None以外の指定値で上書き）"""
+    customers_count = max(1, holdings_count // HOLDINGS_PER_CUSTOMER)
+    counts = {
+        "holdings": holdings_count,
+        "customers": customers_count,
+        "reps": max(5, customers_count // CUSTOMERS_PER_REP),
+        "products": min(20_000, max(200, holdings_count // 2_000)),
+        "inflows": int(customers_count * INFLOWS_PER_CUSTOMER),
+        "events": 500,
+    }
+    counts.update({key: value for key, value in overrides.items() if value is not None})
+    return counts
+
+def write_csv(path: Path, rows: Iterator[List]) -> int:
+    """行を逐次書き出し、データ行数を返す"""
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(next(rows))
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="WealthAI synthetic data generator")
+    parser.add_argument("--holdings", type=int, default=100_000,
+                        help=f"保有件数（{MIN_HOLDINGS:,}〜{MAX_HOLDINGS:,} を想定）")
+    parser.add_argument("--customers", type=int, default=None)
+    parser.add_argument("--reps", type=int, default=None)
+    parser.add_argument("--products", type=int, default=None)
+    parser.add_argument("--inflows", type=int, default=None)
+    parser.add_argument("--events", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="日付の基準日（既定: 本日。再現性が必要なら固定する）")
+    parser.add_argument("--out", default=None, help="出力ディレクトリ（既定: data/csv）")
+    args = parser.parse_args()
+
+    if not MIN_HOLDINGS <= args.holdings <= MAX_HOLDINGS:
+        print(f"⚠️  --holdings {args.holdings:,} is outside the supported range")
+    counts = scale_counts(args.holdings, {
+        "customers": args.customers, "reps": args.reps, "products": args.products,
+        "inflows": args.inflows, "events": args.events,
+    })
+    as_of = args.as_of or date.today()
+    project_root = Path(__file__).parent.parent.parent
+    out_dir = Path(args.out) if args.out else project_root / "data" / "csv"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🚀 Generating synthetic data (seed={args.seed}, as_of={as_of}) into {out_dir}")
+    started = time.perf_counter()
+    for index, (file_name, generator) in enumerate(GENERATORS.items()):
+        # テーブルごとに乱数系列を分け、生成順や他テーブルの行数の影響を受けないようにする
+        rng = random.Random(args.seed * 1000 + index)
+        table_started = time.perf_counter()
+        count = write_csv(out_dir / file_name, generator(rng, counts, as_of))
+        print(f"✅ {file_name}: {count:,} rows ({time.perf_counter() - table_started:.1f}s)")
+    print(f"✨ Done in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,16 @@ WealthAI データインポートスクリプト
 CSVファイルからPostgreSQLデータベースにサンプルデータをインポートする
 """
 
-import pandas as pd
+import argparse
+import csv
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2 import sql
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+from ..models.database import PORTFOLIO_STATS_REBUILD_SQL, ALL_CUSTOMERS, CUSTOMER_PORTFOLIO_REFRESH_SQL
 
 # 環境変数を読み込み
 load_dotenv()
@@ -27,80 +31,207 @@ def get_db_connection():
     """データベース接続を取得"""
     return psycopg2.connect(**DB_CONFIG)
 
-def import_csv_to_table(csv_file_path, table_name, columns=None):
-    """CSVファイルをテーブルにインポート"""
+# COPYで一度に読み込むバイト数
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# インポート段階（同じ段階のテーブルは外部キー依存がないため並列実行可能）
+IMPORT_STAGES = [
+    [("sales_representatives.csv", "sales_representatives"),
+     ("products.csv", "products"),
+     ("economic_events.csv", "economic_events")],
+    [("customers.csv", "customers")],
+    [("holdings.csv", "holdings"),
+     ("sales_notes.csv", "sales_notes"),
+     ("cash_inflows.csv", "cash_inflows")],
+]
+
+def read_csv_header(csv_file):
+    """CSVのヘッダー行を読み込み、カラム名リストを返す（ファイル位置はデータ先頭へ）"""
+    return next(csv.reader([csv_file.readline()]))
+
+def get_primary_key_columns(cursor, table_name):
+    """テーブルの主キーカラムを取得"""
+    cursor.execute("""
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+    """, (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+def copy_csv(cursor, csv_file, table_name, columns):
+    """CSVをCOPY FROM STDINでストリーミング投入（空欄はNULL）"""
+    columns_sql = sql.SQL(',').join(sql.Identifier(column) for column in columns)
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table_name), columns_sql
+    )
+    cursor.copy_expert(copy_query.as_string(cursor), csv_file, size=COPY_CHUNK_SIZE)
+    return cursor.rowcount
+
+def upsert_via_staging(cursor, csv_file, table_name, columns):
+    """一時ステージングテーブルにCOPYしてから主キーでUPSERT（再インポート用）"""
+    staging = f"{table_name}_staging"
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+        sql.Identifier(staging), sql.Identifier(table_name)
+    ))
+    copy_csv(cursor, csv_file, staging, columns)
+
+    key_columns = get_primary_key_columns(cursor, table_name)
+    update_columns = [column for column in columns if column not in key_columns]
+    columns_sql = sql.SQL(',').join(sql.Identifier(column) for column in columns)
+    if update_columns:
+        conflict_action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(',').join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in update_columns
+        ))
+    else:
+        conflict_action = sql.SQL("DO NOTHING")
+    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT ({}) {}").format(
+        sql.Identifier(table_name), columns_sql, columns_sql, sql.Identifier(staging),
+        sql.SQL(',').join(sql.Identifier(column) for column in key_columns), conflict_action
+    ))
+    return cursor.rowcount
+
+def import_csv_to_table(csv_file_path, table_name, columns=None, mode="append"):
+    """CSVファイルをテーブルにインポート（COPYによるストリーミング・メモリ一定）
+
+    mode: append = 直接COPY / upsert = ステージング経由で主キーUPSERT
+    """
+    conn = None
     try:
-        # CSVファイルを読み込み
-        df = pd.read_csv(csv_file_path)
-        print(f"Loading {csv_file_path} -> {table_name} ({len(df)} rows)")
-        
-        # データベース接続
+        started = time.perf_counter()
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # カラム名を指定されていない場合はCSVのヘッダーを使用
-        if columns is None:
-            columns = list(df.columns)
-        
-        # データをタプルのリストに変換（NaNをNoneに変換）
-        data_tuples = []
-        for row in df.values:
-            # NaNをNoneに変換
-            converted_row = []
-            for value in row:
-                if pd.isna(value):
-                    converted_row.append(None)
-                else:
-                    converted_row.append(value)
-            data_tuples.append(tuple(converted_row))
-        
-        # プレースホルダーを作成
-        placeholders = ','.join(['%s'] * len(columns))
-        columns_str = ','.join(columns)
-        
-        # INSERT文を実行
-        insert_query = f"INSERT INTO {table_name} ({columns_str}) VALUES %s"
-        execute_values(cursor, insert_query, data_tuples)
+        with open(csv_file_path, newline='', encoding='utf-8') as csv_file:
+            # カラム名を指定されていない場合はCSVのヘッダーを使用
+            header = read_csv_header(csv_file)
+            if columns is None:
+                columns = header
+            
+            if mode == "upsert":
+                row_count = upsert_via_staging(cursor, csv_file, table_name, columns)
+            else:
+                row_count = copy_csv(cursor, csv_file, table_name, columns)
         
         conn.commit()
         cursor.close()
-        conn.close()
         
-        print(f"✅ Successfully imported {len(df)} rows to {table_name}")
+        elapsed = time.perf_counter() - started
+        rate = row_count / elapsed if elapsed > 0 else 0
+        print(f"✅ Successfully imported {row_count} rows to {table_name} "
+              f"({elapsed:.2f}s, {rate:,.0f} rows/s, mode={mode})")
+        return row_count
         
     except Exception as e:
         print(f"❌ Error importing {csv_file_path}: {str(e)}")
-        if 'conn' in locals():
+        if conn is not None:
             conn.rollback()
+        return 0
+    finally:
+        if conn is not None:
             conn.close()
 
+# インポート後に作り直す集計テーブル（テーブル名 → 順に実行するSQL。アプリと同じ定義を使う）
+SUMMARY_REFRESH_SQL = {
+    # ダッシュボード集計（件数はCOPY中もトリガーで維持されるが、保有集計とあわせて数え直す）
+    "portfolio_stats": PORTFOLIO_STATS_REBUILD_SQL,
+    # 顧客別ポートフォリオ集計（全顧客分。アプリの個別再集計とは配分テーブルのロックで直列化する）
+    "customer_portfolios": (
+        "LOCK TABLE customer_portfolio_allocations IN SHARE ROW EXCLUSIVE MODE",
+        *(statement.format(customer_filter=ALL_CUSTOMERS) for statement in CUSTOMER_PORTFOLIO_REFRESH_SQL),
+    ),
+}
+
+def reset_sequences():
+    """ID指定で投入したテーブルの連番を最大IDに合わせる（以降のアプリからの登録でID重複しないよう）"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        for stage in IMPORT_STAGES:
+            for _, table_name in stage:
+                for key_column in get_primary_key_columns(cursor, table_name):
+                    # 連番を持たない主キー（sales_notes.customer_id 等）は NULL になり何もしない
+                    cursor.execute(sql.SQL(
+                        "SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({0}), 1), MAX({0}) IS NOT NULL) FROM {1}"
+                    ).format(sql.Identifier(key_column), sql.Identifier(table_name)), (table_name, key_column))
+        conn.commit()
+        cursor.close()
+        print("✅ Reset id sequences")
+    except Exception as e:
+        print(f"❌ Error resetting sequences: {str(e)}")
+        if conn is not None:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            conn.close()
+
+def refresh_summary_tables():
+    """インポート後にアプリ側で維持している集計テーブルを再構築"""
+    for table_name, statements in SUMMARY_REFRESH_SQL.items():
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT to_regclass(%s)", (table_name,))
+            if cursor.fetchone()[0] is None:
+                print(f"⚠️  {table_name} table not found (created on app startup)")
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+            cursor.close()
+            print(f"✅ Refreshed {table_name}")
+        except Exception as e:
+            print(f"❌ Error refreshing {table_name}: {str(e)}")
+            if conn is not None:
+                conn.rollback()
+        finally:
+            if conn is not None:
+                conn.close()
+
 def main():
     """メイン処理"""
+    parser = argparse.ArgumentParser(description="WealthAI CSV import (COPY streaming)")
+    parser.add_argument("--csv-dir", default=None, help="CSVディレクトリ（既定: data/csv）")
+    parser.add_argument("--mode", choices=["append", "upsert"], default="append",
+                        help="append: 直接COPY / upsert: ステージング経由で再インポート")
+    parser.add_argument("--workers", type=int, default=3, help="同一段階で並列に投入するテーブル数")
+    args = parser.parse_args()
+    
     # プロジェクトルートディレクトリを取得
     project_root = Path(__file__).parent.parent.parent
-    csv_dir = project_root / "data" / "csv"
+    csv_dir = Path(args.csv_dir) if args.csv_dir else project_root / "data" / "csv"
     
     print("🚀 Starting data import process...")
     print(f"Database: {DB_CONFIG['user']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
     
-    # インポート順序（外部キー制約を考慮）
-    import_order = [
-        ("sales_representatives.csv", "sales_representatives"),
-        ("customers.csv", "customers"),
-        ("products.csv", "products"),
-        ("holdings.csv", "holdings"),
-        ("sales_notes.csv", "sales_notes"),
-        ("cash_inflows.csv", "cash_inflows"),
-        ("economic_events.csv", "economic_events"),
-    ]
+    started = time.perf_counter()
+    total_rows = 0
+    
+    # 段階ごとに実行（外部キー制約を考慮）し、段階内のテーブルは並列に投入
+    for stage in IMPORT_STAGES:
+        tasks = []
+        for csv_file, table_name in stage:
+            csv_path = csv_dir / csv_file
+            if csv_path.exists():
+                tasks.append((csv_path, table_name))
+            else:
+                print(f"⚠️  CSV file not found: {csv_path}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [
+                executor.submit(import_csv_to_table, csv_path, table_name, None, args.mode)
+                for csv_path, table_name in tasks
+            ]
+            total_rows += sum(future.result() for future in futures)
     
-    for csv_file, table_name in import_order:
-        csv_path = csv_dir / csv_file
-        if csv_path.exists():
-            import_csv_to_table(csv_path, table_name)
-        else:
-            print(f"⚠️  CSV file not found: {csv_path}")
+    reset_sequences()
+    refresh_summary_tables()
     
+    elapsed = time.perf_counter() - started
+    rate = total_rows / elapsed if elapsed > 0 else 0
+    print(f"📊 Imported {total_rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
     print("✨ Data import process completed!")
 
 if __name__ == "__main__":
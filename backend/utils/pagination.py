@@ -0,0 +1,74 @@
+"""
+キーセット（シーク）ページネーション用ユーティリティ
+不透明カーソルのエンコード/デコード、fields= 列射影の解決、ページ取得
+"""
+
+import base64
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(last_key: Any) -> str:
+    """最終キー（JSONで表せる値、複合キーはリスト）を不透明カーソル文字列に変換"""
+    payload = json.dumps({"k": last_key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], parse: Callable[[Any], Any] = int) -> Optional[Any]:
+    """カーソル文字列から最終キーを復元（parseでキーの型に変換、不正な場合は400）"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return parse(json.loads(base64.urlsafe_b64decode(padded))["k"])
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def model_columns(model) -> Dict[str, Any]:
+    """モデルの列名→列属性マップ（リレーションは含まない）"""
+    return {attr.key: getattr(model, attr.key) for attr in inspect(model).column_attrs}
+
+def resolve_fields(fields: Optional[str], available: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """fields=a,b,c を列属性に解決（ページングキーは常に含める）"""
+    if not fields:
+        return dict(available)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if key not in names:
+        names.insert(0, key)
+    return {name: available[name] for name in names}
+
+async def paginate(db: AsyncSession, stmt, key_column, cursor: Optional[str], limit: int,
+                   scalars: bool = False) -> Tuple[List, Optional[str]]:
+    """キー列の昇順で limit+1 件だけ取得し、(ページ, 次ページカーソル) を返す
+
+    scalars=True のときはORMエンティティ、それ以外は列射影の行を返す
+    """
+    last_key = decode_cursor(cursor)
+    if last_key is not None:
+        stmt = stmt.where(key_column > last_key)
+    stmt = stmt.order_by(key_column).limit(limit + 1)
+    result = await (db.scalars(stmt) if scalars else db.execute(stmt))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_key = getattr(last, key_column.key) if scalars else last._mapping[key_column.key]
+        next_cursor = encode_cursor(last_key)
+    return rows, next_cursor
+
+def page_response(rows: List, next_cursor: Optional[str], limit: int) -> Dict:
+    """列射影の行をAPIレスポンス形式に変換"""
+    return {
+        "items": [dict(row._mapping) for row in rows],
+        "next_cursor": next_cursor,
+        "limit": limit,
+    }
@@ -0,0 +1,89 @@
+"""
+リクエストプロファイリング
+リクエストごとのレイテンシ・SQL発行数・DB時間・テンプレート描画時間をルート単位で集計し、
+Prometheus形式のメトリクス（/metrics）と Server-Timing ヘッダーで公開する
+
+SQLの件数・時間は query_counter、テンプレート描画時間は TimedTemplate で計測する
+（ストリーミング応答はヘッダー送信までの時間のみが対象）
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from jinja2 import Template
+from starlette.requests import Request
+from .metrics import registry
+from .query_counter import QueryCounter
+
+# Server-Timing ヘッダーの付与（ブラウザの開発者ツールで内訳を確認できる）
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# SQL発行数のバケット（件数）
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "Request latency by route")
+REQUEST_DB_SECONDS = registry.histogram("http_request_db_seconds", "Total SQL execution time per request by route")
+REQUEST_STATEMENTS = registry.histogram(
+    "http_request_db_statements", "SQL statements per request by route", buckets=STATEMENT_BUCKETS
+)
+TEMPLATE_RENDER_SECONDS = registry.histogram("template_render_seconds", "Jinja2 template render time")
+
+class RequestProfile:
+    """1リクエスト中のテンプレート描画時間（秒）"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.render_seconds = 0.0
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+class TimedTemplate(Template):
+    """描画時間を計測するテンプレート（Environment.template_class に設定して使う）"""
+
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            TEMPLATE_RENDER_SECONDS.observe(elapsed, template=self.name or "<string>")
+            profile = _current_profile.get()
+            if profile is not None:
+                profile.render_seconds += elapsed
+
+def instrument_templates(templates) -> None:
+    """Jinja2Templates の描画時間を計測対象にする（テンプレート読み込み前に呼ぶこと）"""
+    templates.env.template_class = TimedTemplate
+
+def start() -> RequestProfile:
+    """現在のコンテキストで計測を開始"""
+    profile = RequestProfile()
+    _current_profile.set(profile)
+    return profile
+
+def route_of(request: Request) -> str:
+    """メトリクスのラベル用にパスパラメータを含まないルートのパスを返す"""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+def record(request: Request, status_code: int, profile: RequestProfile, counter: QueryCounter) -> Dict[str, float]:
+    """ルート単位のメトリクスに記録し、内訳（ミリ秒）を返す"""
+    total = time.perf_counter() - profile.started_at
+    labels = {"route": route_of(request), "method": request.method}
+    REQUEST_SECONDS.observe(total, status=status_code, **labels)
+    REQUEST_DB_SECONDS.observe(counter.db_seconds, **labels)
+    REQUEST_STATEMENTS.observe(counter.count, **labels)
+    return {
+        "db": counter.db_seconds * 1000,
+        "render": profile.render_seconds * 1000,
+        "total": total * 1000,
+    }
+
+def server_timing(timings: Dict[str, float], statements: int) -> str:
+    """Server-Timing ヘッダーの値"""
+    return ", ".join([
+        f'db;dur={timings["db"]:.1f};desc="{statements} queries"',
+        f'render;dur={timings["render"]:.1f}',
+        f'total;dur={timings["total"]:.1f}',
+    ])
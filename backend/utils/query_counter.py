@@ -0,0 +1,109 @@
+"""
+リクエスト単位のSQL発行数カウンタ
+エンジンのカーソル実行イベントを ContextVar 上のカウンタに集計し、
+ページごとの発行数上限（クエリ予算）を検査する
+
+あわせてSQLの実行時間を計測し、SLOW_QUERY_LOG_MS を指定した場合は閾値を超えたSELECTの
+EXPLAIN ANALYZE をログに出力する（計画取得のため同じ文をもう一度実行するので本番では閾値を高めに）
+"""
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+from sqlalchemy import event
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# テスト/CIモードでは予算超過をエラーにする
+ENFORCE_QUERY_BUDGET = os.getenv("QUERY_BUDGET_ENFORCE", "false").lower() in ("1", "true", "yes")
+
+# スロークエリログの閾値（ミリ秒、未指定なら無効）
+SLOW_QUERY_LOG_MS = float(os.getenv("SLOW_QUERY_LOG_MS", 0)) or None
+
+SLOW_QUERIES = registry.counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_LOG_MS")
+
+class QueryCounter:
+    """1リクエスト中に発行されたSQL文の件数と合計実行時間（秒）"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0.0
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+def _on_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.count += 1
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+def _on_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started_at"].pop()
+    elapsed = time.perf_counter() - started
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.db_seconds += elapsed
+    if SLOW_QUERY_LOG_MS is not None and elapsed * 1000 >= SLOW_QUERY_LOG_MS:
+        SLOW_QUERIES.inc()
+        _log_slow_query(conn, statement, parameters, elapsed, executemany)
+
+def _on_handle_error(context):
+    # 失敗した文の開始時刻を破棄し、入れ子の計測がずれないようにする
+    started = context.connection.info.get("query_started_at") if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _log_slow_query(conn, statement: str, parameters, elapsed: float, executemany: bool) -> None:
+    """スロークエリをログに出力（SELECTのみ EXPLAIN ANALYZE の結果を添付）"""
+    plan = None
+    if not executemany and statement.lstrip()[:6].upper() == "SELECT":
+        # 別カーソル・セーブポイント内で実行し、失敗しても元のトランザクションと結果に影響させない
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as e:
+            plan = plan or f"EXPLAIN failed: {e}"
+        finally:
+            cursor.close()
+    logger.warning("Slow query (%.1f ms): %s\nparameters: %r\n%s",
+                   elapsed * 1000, statement, parameters, plan or "(no plan)")
+
+def install(engine) -> None:
+    """エンジン（AsyncEngineの場合は sync_engine）にカウンタ・実行時間の計測を登録"""
+    event.listen(engine, "before_cursor_execute", _on_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _on_after_cursor_execute)
+    event.listen(engine, "handle_error", _on_handle_error)
+
+def start() -> QueryCounter:
+    """現在のコンテキストでカウントを開始"""
+    counter = QueryCounter()
+    _current_counter.set(counter)
+    return counter
+
+def query_budget(max_statements: int) -> Callable:
+    """ルート関数にSQL発行数の上限を宣言するデコレータ（@app.get の下に付ける）"""
+    def decorator(func: Callable) -> Callable:
+        func.__query_budget__ = max_statements
+        return func
+    return decorator
+
+def budget_of(endpoint) -> Optional[int]:
+    return getattr(endpoint, "__query_budget__", None)
+
+def check_budget(path: str, counter: QueryCounter, budget: Optional[int]) -> Optional[str]:
+    """予算超過時にメッセージを返す（強制モードでなければ警告ログのみ）"""
+    if budget is None or counter.count <= budget:
+        return None
+    message = f"Query budget exceeded on {path}: {counter.count} statements > {budget}"
+    logger.warning(message)
+    return message if ENFORCE_QUERY_BUDGET else None
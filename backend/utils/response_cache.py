@@ -0,0 +1,183 @@
+"""
+レスポンスキャッシュ
+参照系ページ・APIの描画済みレスポンスをキャッシュし、ETag / Last-Modified による304再検証に対応する
+
+キャッシュキーには名前空間（products / customers 等）の世代を含め、書き込み時は invalidate() で
+世代を進めるだけで該当エントリをまとめて無効化する（キーの走査は不要）
+
+バックエンド:
+    既定はプロセス内のTTL付きLRU（AsyncTTLCache）
+    RESPONSE_CACHE_URL=redis://... を指定するとRedis互換サーバーを共有（複数ワーカー間で無効化を共有）
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from .cache import AsyncTTLCache
+from .metrics import registry
+
+CACHE_HITS = registry.counter("response_cache_hits_total", "Responses served from the response cache")
+CACHE_MISSES = registry.counter("response_cache_misses_total", "Responses rendered and stored in the response cache")
+CACHE_NOT_MODIFIED = registry.counter("response_cache_not_modified_total", "Conditional requests answered with 304")
+
+# ブラウザには保存を許可しつつ、毎回ETagで再検証させる
+CACHE_CONTROL = "private, no-cache"
+
+class MemoryBackend:
+    """プロセス内バックエンド（ワーカーごとに独立）"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = AsyncTTLCache(maxsize=maxsize, ttl=ttl, stale_ttl=0)
+        self.ttl = ttl
+        self.started_at = time.time()
+        self.namespaces: Dict[str, float] = {}
+
+    async def get(self, key: str) -> Optional[Dict]:
+        value, age = self.entries.peek(key)
+        if age is None or age > self.ttl:
+            return None
+        return value
+
+    async def set(self, key: str, value: Dict) -> None:
+        self.entries.set(key, value)
+
+    async def namespace_stamps(self, names: Iterable[str]) -> Dict[str, float]:
+        return {name: self.namespaces.get(name, self.started_at) for name in names}
+
+    async def invalidate(self, names: Iterable[str]) -> None:
+        now = time.time()
+        for name in names:
+            # 同一秒内の連続更新でも世代が変わるよう単調増加させる
+            self.namespaces[name] = max(now, self.namespaces.get(name, 0) + 1e-6)
+
+class RedisBackend:
+    """Redis互換サーバーを使う共有バックエンド（redisパッケージが必要）"""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "crm:response"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Dict]:
+        payload = await self.client.get(f"{self.prefix}:entry:{key}")
+        return json.loads(payload) if payload else None
+
+    async def set(self, key: str, value: Dict) -> None:
+        await self.client.set(f"{self.prefix}:entry:{key}", json.dumps(value), ex=int(self.ttl))
+
+    async def namespace_stamps(self, names: Iterable[str]) -> Dict[str, float]:
+        names = list(names)
+        keys = [f"{self.prefix}:ns:{name}" for name in names]
+        stamps = {}
+        for name, key, value in zip(names, keys, await self.client.mget(keys)):
+            if value is None:
+                # 初回参照時の時刻を世代の起点にする（他ワーカーが先に設定していればそちらを採用）
+                await self.client.set(key, repr(time.time()), nx=True)
+                value = await self.client.get(key)
+            stamps[name] = float(value)
+        return stamps
+
+    async def invalidate(self, names: Iterable[str]) -> None:
+        for name in names:
+            await self.client.set(f"{self.prefix}:ns:{name}", repr(time.time()))
+
+class ResponseCache:
+    """名前空間の世代付きレスポンスキャッシュ"""
+
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        ttl = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+        url = os.getenv("RESPONSE_CACHE_URL")
+        if url:
+            self.backend = RedisBackend(url, ttl)
+        else:
+            self.backend = MemoryBackend(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 512)), ttl=ttl)
+
+    async def invalidate(self, *namespaces: str) -> None:
+        """書き込み後に呼び出し、指定名前空間に依存するキャッシュをまとめて無効化"""
+        await self.backend.invalidate(namespaces)
+
+    async def _lookup(self, request: Request, namespaces: Tuple[str, ...]) -> Tuple[str, float, Optional[Dict]]:
+        """(キャッシュキー, 最終更新時刻, エントリ) を返す"""
+        stamps = await self.backend.namespace_stamps(namespaces)
+        generation = ",".join(f"{name}={stamps[name]!r}" for name in namespaces)
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        key = hashlib.sha1(f"{request.url.path}?{query}|{generation}".encode()).hexdigest()
+        return key, max(stamps.values()), await self.backend.get(key)
+
+    @staticmethod
+    def _not_modified(request: Request, entry: Dict) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            return entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= int(entry["last_modified"])
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _respond(request: Request, entry: Dict, namespace: str) -> Response:
+        headers = {
+            "ETag": entry["etag"],
+            "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+            "Cache-Control": CACHE_CONTROL,
+        }
+        if ResponseCache._not_modified(request, entry):
+            CACHE_NOT_MODIFIED.inc(namespace=namespace)
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"].encode(), media_type=entry["media_type"], headers=headers)
+
+    def cached(self, *namespaces: str) -> Callable:
+        """ルートの応答を名前空間付きでキャッシュするデコレータ（ルートは request 引数を持つこと）
+
+        JSONを返すルートは JSONResponse に変換して保存する
+        """
+        def decorator(func: Callable) -> Callable:
+            if "request" not in inspect.signature(func).parameters:
+                raise TypeError(f"{func.__name__} needs a request parameter to be cached")
+            label = namespaces[0]
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request: Request = kwargs["request"]
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                key, last_modified, entry = await self._lookup(request, namespaces)
+                if entry is not None:
+                    CACHE_HITS.inc(namespace=label)
+                    return self._respond(request, entry, label)
+
+                response = await func(*args, **kwargs)
+                if not isinstance(response, Response):
+                    response = JSONResponse(jsonable_encoder(response))
+                if response.status_code != 200:
+                    return response
+                body = response.body.decode()
+                entry = {
+                    "body": body,
+                    "media_type": response.media_type,
+                    "etag": '"' + hashlib.sha1(response.body).hexdigest() + '"',
+                    "last_modified": last_modified,
+                }
+                await self.backend.set(key, entry)
+                CACHE_MISSES.inc(namespace=label)
+                return self._respond(request, entry, label)
+
+            return wrapper
+        return decorator
+
+# シングルトンインスタンス
+response_cache = ResponseCache()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+WealthAI CRM 同時接続ベンチマーク
+N個の並列クライアントで各ルートを叩き、スループットとレイテンシを計測する
+
+使い方（変更前後のサーバーを並べて比較）:
+    python benchmarks/concurrency_bench.py \\
+        --target before=http://localhost:8000 --target after=http://localhost:8010 \\
+        --clients 1 8 32 --duration 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/",
+    "/customers",
+    "/holdings",
+    "/api/stats",
+    "/api/customers?limit=100",
+    "/api/holdings?limit=100",
+]
+
+async def client_loop(client: httpx.AsyncClient, paths: List[str], deadline: float,
+                      latencies: List[float], errors: List[int]) -> None:
+    """期限までパスを順番にリクエストし続ける（1クライアント分）"""
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append(time.perf_counter() - started)
+
+async def run_level(base_url: str, paths: List[str], clients: int, duration: float) -> Dict:
+    """指定した並列数で duration 秒間負荷をかけて集計"""
+    latencies: List[float] = []
+    errors: List[int] = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            client_loop(client, paths, deadline, latencies, errors) for _ in range(clients)
+        ])
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies) or [0.0]
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+async def main_async(args) -> None:
+    targets = dict(target.split("=", 1) for target in args.target)
+    paths = args.paths or DEFAULT_PATHS
+
+    print(f"{'target':<10} {'clients':>7} {'requests':>9} {'errors':>6} {'req/s':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for clients in args.clients:
+        for label, base_url in targets.items():
+            result = await run_level(base_url, paths, clients, args.duration)
+            print(f"{label:<10} {result['clients']:>7} {result['requests']:>9} {result['errors']:>6} "
+                  f"{result['rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="WealthAI CRM concurrency benchmark")
+    parser.add_argument("--target", action="append", default=None,
+                        help="label=base_url（複数指定で変更前後を比較）")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="並列数ごとの計測秒数")
+    parser.add_argument("--paths", nargs="+", default=None)
+    args = parser.parse_args()
+    if not args.target:
+        args.target = ["crm=http://localhost:8000"]
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
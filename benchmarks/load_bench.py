@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+WealthAI CRM ルート別負荷ベンチマーク
+アプリの全GETルート（/openapi.json から取得）に順番に負荷をかけ、ルートごとの
+p50/p95/p99レイテンシ・スループット・メモリを計測する。結果をJSONで保存し、
+基準結果と比較してp95の悪化を検出できる（悪化があれば終了コード1）
+
+データは合成データ生成スクリプトで用意する（IDが1から振られるため既定のパスパラメータで動く）:
+    python -m backend.utils.generate_data --holdings 1000000 --as-of 2026-01-01
+    python -m backend.utils.import_data
+
+使い方:
+    # 起動済みサーバーに対して（--server-pid を指定するとサーバーのRSSも計測）
+    python benchmarks/load_bench.py --base-url http://localhost:8000 --server-pid $(pgrep -f uvicorn | head -1) \\
+        --output bench/current.json
+    # アプリをプロセス内で起動して計測（tracemallocでルートごとのPythonメモリ確保量も計測）
+    python benchmarks/load_bench.py --in-process --baseline bench/main.json --max-regression 0.2
+
+書き込み系ルート（POST/PUT/DELETE）はデータを変えるため対象外
+
+レスポンスキャッシュ（RESPONSE_CACHE_ENABLED）が効くとウォームアップ後はすべてキャッシュ応答になり、
+DBアクセス・描画を計測できないため、既定ではキャッシュを外して計測する
+（--in-process はキャッシュを無効化して起動、サーバー指定時はリクエストごとに異なる
+クエリパラメータ CACHE_BUST_PARAM を付ける）。キャッシュ込みの性能は --cached で計測する
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+# 必須パスパラメータ・クエリパラメータの既定値（--param name=value で上書き）
+DEFAULT_PARAMS = {
+    "customer_id": "1",
+    "holding_id": "1",
+    "event_id": "1",
+    "resource": "customers",
+    "ids": ",".join(str(customer_id) for customer_id in range(1, 51)),
+    "q": "満期",
+}
+
+# キャッシュを外すためにリクエストごとに付けるクエリパラメータ（ルート側では未定義のため無視される）
+CACHE_BUST_PARAM = "_bench"
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """プロセスの常駐メモリ（Linuxの /proc を参照、取得できなければ None）"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+class RssSampler:
+    """計測中のRSSを一定間隔でサンプリングし、開始時からの最大増分を求める"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.baseline = self.peak = rss_bytes(pid) if pid else None
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            value = rss_bytes(self.pid)
+            if value is not None:
+                self.peak = max(self.peak or 0, value)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        if self.baseline is not None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        if self._task is not None:
+            self._task.cancel()
+
+    def result(self) -> Dict:
+        if self.baseline is None:
+            return {"rss_mb": None, "rss_peak_delta_mb": None}
+        return {
+            "rss_mb": round(self.peak / 2**20, 1),
+            "rss_peak_delta_mb": round((self.peak - self.baseline) / 2**20, 1),
+        }
+
+def percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+
+def discover_paths(openapi: Dict, params: Dict[str, str], include: List[str], exclude: List[str]) -> List[str]:
+    """OpenAPIスキーマからGETルートを列挙し、必須パラメータを埋めたパスを返す"""
+    paths = []
+    for template, operations in openapi["paths"].items():
+        operation = operations.get("get")
+        if operation is None:
+            continue
+        if include and not any(re.search(pattern, template) for pattern in include):
+            continue
+        if any(re.search(pattern, template) for pattern in exclude):
+            continue
+
+        path, query, missing = template, {}, []
+        for parameter in operation.get("parameters", []):
+            name = parameter["name"]
+            if parameter["in"] == "path":
+                if name in params:
+                    path = path.replace("{" + name + "}", params[name])
+                else:
+                    missing.append(name)
+            elif parameter["in"] == "query" and parameter.get("required"):
+                if name in params:
+                    query[name] = params[name]
+                else:
+                    missing.append(name)
+        if missing:
+            print(f"⚠️  skip {template}: no value for {', '.join(missing)} (use --param name=value)", file=sys.stderr)
+            continue
+        paths.append(path + ("?" + str(httpx.QueryParams(query)) if query else ""))
+    return paths
+
+async def bench_path(client: httpx.AsyncClient, path: str, requests: int, concurrency: int,
+                     server_pid: Optional[int], trace_python: bool, cache_bust: bool = False) -> Dict:
+    """1ルートに requests 件を concurrency 並列で送り、集計する"""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = iter(range(requests))
+    serial = itertools.count()
+
+    def get(path: str):
+        if cache_bust:
+            return client.get(path, params={CACHE_BUST_PARAM: next(serial)})
+        return client.get(path)
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await get(path)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    # ウォームアップ（接続確立・テンプレート読み込み等を計測から除く）
+    await get(path)
+    if trace_python:
+        tracemalloc.start()
+    with RssSampler(server_pid) as sampler:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    python_peak = None
+    if trace_python:
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50), 2),
+        "p95_ms": round(percentile(ordered, 0.95), 2),
+        "p99_ms": round(percentile(ordered, 0.99), 2),
+        "python_peak_mb": round(python_peak / 2**20, 1) if python_peak is not None else None,
+        **sampler.result(),
+    }
+
+def compare(results: List[Dict], baseline: Dict, max_regression: float, min_delta_ms: float) -> List[str]:
+    """基準結果と比べてp95が悪化したルートを返す（微小な差は min_delta_ms で無視）"""
+    previous = {item["path"]: item for item in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["path"])
+        if before is None or not before["p95_ms"]:
+            continue
+        delta = result["p95_ms"] - before["p95_ms"]
+        if delta > min_delta_ms and delta / before["p95_ms"] > max_regression:
+            regressions.append(f"{result['path']}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+    return regressions
+
+async def main_async(args) -> int:
+    params = {**DEFAULT_PARAMS, **dict(param.split("=", 1) for param in args.param)}
+    if args.in_process:
+        # 起動処理（テーブル作成等）を含めてアプリをプロセス内で動かす
+        sys.path.insert(0, str(Path(__file__).parent.parent))
+        if not args.cached:
+            os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+        from backend.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        base_url, server_pid = "http://bench", os.getpid()
+        lifespan = app.router.lifespan_context(app)
+    else:
+        transport, base_url, server_pid, lifespan = None, args.base_url, args.server_pid, None
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=120.0) as client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            openapi = (await client.get("/openapi.json")).json()
+            paths = discover_paths(openapi, params, args.include, args.exclude)
+            print(f"{'path':<60} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>4} {'mem MB':>7}")
+            results = []
+            for path in paths:
+                result = await bench_path(client, path, args.requests, args.concurrency,
+                                          server_pid, trace_python=args.in_process,
+                                          cache_bust=not args.cached and not args.in_process)
+                results.append(result)
+                memory = result["python_peak_mb"] if args.in_process else result["rss_peak_delta_mb"]
+                print(f"{path[:60]:<60} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                      f"{result['p99_ms']:>8.1f} {result['errors']:>4} {memory if memory is not None else '-':>7}")
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": "in-process" if args.in_process else args.base_url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "cached": args.cached,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"📄 Saved {args.output}")
+
+    failed = [result["path"] for result in results if result["errors"]]
+    if failed:
+        print(f"❌ Errors on: {', '.join(failed)}")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()),
+                              args.max_regression, args.min_delta_ms)
+        for line in regressions:
+            print(f"❌ Regression {line}")
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="WealthAI CRM per-route load benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="アプリをこのプロセス内で起動して計測")
+    parser.add_argument("--server-pid", type=int, default=None, help="RSSを計測するサーバープロセス")
+    parser.add_argument("--requests", type=int, default=200, help="ルートごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cached", action="store_true", help="レスポンスキャッシュを効かせたまま計測")
+    parser.add_argument("--param", action="append", default=[], help="パラメータ値 name=value")
+    parser.add_argument("--include", action="append", default=[], help="対象パスの正規表現")
+    parser.add_argument("--exclude", action="append", default=[], help="除外パスの正規表現")
+    parser.add_argument("--output", default=None, help="結果JSONの保存先")
+    parser.add_argument("--baseline", default=None, help="比較する基準結果JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="許容するp95の悪化率")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="この差未満の悪化は無視")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+営業メモ全文検索ベンチマーク
+bigram tsvector + GINインデックス検索と ILIKE '%語%' の全件走査を同じコーパスで比較する
+
+専用テーブル bench_sales_notes に合成メモ（既定100万件）を生成して計測する（本番テーブルには触れない）:
+    python benchmarks/sales_note_search_bench.py --rows 1000000 --repeat 5
+    python benchmarks/sales_note_search_bench.py --drop   # 計測後にテーブル削除
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from backend.models.database import CRM_BIGRAMS_FUNCTION  # noqa: E402
+from backend.services.sales_note_search_service import bigrams  # noqa: E402
+
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'database': os.getenv('DB_NAME', 'crm'),
+    'user': os.getenv('DB_USER', 'crm_user'),
+    'password': os.getenv('DB_PASSWORD', 'crm123'),
+    'port': int(os.getenv('DB_PORT', 5432))
+}
+
+# 合成メモの語彙（営業メモに頻出する語と、ヒット件数の少ない語を混ぜる）
+VOCABULARY = [
+    "国債", "社債", "投資信託", "外貨預金", "定期預金", "株式", "ETF", "REIT", "満期", "償還",
+    "利回り", "為替", "円安", "円高", "金利上昇", "相続", "贈与", "退職金", "年金", "NISA",
+    "iDeCo", "リスク許容度", "ポートフォリオ", "リバランス", "提案", "面談", "電話", "来店",
+    "ご家族", "不動産", "売却", "買い増し", "分散投資", "米国株", "新興国", "ハイイールド",
+    "仕組債", "ご検討中", "次回訪問", "資料送付",
+]
+
+QUERIES = ["国債", "満期償還", "ハイイールド", "リスク許容度", "円安 提案", "仕組債 ご検討中"]
+
+def create_corpus(cursor, rows: int) -> None:
+    """語彙からランダムに15語を連結したメモを rows 件生成"""
+    cursor.execute("DROP TABLE IF EXISTS bench_sales_notes")
+    cursor.execute("CREATE TABLE bench_sales_notes (note_id BIGINT PRIMARY KEY, content TEXT NOT NULL, search_vector TSVECTOR)")
+    cursor.execute("""
+        INSERT INTO bench_sales_notes (note_id, content)
+        SELECT n, (
+            -- 集約対象を内側の変数にする（外側の列だけを参照すると外側の集約になる）
+            SELECT string_agg(v.words[1 + floor(random() * array_length(v.words, 1))::int], '、')
+            FROM generate_series(1, 15) AS w, (SELECT %s::text[] AS words) AS v
+            WHERE n > 0
+        )
+        FROM generate_series(1, %s) AS n
+    """, (VOCABULARY, rows))
+    cursor.execute("UPDATE bench_sales_notes SET search_vector = to_tsvector('simple', crm_bigrams(content))")
+    cursor.execute("CREATE INDEX ix_bench_sales_notes_search_vector ON bench_sales_notes USING gin (search_vector)")
+    cursor.execute("ANALYZE bench_sales_notes")
+
+def fts_sql(terms):
+    # サービスと同じく語ごとに phraseto_tsquery（bigramの隣接）を AND で結ぶ
+    query = " && ".join(["phraseto_tsquery('simple', %s)"] * len(terms))
+    return (
+        f"SELECT note_id, ts_rank_cd(search_vector, q) AS rank FROM bench_sales_notes, (SELECT {query} AS q) AS t "
+        "WHERE search_vector @@ q ORDER BY rank DESC LIMIT 20",
+        tuple(bigrams(term) for term in terms),
+    )
+
+def ilike_sql(terms):
+    where = " AND ".join(["content ILIKE %s"] * len(terms))
+    return (
+        f"SELECT note_id FROM bench_sales_notes WHERE {where} ORDER BY note_id LIMIT 20",
+        tuple(f"%{term}%" for term in terms),
+    )
+
+def count_sql(kind, terms):
+    sql, params = (fts_sql if kind == "fts" else ilike_sql)(terms)
+    return f"SELECT count(*) FROM ({sql.split(' ORDER BY ')[0]}) AS matched", params
+
+def measure(cursor, sql: str, params, repeat: int) -> float:
+    """中央値（ミリ秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sales note full-text search benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--reuse", action="store_true", help="既存の bench_sales_notes をそのまま使う")
+    parser.add_argument("--drop", action="store_true", help="計測後にテーブルを削除")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(CRM_BIGRAMS_FUNCTION)
+
+    if not args.reuse:
+        started = time.perf_counter()
+        create_corpus(cursor, args.rows)
+        print(f"corpus: {args.rows:,} notes built in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'query':<20} {'matches':>9} {'fts ms':>9} {'ilike ms':>9} {'speedup':>8}")
+    for query in QUERIES:
+        terms = query.split()
+        cursor.execute(*count_sql("fts", terms))
+        matches = cursor.fetchone()[0]
+        fts_ms = measure(cursor, *fts_sql(terms), args.repeat)
+        ilike_ms = measure(cursor, *ilike_sql(terms), args.repeat)
+        print(f"{query:<20} {matches:>9,} {fts_ms:>9.1f} {ilike_ms:>9.1f} {ilike_ms / fts_ms if fts_ms else 0:>7.1f}x")
+
+    if args.drop:
+        cursor.execute("DROP TABLE bench_sales_notes")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+テスト共通設定
+アプリのモジュールは読み込み時に環境変数を参照するため、import より前に設定する
+（DB_* は未設定ならローカルの既定値。Bedrock はスタブを使い、AWSには接続しない）
+"""
+
+import os
+
+os.environ.setdefault("DB_USER", "crm_user")
+os.environ.setdefault("DB_PASSWORD", "crm123")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("DB_NAME", "crm")
+os.environ["BEDROCK_STUB"] = "true"
+os.environ.setdefault("BEDROCK_STUB_DELAY_MS", "1")
+os.environ.setdefault("CHAT_AUTH_SECRET", "test-secret")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+os.environ["QUERY_BUDGET_ENFORCE"] = "true"
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from backend.main import app
+from backend.models.database import async_engine
+from backend.utils.auth import issue_token
+
+@pytest.fixture
+def auth_headers():
+    """利用者IDの署名付きトークンを付けたヘッダー"""
+    def headers(user_id: str = "rep-001") -> dict:
+        return {"Authorization": f"Bearer {issue_token(user_id)}"}
+    return headers
+
+@pytest_asyncio.fixture
+async def api_client():
+    """アプリをASGIで直接呼び出すクライアント"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    # テストごとにイベントループが変わるため、接続をループをまたいで使い回さない
+    await async_engine.dispose()
+
+@pytest_asyncio.fixture
+async def db_value():
+    """SQLの結果（先頭行の先頭列）を返す。DBに接続できない・データ未投入の場合はスキップ"""
+    async def value(sql: str, **params):
+        try:
+            async with async_engine.connect() as conn:
+                result = (await conn.execute(text(sql), params)).scalar()
+        except (OperationalError, OSError) as e:
+            pytest.skip(f"database is not available: {e}")
+        if result is None:
+            pytest.skip("database is not seeded")
+        return result
+    return value
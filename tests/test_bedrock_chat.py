@@ -0,0 +1,132 @@
+"""
+AIチャットAPIのテスト（StubBedrockClient を使用し、DBには接続しない）
+"""
+
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.bedrock_chat import bedrock_chat_service, BEDROCK_MAX_CONCURRENT_PER_USER
+from backend.bedrock_stub import StubBedrockClient
+
+@pytest.fixture(autouse=True)
+def stub_client(monkeypatch):
+    monkeypatch.setattr(bedrock_chat_service, "bedrock_client", StubBedrockClient(delay_ms=1))
+    yield
+    assert not bedrock_chat_service.active_users, "chat slots were not released"
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def parse_sse(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        payload = json.loads(lines["data"])
+        assert payload["type"] == lines["event"]
+        events.append(payload)
+    return events
+
+def test_chat_requires_authentication(client):
+    assert client.post("/api/chat", json={"message": "こんにちは"}).status_code == 401
+    spoofed = {"X-User-Id": "rep-001", "Authorization": "Bearer rep-001"}
+    assert client.post("/api/chat/stream", json={"message": "こんにちは"}, headers=spoofed).status_code == 401
+
+def test_chat_returns_whole_reply(client, auth_headers):
+    response = client.post("/api/chat", json={"message": "NISAについて"}, headers=auth_headers())
+    assert response.status_code == 200
+    body = response.json()
+    assert "NISAについて" in body["message"]
+    assert body["usage"]["output_tokens"] > 0
+
+def test_chat_stream_sends_deltas_then_done(client, auth_headers):
+    response = client.post("/api/chat/stream", json={"message": "NISAについて"}, headers=auth_headers())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    types = [event["type"] for event in events]
+    assert types[-1] == "done" and types.count("done") == 1
+    assert len(types) > 2 and set(types[:-1]) == {"delta"}
+    assert "NISAについて" in "".join(event["text"] for event in events[:-1])
+    assert events[-1]["usage"]["output_tokens"] == len(events) - 1
+
+def test_chat_over_per_user_limit_is_rejected(client, auth_headers):
+    slots = [bedrock_chat_service.reserve("rep-001") for _ in range(BEDROCK_MAX_CONCURRENT_PER_USER)]
+    try:
+        for path in ("/api/chat", "/api/chat/stream"):
+            response = client.post(path, json={"message": "こんにちは"}, headers=auth_headers("rep-001"))
+            assert response.status_code == 429
+        # 他の利用者は制限を受けない
+        assert client.post("/api/chat", json={"message": "こんにちは"}, headers=auth_headers("rep-002")).status_code == 200
+    finally:
+        for slot in slots:
+            slot.release()
+
+async def call_stream(headers: dict, fail_after_bodies: int) -> None:
+    """ASGIで直接呼び出し、fail_after_bodies 件の本文を送った後の送信で切断（OSError）を起こす"""
+    messages = [{"type": "http.request", "body": json.dumps({"message": "こんにちは"}).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(60)
+
+    async def send(message):
+        if message["type"] == "http.response.start" and fail_after_bodies == 0:
+            raise OSError("client disconnected")
+        if message["type"] == "http.response.body":
+            if len(sent) >= fail_after_bodies:
+                raise OSError("client disconnected")
+            sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/api/chat/stream", "raw_path": b"/api/chat/stream",
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json")]
+                   + [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+    }
+    with pytest.raises(OSError):
+        await app(scope, receive, send)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fail_after_bodies", [0, 1])
+async def test_chat_stream_releases_slot_on_disconnect(auth_headers, fail_after_bodies):
+    # 0: 応答開始前に切断（本文は1度も読まれない）、1: 最初のイベントの送信後に切断
+    await call_stream(auth_headers("rep-001"), fail_after_bodies)
+    assert "rep-001" not in bedrock_chat_service.active_users
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_free_while_stub_blocks(monkeypatch, auth_headers):
+    # トークンごとに100ms同期的に待つ（実際のboto3呼び出しと同じくスレッドをブロックする）
+    monkeypatch.setattr(bedrock_chat_service, "bedrock_client", StubBedrockClient(delay_ms=100))
+    gaps, stop = [], asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        responses = await asyncio.gather(
+            client.post("/api/chat", json={"message": "こんにちは"}, headers=auth_headers("rep-001")),
+            client.post("/api/chat/stream", json={"message": "こんにちは"}, headers=auth_headers("rep-002")),
+        )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await task
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert parse_sse(responses[1].text)[-1]["type"] == "done"
+    assert elapsed > 0.5
+    assert max(gaps) < 0.2
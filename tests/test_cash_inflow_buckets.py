@@ -0,0 +1,60 @@
+"""
+入金予測の期間別集計（cash_inflow_buckets）をトリガーで維持するテスト
+登録・予定日の変更・削除を繰り返しても、集計が入金予測からの再集計と一致し、件数0の行が残らないことを確認する
+
+データ投入済みのDBが必要。変更はすべてロールバックする
+"""
+
+import pytest
+from sqlalchemy import text
+from backend.models.database import async_engine, CASH_INFLOW_BUCKET_COLUMNS, CASH_INFLOW_BUCKET_SELECT
+
+BUCKET_KEYS = "period, bucket_start, customer_id, sales_rep_id, confidence_level, status"
+
+# 保存済みの集計と再集計の差（一致すれば0行）
+DIFF_SQL = f"""
+    SELECT count(*) FROM (
+        (SELECT {CASH_INFLOW_BUCKET_COLUMNS} FROM cash_inflow_buckets
+         EXCEPT ALL {CASH_INFLOW_BUCKET_SELECT.format(sign=1, source="cash_inflows")})
+        UNION ALL
+        ({CASH_INFLOW_BUCKET_SELECT.format(sign=1, source="cash_inflows")}
+         EXCEPT ALL SELECT {CASH_INFLOW_BUCKET_COLUMNS} FROM cash_inflow_buckets)
+    ) diff
+"""
+
+@pytest.mark.asyncio
+async def test_buckets_follow_inserts_moves_and_deletes(db_value):
+    customer_id = await db_value("SELECT min(customer_id) FROM customers")
+    async with async_engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            async def scalar(sql: str, **params):
+                return (await conn.execute(text(sql), params)).scalar()
+
+            buckets = await scalar("SELECT count(*) FROM cash_inflow_buckets")
+            ids = (await conn.execute(text("""
+                INSERT INTO cash_inflows (customer_id, predicted_amount, predicted_date, confidence_level, status)
+                SELECT :customer_id, 1000 * i, DATE '2031-01-01' + i * 40, 'high', 'predicted'
+                FROM generate_series(1, 5) AS i
+                RETURNING inflow_id
+            """), {"customer_id": customer_id})).scalars().all()
+
+            # 予定日・状態を何度も動かす（移動元の区分は件数0になる）
+            for step in range(1, 6):
+                await conn.execute(text("""
+                    UPDATE cash_inflows SET predicted_date = predicted_date + 100,
+                                            status = CASE WHEN :step % 2 = 0 THEN 'received' ELSE 'predicted' END,
+                                            actual_amount = CASE WHEN :step % 2 = 0 THEN predicted_amount END,
+                                            actual_date = CASE WHEN :step % 2 = 0 THEN predicted_date END
+                    WHERE inflow_id = ANY(:ids)
+                """), {"step": step, "ids": ids})
+                assert await scalar("SELECT count(*) FROM cash_inflow_buckets WHERE inflow_count = 0") == 0
+            assert await scalar(DIFF_SQL) == 0
+
+            await conn.execute(text("DELETE FROM cash_inflows WHERE inflow_id = ANY(:ids)"), {"ids": ids})
+            assert await scalar("SELECT count(*) FROM cash_inflow_buckets WHERE inflow_count = 0") == 0
+            assert await scalar("SELECT count(*) FROM cash_inflow_buckets") == buckets
+            assert await scalar(DIFF_SQL) == 0
+        finally:
+            await transaction.rollback()
+    await async_engine.dispose()
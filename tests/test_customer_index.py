@@ -0,0 +1,66 @@
+"""
+ツールの顧客索引（tools/customer_index.py）による顧客IDの決定的な解決のテスト
+索引は固定の顧客データから作り、DBには接続しない。None はLLMでの抽出に切り替えることを意味する
+"""
+
+import time
+import pytest
+from tools.customer_index import CustomerIndex, normalize_name
+
+CUSTOMERS = [
+    (1, "C00000001", "山田 太郎", "ヤマダ タロウ"),
+    (2, "C00000002", "田中 花子", "タナカ ハナコ"),
+    # 同姓同名
+    (3, "C00000003", "佐藤 健", "サトウ ケン"),
+    (4, "C00000004", "佐藤 健", "サトウ ケン"),
+]
+
+@pytest.fixture
+def index():
+    index = CustomerIndex()
+    for customer_id, customer_code, name, name_kana in CUSTOMERS:
+        index.ids.add(customer_id)
+        index.by_code[customer_code] = customer_id
+        for value in (name, name_kana):
+            index.by_name.setdefault(normalize_name(value), []).append(customer_id)
+    index.loaded_at = time.monotonic()
+    return index
+
+CASES = [
+    # 顧客コード（構造化・自由文、大文字小文字・ハイフンの有無を問わない）
+    ("code", {"customer_code": "C00000001"}, [1]),
+    ("code lower case", {"customer_codes": ["c00000002"]}, [2]),
+    ("code in text", {"query": "C00000002の保有商品"}, [2]),
+    ("code with hyphen", {"query": "C-00000001 の評価額"}, [1]),
+    # 顧客ID
+    ("id", {"customer_id": 1}, [1]),
+    ("id in text", {"query": "顧客ID: 2 の保有"}, [2]),
+    # 氏名（空白・敬称の有無、カナ）
+    ("name", {"customer_name": "山田太郎"}, [1]),
+    ("name with space", {"customer_name": "山田　太郎"}, [1]),
+    ("name in text", {"query": "山田太郎の保有商品"}, [1]),
+    ("name with honorific", {"query": "山田 太郎さんの保有商品"}, [1]),
+    ("kana with honorific", {"query": "ヤマダタロウ様のポートフォリオ"}, [1]),
+    ("two names", {"query": "山田太郎さんと田中花子様を比較"}, [1, 2]),
+    ("generic honorific", {"query": "お客様の山田太郎の保有"}, [1]),
+    # 同姓同名は曖昧
+    ("ambiguous name", {"customer_name": "佐藤健"}, None),
+    ("ambiguous name in text", {"query": "佐藤 健さんの保有"}, None),
+    # 索引で解決できない → LLM
+    ("unknown id", {"customer_id": 999}, None),
+    ("invalid id", {"customer_id": "abc"}, None),
+    ("unknown code", {"customer_code": "C99999999"}, None),
+    ("unknown code in text", {"query": "C99999999の保有"}, None),
+    ("unknown name", {"customer_name": "鈴木一郎"}, None),
+    ("unknown name with honorific", {"query": "鈴木さんの保有"}, None),
+    ("known and unknown names", {"query": "山田太郎さんと鈴木さんの保有"}, None),
+    ("known name and unknown code", {"query": "山田太郎とC99999999"}, None),
+    ("no customer", {"query": "お客様の保有一覧"}, None),
+    ("word ending in id", {"query": "PAID 100件"}, None),
+    ("empty", {}, None),
+]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("params,expected", [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+async def test_resolve(index, params, expected):
+    assert await index.resolve(params) == expected
@@ -0,0 +1,61 @@
+"""
+保有商品の単一行API（登録・更新・削除）のテスト
+書き込みと同じトランザクションでダッシュボード集計・顧客別ポートフォリオが差分だけ動くことを確認する
+
+データ投入済みのDBが必要。作成した保有はテスト内で削除する
+"""
+
+import pytest
+
+# 数量10・取得単価100・現在単価120 → 評価額1200・簿価1000
+NEW_HOLDING = {"quantity": 10, "purchase_price": 100, "current_price": 120, "purchase_date": "2026-01-05"}
+
+async def snapshot(client, customer_id: int) -> dict:
+    stats = (await client.get("/api/stats")).json()
+    portfolio = (await client.get(f"/api/customers/{customer_id}/portfolio")).json()
+    return {
+        "stats_count": stats["total_holdings"],
+        "stats_market": stats["total_market_value"],
+        "stats_book": stats["total_book_value"],
+        "count": portfolio["holdings_count"],
+        "market": portfolio["total_market_value"],
+        "book": portfolio["total_book_value"],
+    }
+
+def assert_moved(before: dict, after: dict, count: int, market: float, book: float) -> None:
+    assert after["stats_count"] - before["stats_count"] == count
+    assert after["count"] - before["count"] == count
+    for prefix in ("stats_", ""):
+        assert after[f"{prefix}market"] - before[f"{prefix}market"] == pytest.approx(market, abs=0.01)
+        assert after[f"{prefix}book"] - before[f"{prefix}book"] == pytest.approx(book, abs=0.01)
+
+@pytest.mark.asyncio
+async def test_single_holding_writes_move_stats_and_portfolio(api_client, db_value):
+    customer_id = await db_value("SELECT min(customer_id) FROM holdings")
+    product_id = await db_value("SELECT min(product_id) FROM products")
+    baseline = await snapshot(api_client, customer_id)
+
+    response = await api_client.post("/api/holdings",
+                                     json={"customer_id": customer_id, "product_id": product_id, **NEW_HOLDING})
+    assert response.status_code == 200, response.text
+    holding = response.json()
+    try:
+        assert float(holding["unit_price"]) == 100
+        assert float(holding["current_value"]) == 1200
+        assert float(holding["unrealized_gain_loss"]) == 200
+        assert_moved(baseline, await snapshot(api_client, customer_id), 1, 1200, 1000)
+
+        # 現在単価を外すと評価額は取得単価で計算する（purchase_price は unit_price として保存）
+        response = await api_client.put(f"/api/holdings/{holding['holding_id']}",
+                                        json={"current_price": None, "purchase_price": 110})
+        assert response.status_code == 200, response.text
+        assert float(response.json()["current_value"]) == 1100
+        assert_moved(baseline, await snapshot(api_client, customer_id), 1, 1100, 1100)
+
+        response = await api_client.put(f"/api/holdings/{holding['holding_id']}", json={"current_price": 125.5})
+        assert response.status_code == 200, response.text
+        assert_moved(baseline, await snapshot(api_client, customer_id), 1, 1255, 1100)
+    finally:
+        response = await api_client.delete(f"/api/holdings/{holding['holding_id']}")
+    assert response.status_code == 200, response.text
+    assert_moved(baseline, await snapshot(api_client, customer_id), 0, 0, 0)
@@ -0,0 +1,90 @@
+"""
+顧客別ポートフォリオ集計（customer_portfolios / customer_portfolio_allocations）のテスト
+単一行・一括の保有書き込みの後、集計から返すポートフォリオが保有からの再計算と一致することを確認する
+
+データ投入済みのDBが必要。作成した保有はテスト内で削除する
+"""
+
+import pytest
+from sqlalchemy import text
+from backend.models.database import async_engine
+
+# 有効な保有からの再計算（集計軸: 商品カテゴリ・通貨、NULLは UNKNOWN）
+EXPECTED_SQL = """
+    SELECT dimension, bucket, count(*), sum(h.current_value), sum(h.quantity * h.unit_price)
+    FROM holdings h
+    JOIN products p ON p.product_id = h.product_id
+    CROSS JOIN LATERAL (VALUES ('category', coalesce(p.category_code, 'UNKNOWN')),
+                               ('currency', coalesce(p.currency, 'UNKNOWN'))) AS a(dimension, bucket)
+    WHERE h.customer_id = :customer_id AND h.status = 'active'
+    GROUP BY dimension, bucket
+"""
+
+async def expected_allocation(customer_id: int) -> dict:
+    async with async_engine.connect() as conn:
+        rows = (await conn.execute(text(EXPECTED_SQL), {"customer_id": customer_id})).all()
+    return {(row[0], row[1]): (row[2], float(row[3] or 0), float(row[4] or 0)) for row in rows}
+
+async def assert_rollup_matches_holdings(client, customer_id: int) -> None:
+    response = await client.get(f"/api/customers/{customer_id}/portfolio")
+    assert response.status_code == 200, response.text
+    portfolio = response.json()
+    expected = await expected_allocation(customer_id)
+    actual = {
+        (dimension, row["bucket"]): (row["holdings_count"], row["market_value"], row["book_value"])
+        for dimension, rows in portfolio["allocation"].items() for row in rows
+    }
+    assert actual.keys() == expected.keys()
+    for key, (count, market, book) in expected.items():
+        assert actual[key][0] == count
+        assert actual[key][1] == pytest.approx(market, abs=0.01)
+        assert actual[key][2] == pytest.approx(book, abs=0.01)
+    category = [value for (dimension, _), value in expected.items() if dimension == "category"]
+    assert portfolio["holdings_count"] == sum(count for count, _, _ in category)
+    assert portfolio["total_market_value"] == pytest.approx(sum(market for _, market, _ in category), abs=0.01)
+
+def holding(customer_id: int, product_id: int, quantity: int) -> dict:
+    return {"customer_id": customer_id, "product_id": product_id, "quantity": quantity,
+            "purchase_price": 100, "current_price": 130, "purchase_date": "2026-02-02"}
+
+@pytest.mark.asyncio
+async def test_rollups_follow_single_and_bulk_holding_writes(api_client, db_value):
+    # 保有カテゴリの最も少ない顧客
+    customer_id = await db_value("""
+        SELECT h.customer_id FROM holdings h JOIN products p ON p.product_id = h.product_id
+        WHERE h.status = 'active'
+        GROUP BY h.customer_id ORDER BY count(DISTINCT p.category_code), h.customer_id LIMIT 1
+    """)
+    # 顧客がまだ持っていないカテゴリの商品（配分に新しい区分の行ができる）と、別カテゴリの商品
+    product_id = await db_value("""
+        SELECT min(product_id) FROM products WHERE category_code NOT IN (
+            SELECT p.category_code FROM holdings h JOIN products p ON p.product_id = h.product_id
+            WHERE h.customer_id = :customer_id AND h.status = 'active')
+    """, customer_id=customer_id)
+    other_product_id = await db_value(
+        "SELECT min(product_id) FROM products WHERE category_code <> "
+        "(SELECT category_code FROM products WHERE product_id = :product_id)", product_id=product_id)
+    created = []
+    try:
+        response = await api_client.post("/api/holdings", json=holding(customer_id, product_id, 10))
+        assert response.status_code == 200, response.text
+        created.append(response.json()["holding_id"])
+        await assert_rollup_matches_holdings(api_client, customer_id)
+
+        # 商品の付け替えで区分が移る
+        response = await api_client.put(f"/api/holdings/{created[0]}", json={"product_id": other_product_id})
+        assert response.status_code == 200, response.text
+        await assert_rollup_matches_holdings(api_client, customer_id)
+
+        response = await api_client.post("/api/holdings/bulk", json=[
+            holding(customer_id, product_id, 3), holding(customer_id, other_product_id, 4),
+        ])
+        assert response.status_code == 200, response.text
+        created.extend(response.json()["ids"])
+        assert None not in created
+        await assert_rollup_matches_holdings(api_client, customer_id)
+    finally:
+        for holding_id in created:
+            response = await api_client.delete(f"/api/holdings/{holding_id}")
+            assert response.status_code == 200, response.text
+    await assert_rollup_matches_holdings(api_client, customer_id)
@@ -0,0 +1,37 @@
+"""
+@query_budget を付けたページのSQL発行数のテスト
+QUERY_BUDGET_ENFORCE=true で予算超過は500になるため、全ページが200を返すことを確認する
+
+データ投入済みのDBが必要（generate_data / import_data）。接続できない場合はスキップする
+"""
+
+import pytest
+import pytest_asyncio
+from fastapi.routing import APIRoute
+from backend.main import app
+from backend.utils import query_counter
+
+BUDGETED_ROUTES = [
+    route for route in app.routes
+    if isinstance(route, APIRoute) and query_counter.budget_of(route.endpoint) is not None
+]
+
+# パスパラメータに使う既存行
+PATH_PARAMS_SQL = {
+    "customer_id": "SELECT customer_id FROM holdings ORDER BY customer_id LIMIT 1",
+}
+
+@pytest_asyncio.fixture
+async def path_params(db_value):
+    return {name: await db_value(sql) for name, sql in PATH_PARAMS_SQL.items()}
+
+def test_budget_is_enforced():
+    assert query_counter.ENFORCE_QUERY_BUDGET
+    assert {route.path for route in BUDGETED_ROUTES} >= {"/", "/customers", "/holdings"}
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("route", BUDGETED_ROUTES, ids=lambda route: route.path)
+async def test_page_within_query_budget(api_client, path_params, route):
+    response = await api_client.get(route.path.format(**path_params))
+    assert response.status_code == 200, response.text[:500]
+    assert int(response.headers["X-Query-Count"]) <= query_counter.budget_of(route.endpoint)
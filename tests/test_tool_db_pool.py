@@ -0,0 +1,77 @@
+"""
+ツールの共有接続プール（tools/db_pool.py）の保有商品クエリのテスト
+顧客IDを配列1個で渡すプリペアド文が、従来の顧客IDを並べた IN (...) のクエリと同じ行を返すことを確認する
+
+データ投入済みのDBが必要。接続できない場合はスキップする
+"""
+
+import os
+import psycopg2
+import pytest
+import pytest_asyncio
+from tools import db_pool
+from tools.db_pool import HOLDINGS_QUERY
+
+# 置き換え前のクエリ（顧客IDごとにプレースホルダーを並べるため、件数ごとに別のSQL文になる）
+PER_ID_QUERY = """
+SELECT h.holding_id, h.quantity, h.unit_price, h.current_price, h.current_value,
+       h.purchase_date, h.customer_id,
+       p.product_code, p.product_name, p.category_code, p.currency,
+       c.name as customer_name
+FROM holdings h
+JOIN products p ON h.product_id = p.product_id
+JOIN customers c ON h.customer_id = c.customer_id
+WHERE h.customer_id IN ({placeholders})
+ORDER BY h.customer_id, h.current_value DESC
+"""
+
+COLUMNS = ("holding_id", "quantity", "unit_price", "current_price", "current_value", "purchase_date",
+           "customer_id", "product_code", "product_name", "category_code", "currency", "customer_name")
+
+@pytest.fixture
+def sync_conn():
+    try:
+        conn = psycopg2.connect(host=os.environ["DB_HOST"], port=os.environ["DB_PORT"], dbname=os.environ["DB_NAME"],
+                                user=os.environ["DB_USER"], password=os.environ["DB_PASSWORD"])
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"database is not available: {e}")
+    yield conn
+    conn.close()
+
+@pytest_asyncio.fixture
+async def pool():
+    yield await db_pool.get_pool()
+    # テストごとにイベントループが変わるため、プールをループをまたいで使い回さない
+    await db_pool.close_pool()
+
+def per_id_rows(conn, customer_ids):
+    with conn.cursor() as cursor:
+        cursor.execute(PER_ID_QUERY.format(placeholders=",".join(["%s"] * len(customer_ids))), customer_ids)
+        return cursor.fetchall()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("count", [1, 3, 25])
+async def test_array_query_matches_per_id_query(sync_conn, pool, count):
+    with sync_conn.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT customer_id FROM holdings ORDER BY customer_id LIMIT %s", (count,))
+        customer_ids = [row[0] for row in cursor.fetchall()]
+    if len(customer_ids) < count:
+        pytest.skip("database is not seeded")
+    # 保有の無いID・存在しないIDは結果に影響しない
+    customer_ids.append(2_000_000_000)
+
+    expected = per_id_rows(sync_conn, customer_ids)
+    actual = [tuple(record[column] for column in COLUMNS) for record in await db_pool.fetch(HOLDINGS_QUERY, customer_ids)]
+
+    assert len(actual) == len(expected) > 0
+    # 並び順（顧客ID・評価額の降順）は同じで、評価額が同じ行の順序だけは実行計画によって変わりうる
+    assert [(row[6], row[4]) for row in actual] == [(row[6], row[4]) for row in expected]
+    assert sorted(actual) == sorted(expected)
+
+@pytest.mark.asyncio
+async def test_one_prepared_statement_for_any_number_of_ids(pool):
+    async with pool.acquire() as conn:
+        for customer_ids in ([1], [1, 2, 3], list(range(1, 101))):
+            await conn.fetch(HOLDINGS_QUERY, customer_ids)
+        prepared = await conn.fetchval("SELECT count(*) FROM pg_prepared_statements WHERE statement = $1", HOLDINGS_QUERY)
+    assert prepared == 1
@@ -0,0 +1,101 @@
+"""
+ツールのトレース（tools/tracing.py）のテスト
+記録対象外の呼び出しは何も書かないこと、ファイル出力が上限で切り替わること、OTLP/HTTPへの送信形式を確認する
+"""
+
+import json
+import httpx
+import pytest
+from tools import tracing
+from tools.tracing import TraceExporter, start_trace
+
+@pytest.fixture
+def exporter(monkeypatch, tmp_path):
+    """一時ディレクトリのファイルに書く出力先に差し替える"""
+    exporter = TraceExporter(file_path=str(tmp_path / "trace.jsonl"), otlp_endpoint="", max_bytes=0)
+    monkeypatch.setattr(tracing, "trace_exporter", exporter)
+    return exporter
+
+def run_trace(params=None, fail: bool = False):
+    trace = start_trace("get_customer_holdings", params or {})
+    with trace.span("query", rows=3):
+        pass
+    trace.capture("result", [{"holding_id": i} for i in range(50)])
+    if fail:
+        trace.fail(RuntimeError("boom"))
+    trace.finish()
+    return trace
+
+def test_sampling(monkeypatch):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    assert not start_trace("tool", {}).recording
+    assert start_trace("tool", {"debug": True}).recording
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    assert start_trace("tool", {}).recording
+
+@pytest.mark.asyncio
+async def test_unsampled_trace_writes_nothing(monkeypatch, exporter, tmp_path):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    trace = run_trace()
+    await exporter.close()
+    assert trace.payloads == {}
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_disabled_exporter_writes_nothing(monkeypatch, tmp_path):
+    exporter = TraceExporter(file_path="", otlp_endpoint="")
+    monkeypatch.setattr(tracing, "trace_exporter", exporter)
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    monkeypatch.chdir(tmp_path)
+    run_trace(fail=True)
+    await exporter.close()
+    assert exporter._worker is None
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.asyncio
+async def test_sampled_and_failed_traces_are_written(monkeypatch, exporter):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    run_trace({"debug": True})
+    run_trace(fail=True)
+    await exporter.close()
+    with open(exporter.file_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["debug"] for record in records] == [True, False]
+    assert records[1]["error"] == "RuntimeError: boom"
+    # 記録対象のペイロードは上限件数まで
+    assert len(records[0]["payloads"]["result"]) == tracing.MAX_PAYLOAD_ITEMS + 1
+    assert records[0]["spans"][0]["rows"] == 3
+
+@pytest.mark.asyncio
+async def test_file_sink_stops_at_cap(monkeypatch, exporter, tmp_path):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    exporter.max_bytes = 4096
+    for _ in range(20):
+        run_trace()
+        await exporter.close()
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ["trace.jsonl", "trace.jsonl.1"]
+    for path in tmp_path.iterdir():
+        assert 0 < path.stat().st_size <= exporter.max_bytes
+
+@pytest.mark.asyncio
+async def test_otlp_export(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(200)
+
+    exporter = TraceExporter(file_path="", otlp_endpoint="http://collector/v1/traces")
+    exporter._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(tracing, "trace_exporter", exporter)
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    trace = run_trace()
+    await exporter.close()
+
+    assert len(requests) == 1
+    spans = requests[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["get_customer_holdings", "query"]
+    assert {span["traceId"] for span in spans} == {trace.trace_id}
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert {"key": "rows", "value": {"intValue": "3"}} in spans[1]["attributes"]
@@ -1,95 +1,103 @@
 # Customer holdings tool
 
-import time
 import json
-from typing import Dict, Any, Tuple, List
-from utils.database import get_db_connection
-from utils.system_prompt import get_system_prompt
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 from utils.llm_util import llm_util
 from models import MCPResponse
-from psycopg2.extras import RealDictCursor
+from tools.customer_index import customer_index
+from tools.db_pool import HOLDINGS_QUERY, fetch
+from tools.prompt_cache import get_cached_system_prompt
+from tools.tracing import Trace, start_trace
+
+# 分析・助言など自由な文章化を求める依頼はLLMで整形し、それ以外はテンプレートで整形する
+LLM_FORMAT_KEYWORDS = ("分析", "比較", "評価", "提案", "おすすめ", "アドバイス", "要約", "解説",
+                       "analy", "compare", "recommend", "summar", "advice")
 
 async def get_customer_holdings(params: Dict[str, Any]) -> MCPResponse:
-    """顧客の保有商品情報を取得"""
-    start_time = time.time()
-    
-    print(f"[get_customer_holdings] === FUNCTION START ===")
-    print(f"[get_customer_holdings] Received raw params: {params}")
+    """顧客の保有商品情報を取得
+
+    params に "debug": true を指定した場合のみ debug_response（区間ごとの時間・上限付きのプロンプト/応答/結果）を返す
+    """
+    trace = start_trace("get_customer_holdings", params)
+    trace.capture("request", params)
     
-    # デバッグ情報インスタンス（try外側で定義）
+    # 処理状態（参照渡し。ペイロード本体は trace に上限付きで記録する）
     tool_debug = {
-        "request": params,
-        "standardize_prompt": None,
-        "standardize_response": None,
+        "customer_ids": [],
         "standardize_parameter": None,
-        "executed_query": None,
-        "executed_query_results": None,
         "format_response": None,
         "error": None,
         "error_type": None,
         "execution_time_ms": 0,
-        "results_count": 0
+        "results_count": 0,
+        "resolution": None,
+        "format_mode": None
     }
     
     try:
-        # 引数標準化処理（顧客ID抽出）
-        await standardize_customer_arguments(str(params), tool_debug)
+        # 顧客IDの解決（メモリ上の索引で決定的に解決できなければLLMで抽出）
+        with trace.span("standardize") as span:
+            customer_ids = await customer_index.resolve(params)
+            if customer_ids:
+                tool_debug["customer_ids"] = customer_ids
+                tool_debug["standardize_parameter"] = str(customer_ids)
+                tool_debug["resolution"] = "index"
+            else:
+                tool_debug["resolution"] = "llm"
+                await standardize_customer_arguments(str(params), tool_debug, trace)
+            span.set(resolution=tool_debug["resolution"], customer_count=len(tool_debug["customer_ids"]))
         
-        if not tool_debug.get("customer_ids"):
+        if not tool_debug["customer_ids"]:
             tool_debug["error"] = "顧客ID抽出失敗"
-            tool_debug["execution_time_ms"] = round((time.time() - start_time) * 1000, 2)
-            
-            return MCPResponse(
-                result="顧客特定不可のため実行できませんでした",
-                debug_response=tool_debug
-            )
+            return _response("顧客特定不可のため実行できませんでした", tool_debug, trace)
         
         # データベースクエリ実行
-        await execute_holdings_query(tool_debug)
+        with trace.span("query") as span:
+            holdings = await execute_holdings_query(tool_debug, trace)
+            span.set(rows=len(holdings))
         
         # 結果テキスト化
-        await format_customer_holdings_results(tool_debug)
-        
-        tool_debug["execution_time_ms"] = round((time.time() - start_time) * 1000, 2)
+        with trace.span("format") as span:
+            await format_customer_holdings_results(holdings, tool_debug, params, trace)
+            span.set(mode=tool_debug["format_mode"], chars=len(tool_debug["format_response"]))
         
-        print(f"[get_customer_holdings] Returning result with {tool_debug['results_count']} holdings")
-        print(f"[get_customer_holdings] === FUNCTION END ===")
-        
-        return MCPResponse(
-            result=tool_debug["format_response"], 
-            debug_response=tool_debug
-        )
+        return _response(tool_debug["format_response"], tool_debug, trace)
         
     except Exception as e:
         tool_debug["error"] = str(e)
         tool_debug["error_type"] = type(e).__name__
-        tool_debug["execution_time_ms"] = round((time.time() - start_time) * 1000, 2)
-        
-        print(f"[get_customer_holdings] Error: {e}")
-        print(f"[get_customer_holdings] === FUNCTION END (ERROR) ===")
+        trace.fail(e)
         
-        return MCPResponse(
-            result=f"顧客保有商品取得エラー: {str(e)}", 
-            debug_response=tool_debug
-        )
+        return _response(f"顧客保有商品取得エラー: {str(e)}", tool_debug, trace)
+
+def _response(result: str, tool_debug: dict, trace: Trace) -> MCPResponse:
+    """トレースを閉じて応答を作成（debug_response は debug 指定時のみ）"""
+    trace.set(resolution=tool_debug["resolution"], format_mode=tool_debug["format_mode"],
+              results_count=tool_debug["results_count"], error=tool_debug["error"])
+    trace.finish()
+    tool_debug["execution_time_ms"] = trace.root.duration_ms
+    
+    if not trace.debug:
+        return MCPResponse(result=result, debug_response=None)
+    return MCPResponse(
+        result=result,
+        debug_response={**tool_debug, **trace.payloads, "trace_id": trace.trace_id, "spans_ms": trace.timings()}
+    )
 
-async def standardize_customer_arguments(raw_input: str, tool_debug: dict) -> None:
+async def standardize_customer_arguments(raw_input: str, tool_debug: dict, trace: Trace) -> None:
     """顧客検索の引数を標準化（LLMベース）- 参照渡し"""
-    print(f"[standardize_customer_arguments] Raw input: {raw_input}")
-    
-    # データベースからシステムプロンプト取得
-    system_prompt = await get_system_prompt("get_customer_holdings_pre")
+    # システムプロンプト取得（TTLキャッシュ）
+    system_prompt = await get_cached_system_prompt("get_customer_holdings_pre")
     
     # 完全プロンプト作成
     full_prompt = f"{system_prompt}\n\nUser Input: {raw_input}"
-    tool_debug["standardize_prompt"] = full_prompt
+    trace.capture("standardize_prompt", full_prompt)
     
     # call_llm_simple使用（統一）
     response, execution_time = await llm_util.call_llm_simple(full_prompt)
-    tool_debug["standardize_response"] = response
-    
-    print(f"[standardize_customer_arguments] LLM Raw Response: {response}")
-    print(f"[standardize_customer_arguments] Execution time: {execution_time}ms")
+    trace.capture("standardize_response", response)
+    trace.set(standardize_llm_ms=execution_time)
     
     try:
         customer_ids = json.loads(response)
@@ -99,45 +107,19 @@ async def standardize_customer_arguments(raw_input: str, tool_debug: dict) -> No
         tool_debug["customer_ids"] = customer_ids
         tool_debug["standardize_parameter"] = str(customer_ids)
         
-        print(f"[standardize_customer_arguments] Final Customer IDs: {customer_ids}")
-        
     except json.JSONDecodeError as e:
-        print(f"[standardize_customer_arguments] JSON parse error: {e}")
         tool_debug["customer_ids"] = []
         tool_debug["standardize_parameter"] = f"LLM応答のJSONパース失敗: {str(e)}"
 
-async def execute_holdings_query(tool_debug: dict) -> None:
+async def execute_holdings_query(tool_debug: dict, trace: Trace) -> List[Dict]:
     """データベースクエリ実行 - 参照渡し"""
-    customer_ids = tool_debug["customer_ids"]
-    
-    # データベース接続・クエリ実行
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # OR条件でSQL構築
-    placeholders = ",".join(["%s"] * len(customer_ids))
-    query = f"""
-    SELECT h.holding_id, h.quantity, h.unit_price, h.current_price, h.current_value,
-           h.purchase_date, h.customer_id,
-           p.product_code, p.product_name, p.category_code, p.currency,
-           c.name as customer_name
-    FROM holdings h
-    JOIN products p ON h.product_id = p.product_id
-    JOIN customers c ON h.customer_id = c.customer_id
-    WHERE h.customer_id IN ({placeholders})
-    ORDER BY h.customer_id, h.current_value DESC
-    """
-    
-    tool_debug["executed_query"] = query
+    # LLM抽出の結果は文字列の場合もあるため整数に揃える
+    customer_ids = [int(customer_id) for customer_id in tool_debug["customer_ids"]]
     
-    print(f"[execute_holdings_query] Final query: {query}")
-    print(f"[execute_holdings_query] Customer IDs: {customer_ids}")
+    trace.capture("executed_query", HOLDINGS_QUERY)
     
-    cursor.execute(query, customer_ids)
-    results = cursor.fetchall()
-    conn.close()
-    
-    print(f"[execute_holdings_query] Query executed, found {len(results)} holdings")
+    # 共有プールの接続で実行（プリペアドステートメントはプールの接続ごとにキャッシュされる）
+    results = await fetch(HOLDINGS_QUERY, customer_ids)
     
     # 結果配列作成
     holdings = []
@@ -157,19 +139,59 @@ async def execute_holdings_query(tool_debug: dict) -> None:
             "purchase_date": row['purchase_date'].isoformat() if row['purchase_date'] else None
         })
     
-    tool_debug["executed_query_results"] = holdings
+    trace.capture("executed_query_results", holdings)
     tool_debug["results_count"] = len(holdings)
+    return holdings
+
+def needs_llm_formatting(params: Dict[str, Any]) -> bool:
+    """テンプレートでは応えられない依頼（分析・比較・助言など）か"""
+    if isinstance(params, dict) and params.get("format") in ("llm", "template"):
+        return params["format"] == "llm"
+    text = json.dumps(params, ensure_ascii=False, default=str).lower()
+    return any(keyword in text for keyword in LLM_FORMAT_KEYWORDS)
+
+def render_customer_holdings(holdings: List[Dict]) -> str:
+    """保有商品一覧を顧客別・評価額順のテキストに整形（クエリ結果の並び順を維持）"""
+    customers: "OrderedDict[int, List[Dict]]" = OrderedDict()
+    for holding in holdings:
+        customers.setdefault(holding["customer_id"], []).append(holding)
 
-async def format_customer_holdings_results(tool_debug: dict) -> None:
+    lines = [f"保有商品検索結果: {len(customers)}名・{len(holdings)}件"]
+    for customer_id, items in customers.items():
+        totals: Dict[str, float] = {}
+        for item in items:
+            currency = item["currency"] or "JPY"
+            totals[currency] = totals.get(currency, 0) + item["current_value"]
+        total_text = " / ".join(f"{value:,.0f} {currency}" for currency, value in totals.items())
+        lines.append("")
+        lines.append(f"■ {items[0]['customer_name']}（顧客ID: {customer_id}）{len(items)}件 評価額合計: {total_text}")
+        for item in items:
+            gain = (item["current_price"] - item["unit_price"]) * item["quantity"] if item["current_price"] else 0
+            lines.append(
+                f"- {item['product_name']}（{item['product_code']} / {item['category_code']}）"
+                f" 数量 {item['quantity']:,.2f} / 取得単価 {item['unit_price']:,.2f}"
+                f" / 評価額 {item['current_value']:,.0f} {item['currency'] or 'JPY'}"
+                f" / 評価損益 {gain:+,.0f}"
+                + (f" / 購入日 {item['purchase_date']}" if item["purchase_date"] else "")
+            )
+    return "\n".join(lines)
+
+async def format_customer_holdings_results(holdings: List[Dict], tool_debug: dict,
+                                           params: Dict[str, Any] = None, trace: Optional[Trace] = None) -> None:
     """顧客保有商品結果をテキスト化 - 参照渡し"""
-    holdings = tool_debug["executed_query_results"]
-    
     if not holdings:
         tool_debug["format_response"] = "保有商品検索結果: 該当する保有商品はありませんでした。"
+        tool_debug["format_mode"] = "template"
+        return
+    
+    # 一覧の提示で足りる依頼はテンプレートで整形（LLM呼び出しなし）
+    if not needs_llm_formatting(params or {}):
+        tool_debug["format_response"] = render_customer_holdings(holdings)
+        tool_debug["format_mode"] = "template"
         return
     
-    # システムプロンプト取得
-    system_prompt = await get_system_prompt('get_customer_holdings_post')
+    # システムプロンプト取得（TTLキャッシュ）
+    system_prompt = await get_cached_system_prompt('get_customer_holdings_post')
     
     # 呼び出し元でデータ結合（責任明確化）
     data_json = json.dumps(holdings, ensure_ascii=False, default=str, indent=2)
@@ -179,6 +201,9 @@ async def format_customer_holdings_results(tool_debug: dict) -> None:
     result_text, execution_time = await llm_util.call_llm_simple(full_prompt)
     
     tool_debug["format_response"] = result_text
+    tool_debug["format_mode"] = "llm"
     
-    print(f"[format_customer_holdings_results] Execution time: {execution_time}ms")
-    print(f"[format_customer_holdings_results] Formatted result: {result_text[:200]}...")
+    if trace is not None:
+        trace.capture("format_prompt", full_prompt)
+        trace.capture("format_response", result_text)
+        trace.set(format_llm_ms=execution_time)
@@ -0,0 +1,184 @@
+# In-memory customer index for tools
+
+import asyncio
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+from tools.db_pool import fetch
+
+logger = logging.getLogger(__name__)
+
+# 顧客一覧の再読み込み間隔（秒）
+CUSTOMER_INDEX_TTL = float(os.getenv("TOOL_CUSTOMER_INDEX_TTL", 300))
+# 文章中の氏名照合で試す最大文字数
+MAX_NAME_LENGTH = 20
+
+# 顧客ID・顧客コードを指定する構造化パラメータ
+ID_KEYS = ("customer_id", "customer_ids", "id", "ids")
+CODE_KEYS = ("customer_code", "customer_codes", "code", "codes")
+NAME_KEYS = ("customer_name", "customer_names", "name", "names")
+
+# 日本語に続く場合も拾えるよう \b ではなく英数字の前後関係で区切る
+CODE_PATTERN = re.compile(r"(?<![A-Za-z0-9])[A-Za-z]{1,4}-?\d{3,}(?![0-9])")
+# 氏名に付く敬称（直前が漢字・カタカナで、直後に漢字が続かないもの。「氏名」「様式」「様々」は除く）
+HONORIFIC_PATTERN = re.compile(r"(?<=[々〇\u4e00-\u9fff\u30a1-\u30ffー])(?:さん|さま|様|氏|殿)(?![々\u4e00-\u9fff])")
+# 敬称が付いても顧客名ではない語
+GENERIC_HONORIFIC_WORDS = ("お客様", "お客さま", "お客さん", "皆様", "皆さま", "皆さん", "同様", "多様", "仕様", "模様", "異様")
+
+# 「PAID 100」「valid 3」のように英単語の末尾の id は顧客IDの指定とみなさない
+ID_PATTERN = re.compile(r"(?<![A-Za-z])(?:顧客\s*ID|customer[_\s]?id|ID)\s*[:：=]?\s*(\d+)", re.IGNORECASE)
+
+def normalize_name(value: str) -> str:
+    """氏名の照合用正規化（全角半角統一・空白除去・小文字化）"""
+    return "".join(unicodedata.normalize("NFKC", value or "").split()).lower()
+
+def _values(params: Dict[str, Any], keys: Tuple[str, ...]) -> List[Any]:
+    values = []
+    for key in keys:
+        value = params.get(key)
+        if value is None:
+            continue
+        values.extend(value if isinstance(value, (list, tuple)) else [value])
+    return values
+
+def _texts(value: Any) -> List[str]:
+    """パラメータ中の文字列をすべて取り出す（入れ子の辞書・リストも対象）"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _texts(item)]
+    if isinstance(value, (list, tuple)):
+        return [text for item in value for text in _texts(item)]
+    return []
+
+class CustomerIndex:
+    """顧客ID・顧客コード・氏名（カナ）から顧客IDを引くメモリ上の索引"""
+
+    def __init__(self):
+        self.ids = set()
+        self.by_code: Dict[str, int] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def _load(self) -> None:
+        """顧客一覧を読み込んで索引を作り直す"""
+        rows = await fetch("SELECT customer_id, customer_code, name, name_kana FROM customers")
+
+        ids, by_code, by_name = set(), {}, {}
+        for customer_id, customer_code, name, name_kana in rows:
+            ids.add(customer_id)
+            if customer_code:
+                by_code[customer_code.upper()] = customer_id
+            for value in (name, name_kana):
+                key = normalize_name(value)
+                if key and customer_id not in by_name.get(key, []):
+                    by_name.setdefault(key, []).append(customer_id)
+        self.ids, self.by_code, self.by_name = ids, by_code, by_name
+        self.loaded_at = time.monotonic()
+        logger.info("Loaded %d customers", len(ids))
+
+    async def refresh_if_stale(self) -> None:
+        """初回は読み込みを待ち、以降は期限切れでも現在の索引のまま応答して裏で1回だけ読み込み直す"""
+        if not self.loaded_at:
+            async with self._lock:
+                if not self.loaded_at:
+                    await self._load()
+            return
+        if time.monotonic() - self.loaded_at < CUSTOMER_INDEX_TTL:
+            return
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._reload())
+
+    async def _reload(self) -> None:
+        try:
+            await self._load()
+        except Exception as e:
+            # 失敗しても現在の索引を使い続け、次の呼び出しで再試行する
+            logger.warning("Customer index reload failed: %s", e)
+
+    def _match_name(self, value: str) -> Optional[List[int]]:
+        return self.by_name.get(normalize_name(value))
+
+    def _scan_names(self, normalized: str) -> List[Tuple[int, int, List[int]]]:
+        """正規化済みの文章中に含まれる氏名を最長一致で探し、(開始, 終了, 顧客ID候補) を返す
+
+        部分文字列を索引で引くため顧客数によらず高速
+        """
+        matches, index = [], 0
+        while index < len(normalized):
+            found = None
+            for end in range(min(len(normalized), index + MAX_NAME_LENGTH), index + 1, -1):
+                found = self.by_name.get(normalized[index:end])
+                if found:
+                    matches.append((index, end, found))
+                    index = end
+                    break
+            if not found:
+                index += 1
+        return matches
+
+    async def resolve(self, params: Dict[str, Any]) -> Optional[List[int]]:
+        """パラメータから顧客IDを決定的に解決する
+
+        解決できない・同姓同名などで曖昧な場合は None を返し、呼び出し元はLLMでの抽出に切り替える。
+        自由文に索引に無い顧客コードや、照合できた氏名に付いていない敬称（「田中さん」の田中が
+        索引に無い等）が残る場合も、一部の顧客だけで答えないよう None を返す
+        """
+        await self.refresh_if_stale()
+        customer_ids: List[int] = []
+
+        def add(candidates: Optional[List[int]]) -> bool:
+            if not candidates or len(candidates) != 1:
+                return False
+            if candidates[0] not in customer_ids:
+                customer_ids.append(candidates[0])
+            return True
+
+        # 構造化パラメータ（ID・コード・氏名）
+        for value in _values(params, ID_KEYS):
+            try:
+                customer_id = int(value)
+            except (TypeError, ValueError):
+                return None
+            if not add([customer_id] if customer_id in self.ids else None):
+                return None
+        for value in _values(params, CODE_KEYS):
+            if not add([self.by_code[str(value).upper()]] if str(value).upper() in self.by_code else None):
+                return None
+        for value in _values(params, NAME_KEYS):
+            if not add(self._match_name(str(value))):
+                return None
+        if customer_ids:
+            return customer_ids
+
+        # 自由文（「顧客ID 123」「C00000001」「山田 太郎さん」など）
+        for text in _texts(params):
+            for match in ID_PATTERN.finditer(text):
+                if not add([int(match.group(1))] if int(match.group(1)) in self.ids else None):
+                    return None
+            for match in CODE_PATTERN.finditer(text):
+                customer_id = self.by_code.get(match.group(0).upper().replace("-", ""))
+                if customer_id is None:
+                    customer_id = self.by_code.get(match.group(0).upper())
+                if customer_id is None:
+                    return None
+                add([customer_id])
+            normalized = normalize_name(text)
+            names = self._scan_names(normalized)
+            for _, _, candidates in names:
+                if not add(candidates):
+                    return None
+            name_ends = {end for _, end, _ in names}
+            for match in HONORIFIC_PATTERN.finditer(normalized):
+                if match.start() in name_ends or normalized[:match.end()].endswith(GENERIC_HONORIFIC_WORDS):
+                    continue
+                return None
+        return customer_ids or None
+
+# シングルトンインスタンス
+customer_index = CustomerIndex()
@@ -0,0 +1,72 @@
+# Shared async connection pool for tools
+
+import asyncio
+import logging
+import os
+from typing import Any, List, Optional
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# 接続プール設定（ツール呼び出しが並列に増えてもPostgreSQLの接続数はこの上限まで）
+POOL_MIN_SIZE = int(os.getenv("TOOL_DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.getenv("TOOL_DB_POOL_MAX_SIZE", 10))
+# 接続ごとのプリペアドステートメントキャッシュ（同じSQL文は2回目以降パース・計画済みの文を再利用）
+STATEMENT_CACHE_SIZE = int(os.getenv("TOOL_DB_STATEMENT_CACHE_SIZE", 256))
+COMMAND_TIMEOUT = float(os.getenv("TOOL_DB_COMMAND_TIMEOUT", 30))
+MAX_INACTIVE_LIFETIME = float(os.getenv("TOOL_DB_MAX_INACTIVE_LIFETIME", 300))
+
+# 保有商品クエリ（顧客IDは配列パラメータで渡し、件数によらず同じSQL文・実行計画を再利用する）
+HOLDINGS_QUERY = """
+SELECT h.holding_id, h.quantity, h.unit_price, h.current_price, h.current_value,
+       h.purchase_date, h.customer_id,
+       p.product_code, p.product_name, p.category_code, p.currency,
+       c.name as customer_name
+FROM holdings h
+JOIN products p ON h.product_id = p.product_id
+JOIN customers c ON h.customer_id = c.customer_id
+WHERE h.customer_id = ANY($1::int[])
+ORDER BY h.customer_id, h.current_value DESC
+"""
+
+_pool: Optional[asyncpg.Pool] = None
+_lock = asyncio.Lock()
+
+async def get_pool() -> asyncpg.Pool:
+    """プロセス共有の接続プール（初回呼び出し時に作成）"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                host=os.getenv("DB_HOST", "localhost"),
+                port=int(os.getenv("DB_PORT", 5432)),
+                database=os.getenv("DB_NAME", "crm"),
+                user=os.getenv("DB_USER", "crm_user"),
+                password=os.getenv("DB_PASSWORD", "crm123"),
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                statement_cache_size=STATEMENT_CACHE_SIZE,
+                command_timeout=COMMAND_TIMEOUT,
+                max_inactive_connection_lifetime=MAX_INACTIVE_LIFETIME,
+                server_settings={"application_name": os.getenv("TOOL_DB_APPLICATION_NAME", "wealthai-crm-tools")},
+            )
+            logger.info("Created pool (min=%d, max=%d)", POOL_MIN_SIZE, POOL_MAX_SIZE)
+    return _pool
+
+async def fetch(query: str, *args: Any) -> List[asyncpg.Record]:
+    """プールから接続を借りてクエリを実行（接続はエラー時も必ず返却される）
+
+    SQL文は固定文字列にし、値はすべてパラメータで渡すこと（プリペアドステートメントが再利用される）
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetch(query, *args)
+
+async def close_pool() -> None:
+    """サーバー終了時に呼び出し、プールの接続を閉じる"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
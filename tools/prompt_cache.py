@@ -0,0 +1,40 @@
+# System prompt cache for tools
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Tuple
+from utils.system_prompt import get_system_prompt
+
+logger = logging.getLogger(__name__)
+
+# システムプロンプトはDB管理だが更新頻度は低いため、TTLの間はメモリから返す
+PROMPT_CACHE_TTL = float(os.getenv("TOOL_PROMPT_CACHE_TTL", 300))
+
+_prompts: Dict[str, Tuple[str, float]] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+
+async def get_cached_system_prompt(prompt_key: str) -> str:
+    """システムプロンプトを取得（TTL内はキャッシュ、同一キーの同時取得は1回にまとめる）"""
+    cached = _prompts.get(prompt_key)
+    if cached and time.monotonic() - cached[1] < PROMPT_CACHE_TTL:
+        return cached[0]
+
+    lock = _locks.setdefault(prompt_key, asyncio.Lock())
+    async with lock:
+        # 待っている間に他のリクエストが取得済みならそれを使う
+        cached = _prompts.get(prompt_key)
+        if cached and time.monotonic() - cached[1] < PROMPT_CACHE_TTL:
+            return cached[0]
+        prompt = await get_system_prompt(prompt_key)
+        _prompts[prompt_key] = (prompt, time.monotonic())
+        logger.info("Loaded prompt: %s", prompt_key)
+        return prompt
+
+def invalidate_system_prompts(prompt_key: str = None) -> None:
+    """プロンプト更新時に呼び出し、指定キー（省略時は全件）を破棄"""
+    if prompt_key is None:
+        _prompts.clear()
+    else:
+        _prompts.pop(prompt_key, None)
@@ -0,0 +1,270 @@
+# Structured tracing for tools
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# サンプリング率（0〜1）。エラーになった呼び出しと debug 指定の呼び出しは常に記録する
+SAMPLE_RATE = float(os.getenv("TOOL_TRACE_SAMPLE_RATE", 0.1))
+# 記録するペイロード（プロンプト・LLM応答・クエリ結果）の上限（文字数・配列の件数）
+MAX_PAYLOAD_CHARS = int(os.getenv("TOOL_TRACE_MAX_PAYLOAD_CHARS", 2000))
+MAX_PAYLOAD_ITEMS = int(os.getenv("TOOL_TRACE_MAX_PAYLOAD_ITEMS", 20))
+# 出力先（OTLP/HTTP のエンドポイントを指定するとコレクターへ、それ以外はJSON Linesファイルへ。既定はどちらも無効）
+TRACE_FILE = os.getenv("TOOL_TRACE_FILE", "")
+# ファイル出力の上限（バイト）。超える前に .1 へ退避して新しいファイルに書く（直前の1世代のみ保持、0で無制限）
+TRACE_FILE_MAX_BYTES = int(os.getenv("TOOL_TRACE_FILE_MAX_BYTES", 50 * 1024 * 1024))
+OTLP_ENDPOINT = os.getenv("TOOL_TRACE_OTLP_ENDPOINT", "")  # 例: http://localhost:4318/v1/traces
+SERVICE_NAME = os.getenv("TOOL_TRACE_SERVICE_NAME", "wealthai-crm-tools")
+# 送信待ちキューの上限（溢れた分は破棄し、ツールの応答を待たせない）
+QUEUE_SIZE = int(os.getenv("TOOL_TRACE_QUEUE_SIZE", 1000))
+BATCH_SIZE = int(os.getenv("TOOL_TRACE_BATCH_SIZE", 100))
+
+def truncate(value: Any, max_chars: int = MAX_PAYLOAD_CHARS, max_items: int = MAX_PAYLOAD_ITEMS) -> Any:
+    """記録用にペイロードを上限まで切り詰める（配列は先頭の件数、文字列は先頭の文字数）"""
+    if isinstance(value, (list, tuple)):
+        items = [truncate(item, max_chars, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"...（他 {len(value) - max_items} 件省略）")
+        return items
+    if isinstance(value, dict):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+        return value if len(text) <= max_chars else text[:max_chars] + f"...（{len(text)}文字）"
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + f"...（{len(value)}文字）"
+    return value
+
+class Span:
+    """処理段階（standardize / query / format など）ごとの計測区間"""
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._started) * 1000, 2)
+
+    @property
+    def end_ns(self) -> int:
+        return self.start_ns + int((self.duration_ms or 0) * 1_000_000)
+
+class Trace:
+    """ツール1回の呼び出しのトレース
+
+    計測（区間の時間・件数などの属性）は常に行い、ペイロードの保持は記録対象（サンプリング・
+    debug指定）の場合だけ行う。出力は finish() でキューに積むだけで、書き込みはバックグラウンドで行う
+    """
+
+    def __init__(self, tool_name: str, sampled: bool, debug: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.debug = debug
+        self.root = Span(tool_name, None, {})
+        self.spans: List[Span] = []
+        self.payloads: Dict[str, Any] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.sampled or self.debug
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """区間を計測する（例外はエラーとして記録して再送出）"""
+        span = Span(name, self.root.span_id, attributes)
+        self.spans.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end()
+
+    def set(self, **attributes: Any) -> None:
+        """呼び出し全体の属性（解決方法・件数など）"""
+        self.root.set(**attributes)
+
+    def capture(self, key: str, value: Any) -> None:
+        """ペイロードを上限付きで保持（記録対象でなければ何もしない）"""
+        if self.recording:
+            self.payloads[key] = truncate(value)
+
+    def fail(self, error: Exception) -> None:
+        self.root.error = f"{type(error).__name__}: {error}"
+
+    def timings(self) -> Dict[str, float]:
+        return {span.name: span.duration_ms for span in self.spans if span.duration_ms is not None}
+
+    def finish(self) -> None:
+        """呼び出しの終了。記録対象かエラーの場合のみ出力キューへ送る"""
+        self.root.end()
+        if self.recording or self.root.error or any(span.error for span in self.spans):
+            trace_exporter.submit(self)
+
+    def to_record(self) -> Dict[str, Any]:
+        """ファイル出力用の1行分"""
+        return {
+            "trace_id": self.trace_id,
+            "tool": self.root.name,
+            "timestamp": self.root.start_ns / 1e9,
+            "duration_ms": self.root.duration_ms,
+            "sampled": self.sampled,
+            "debug": self.debug,
+            "error": self.root.error,
+            "attributes": self.root.attributes,
+            "spans": [
+                {"name": span.name, "duration_ms": span.duration_ms, "error": span.error, **span.attributes}
+                for span in self.spans
+            ],
+            "payloads": self.payloads,
+        }
+
+def start_trace(tool_name: str, params: Any) -> Trace:
+    """トレースを開始（params に "debug": true があればサンプリングによらず記録し、debug_response も返す）"""
+    debug = isinstance(params, dict) and params.get("debug") is True
+    return Trace(tool_name, sampled=random.random() < SAMPLE_RATE, debug=debug)
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, ensure_ascii=False, default=str)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+def _otlp_span(trace: Trace, span: Span, attributes: Dict[str, Any]) -> Dict[str, Any]:
+    otlp = {
+        "traceId": trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(attributes),
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """OTLP/HTTP (JSON) の ExportTraceServiceRequest 形式に変換"""
+    spans = []
+    for trace in traces:
+        root_attributes = {**trace.root.attributes, "sampled": trace.sampled, "debug": trace.debug}
+        root_attributes.update({f"payload.{key}": value for key, value in trace.payloads.items()})
+        spans.append(_otlp_span(trace, trace.root, root_attributes))
+        spans.extend(_otlp_span(trace, span, span.attributes) for span in trace.spans)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "tools.tracing"}, "spans": spans}],
+        }]
+    }
+
+class TraceExporter:
+    """トレースの非同期出力（キューに積み、バックグラウンドタスクがまとめて書き込む）"""
+
+    def __init__(self, file_path: str = TRACE_FILE, otlp_endpoint: str = OTLP_ENDPOINT,
+                 max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._client = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.file_path or self.otlp_endpoint)
+
+    def submit(self, trace: Trace) -> None:
+        """キューに積むだけで待たない（満杯なら破棄）"""
+        if not self.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+        try:
+            self._queue.put_nowait(trace)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._export(batch)
+            except Exception as e:
+                logger.warning("Trace export failed (%d traces): %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _export(self, batch: List[Trace]) -> None:
+        if self.otlp_endpoint:
+            if self._client is None:
+                import httpx
+                self._client = httpx.AsyncClient(timeout=5.0)
+            response = await self._client.post(self.otlp_endpoint, json=to_otlp(batch))
+            response.raise_for_status()
+        else:
+            lines = "".join(json.dumps(trace.to_record(), ensure_ascii=False, default=str) + "\n" for trace in batch)
+            await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        if self.max_bytes:
+            try:
+                size = os.path.getsize(self.file_path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(lines.encode("utf-8")) > self.max_bytes:
+                os.replace(self.file_path, self.file_path + ".1")
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def close(self) -> None:
+        """サーバー終了時に呼び出し、キューに残ったトレースを書き出してから停止"""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+            self._worker.cancel()
+        self._worker = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.dropped:
+            logger.warning("Dropped %d traces (queue full)", self.dropped)
+
+# シングルトンインスタンス
+trace_exporter = TraceExporter()